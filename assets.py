@@ -0,0 +1,141 @@
+"""Fingerprinted, precompressed static assets.
+
+``flask build-assets`` copies every file of the static folder into
+``static/dist/`` under a name carrying a hash of its content
+(``custom.css`` -> ``custom.1a2b3c4d5e6f.css``), writes gzip and, when the
+``brotli`` package is installed, brotli variants of text files next to it,
+and records the names in ``static/dist/manifest.json``. Run it on deploy,
+before the workers start; they read the manifest once.
+
+Templates link assets with ``asset_url('custom.css')``. The URL changes
+whenever the file does, so ``/assets/...`` is served as immutable and
+cached for a year, in the best encoding the client accepts (``br``, then
+``gzip``, then as is) with ``Vary: Accept-Encoding``. Without a build, as
+in development, ``asset_url`` falls back to the plain static URL.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+
+from flask import abort, current_app, request, send_file, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional: brotli variants
+    brotli = None
+
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+ASSET_MAX_AGE = 365 * 24 * 3600  # the content of a fingerprinted URL never changes
+COMPRESSIBLE = {'css', 'js', 'mjs', 'map', 'svg', 'json', 'txt', 'html', 'xml'}
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]  # in order of preference at equal quality
+
+_manifests = {}  # static folder -> {name: fingerprinted name}
+_lock = threading.Lock()
+
+
+def _write(path, data):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as out:
+        out.write(data)
+    os.replace(temp_path, path)  # a worker never sees a half-written file
+
+
+def fingerprinted_name(name, data):
+    """``name`` with a hash of ``data`` before its extension."""
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    stem, dot, extension = name.rpartition('.')
+    if not dot or '/' in extension:
+        return f"{name}.{digest}"
+    return f"{stem}.{digest}.{extension}"
+
+
+def build_assets(static_folder, echo=None):
+    """Fingerprint and precompress the static files; return the manifest.
+
+    Files of earlier builds are kept, so pages rendered before a deploy can
+    still load what they link to.
+    """
+    dist = os.path.join(static_folder, BUILD_DIR)
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(static_folder):
+        dirnames[:] = sorted(d for d in dirnames
+                             if not d.startswith('.') and os.path.join(dirpath, d) != dist)
+        for filename in sorted(filenames):
+            if filename.startswith('.'):
+                continue
+            source = os.path.join(dirpath, filename)
+            name = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            hashed = fingerprinted_name(name, data)
+            target = os.path.join(dist, *hashed.split('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _write(target, data)
+            sizes = [f"{len(data)} B"]
+            if name.rsplit('.', 1)[-1].lower() in COMPRESSIBLE:
+                variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+                if brotli is not None:
+                    variants.append(('.br', brotli.compress(data, quality=11)))
+                for suffix, compressed in variants:
+                    if len(compressed) < len(data):
+                        _write(target + suffix, compressed)
+                        sizes.append(f"{suffix[1:]} {len(compressed)} B")
+            manifest[name] = hashed
+            if echo:
+                echo(f"  {name} -> {hashed} ({', '.join(sizes)})")
+    os.makedirs(dist, exist_ok=True)
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    with _lock:
+        _manifests[os.path.abspath(static_folder)] = manifest
+    return manifest
+
+
+def load_manifest(static_folder):
+    """The manifest of the last build ({} if there is none), read once per process."""
+    key = os.path.abspath(static_folder)
+    manifest = _manifests.get(key)
+    if manifest is None:
+        with _lock:
+            try:
+                with open(os.path.join(key, BUILD_DIR, MANIFEST), encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (FileNotFoundError, ValueError):
+                manifest = {}
+            _manifests[key] = manifest
+    return manifest
+
+
+def asset_url(name):
+    """Template helper: the fingerprinted URL of a static file, or its plain URL if it was not built."""
+    hashed = load_manifest(current_app.static_folder).get(name)
+    if hashed is None:
+        return url_for('static', filename=name)
+    return url_for('asset', filename=hashed)
+
+
+def send_asset(static_folder, filename):
+    """Send a built asset in the best precompressed encoding the client accepts."""
+    path = safe_join(os.path.join(static_folder, BUILD_DIR), filename)
+    if path is None or filename == MANIFEST or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    best = 0
+    for name, suffix in ENCODINGS:
+        quality = request.accept_encodings[name]
+        if quality > best and os.path.isfile(path + suffix):
+            encoding, best = name, quality
+    if encoding:
+        path += dict(ENCODINGS)[encoding]
+    response = send_file(path, mimetype=mimetype, conditional=True, max_age=ASSET_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,212 @@
+"""Content-addressed storage for uploaded material files.
+
+An upload is streamed through SHA-256 into a temporary file and then moved
+to ``<root>/ab/cd/abcd...`` named after its digest, so identical files are
+stored once however many materials rows point at them. The ``blobs`` table
+keeps a reference count per digest; a file is deleted only when the last
+materials row using it is gone.
+
+Materials stored before this scheme have no ``blob_sha256`` and are still
+read from the flat uploads folder by their ``filename`` until
+``flask import-legacy-uploads`` moves them into the store.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+BLOB_ROOT = os.environ.get('BLOB_ROOT', os.path.join('uploads', 'blobs'))
+CHUNK_SIZE = 64 * 1024
+GC_GRACE_SECONDS = 3600  # leave recent files alone: their upload may not have committed yet
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class BlobStore:
+    def __init__(self, root=BLOB_ROOT):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+
+    def path(self, sha256):
+        if not SHA256_RE.match(sha256):
+            raise ValueError(f"Not a SHA-256 digest: {sha256!r}")
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256):
+        return os.path.exists(self.path(sha256))
+
+    def write(self, stream):
+        """Copy ``stream`` to a temporary file while hashing it.
+
+        Returns (sha256, size, temp_path); pass temp_path to ``place`` once
+        the reference is recorded, or to ``discard``.
+        """
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.tmp_dir, prefix='upload-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            self.discard(temp_path)
+            raise
+        return digest.hexdigest(), size, temp_path
+
+    def place(self, temp_path, sha256):
+        """Move a written temp file to its content address (a no-op copy if already stored)."""
+        target = self.path(sha256)
+        if os.path.exists(target):
+            self.discard(temp_path)
+            return target
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(temp_path, target)
+        return target
+
+    @staticmethod
+    def discard(temp_path):
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+
+    def remove(self, sha256):
+        try:
+            os.remove(self.path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def stored_files(self):
+        """Yield (name, path, mtime) for every stored and temporary file."""
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    yield name, path, os.path.getmtime(path)
+                except FileNotFoundError:
+                    continue
+
+
+blob_store = BlobStore()
+
+
+def material_file(material, legacy_root='uploads'):
+    """Path of a materials row's file: its blob, or ``<legacy_root>/<filename>`` for rows stored before blobs."""
+    if material.get('blob_sha256'):
+        return blob_store.path(material['blob_sha256'])
+    return os.path.join(legacy_root, material['filename'])
+
+
+def add_reference(cursor, sha256, size):
+    cursor.execute('INSERT IGNORE INTO blobs (sha256, size, refcount) VALUES (%s, %s, 0)', (sha256, size))
+    cursor.execute('UPDATE blobs SET refcount = refcount + 1 WHERE sha256=%s', (sha256,))
+
+
+def add_references(cursor, blobs):
+    """``add_reference`` for many (sha256, size) pairs at once; repeated digests count once each."""
+    counts, sizes = {}, {}
+    for sha256, size in blobs:
+        counts[sha256] = counts.get(sha256, 0) + 1
+        sizes[sha256] = size
+    cursor.executemany('INSERT IGNORE INTO blobs (sha256, size, refcount) VALUES (%s, %s, 0)',
+                       list(sizes.items()))
+    cursor.executemany('UPDATE blobs SET refcount = refcount + %s WHERE sha256=%s',
+                       [(count, sha256) for sha256, count in counts.items()])
+
+
+def drop_reference(cursor, sha256):
+    """Decrement the refcount; return True if no reference is left.
+
+    The row is deleted here, the file by ``remove_unreferenced`` after the
+    caller has committed.
+    """
+    cursor.execute('UPDATE blobs SET refcount = refcount - 1 WHERE sha256=%s', (sha256,))
+    cursor.execute('SELECT refcount FROM blobs WHERE sha256=%s', (sha256,))
+    row = cursor.fetchone()
+    if row is not None and row[0] > 0:
+        return False
+    cursor.execute('DELETE FROM blobs WHERE sha256=%s', (sha256,))
+    return True
+
+
+def store_upload(cursor, stream):
+    """Store an uploaded stream and take a reference to it; return (sha256, size).
+
+    The file is in place before the caller commits the row that uses it.
+    """
+    sha256, size, temp_path = blob_store.write(stream)
+    try:
+        add_reference(cursor, sha256, size)
+    except BaseException:
+        blob_store.discard(temp_path)
+        raise
+    blob_store.place(temp_path, sha256)
+    return sha256, size
+
+
+def hash_file(path):
+    """Return (sha256, size) of a file on disk."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def store_file(cursor, path, sha256=None, size=None):
+    """Move a finished file (e.g. an assembled chunked upload) into the store.
+
+    Like ``store_upload`` but the file is moved instead of copied, so it
+    must be on the same filesystem as the store. Pass the digest and size
+    if they are already known from ``hash_file``.
+    """
+    if sha256 is None:
+        sha256, size = hash_file(path)
+    add_reference(cursor, sha256, size)
+    blob_store.place(path, sha256)
+    return sha256, size
+
+
+def remove_unreferenced(cursor, sha256):
+    """Delete a blob file after its last reference was committed away.
+
+    Checks again first: an upload of the same content may have re-created
+    the row in the meantime.
+    """
+    cursor.execute('SELECT 1 FROM blobs WHERE sha256=%s', (sha256,))
+    if cursor.fetchone() is None:
+        blob_store.remove(sha256)
+
+
+def collect_garbage(cursor, grace=GC_GRACE_SECONDS):
+    """Recount references from materials and delete what nothing uses.
+
+    Removes blobs rows without references, stored files without a row and
+    abandoned temp files older than ``grace`` seconds. Returns the number
+    of files removed; the caller commits.
+    """
+    cursor.execute(
+        'UPDATE blobs SET refcount = (SELECT COUNT(*) FROM materials m WHERE m.blob_sha256 = blobs.sha256)'
+    )
+    cursor.execute('DELETE FROM blobs WHERE refcount <= 0')
+    cursor.execute('SELECT sha256 FROM blobs')
+    referenced = {row[0] for row in cursor.fetchall()}
+    cutoff = time.time() - grace
+    removed = 0
+    for name, path, mtime in list(blob_store.stored_files()):
+        if mtime < cutoff and name not in referenced:
+            os.remove(path)
+            removed += 1
+    return removed
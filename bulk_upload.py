@@ -0,0 +1,234 @@
+"""Bulk material uploads: many files at once, or a ZIP of a folder tree.
+
+A bulk upload is planned, written and committed in three steps:
+
+- ``plan_files`` (several ``file`` parts for one subject) or ``plan_archive``
+  (one ZIP whose ``Department/Semester/Subject/`` folders pick each file's
+  subject) list the files with their subject, rejecting what cannot be
+  stored: unknown folders, disallowed types, files over the role's limit;
+- ``write_items`` hashes each file into a blob temp file in a thread pool,
+  checking its leading bytes like a single upload;
+- the caller inserts every materials row in one transaction
+  (``save_materials`` in college_app) and places the blobs; on any
+  failure it rolls back and ``discard_items`` removes what was written.
+
+By default a batch is all or nothing: one rejected file means no file is
+stored, and the report says which file was at fault. Each item reports
+its own status, so the caller can show a per-file table.
+"""
+import os
+import re
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from blob_store import blob_store
+from curriculum import course_code
+from upload_limits import (ALLOWED_EXTENSIONS, BULK_MAX_UNPACKED, MB, SNIFF_BYTES, file_extension, matches_type,
+                           upload_limit)
+
+BULK_WORKERS = int(os.environ.get('BULK_UPLOAD_WORKERS', 4))
+BULK_MAX_FILES = int(os.environ.get('BULK_UPLOAD_MAX_FILES', 500))
+
+IGNORED_ENTRY_RE = re.compile(r'(^|/)(__MACOSX/|\.|Thumbs\.db$|desktop\.ini$)', re.I)
+
+
+class BulkItem:
+    """One file of a bulk upload and what became of it."""
+
+    def __init__(self, name, subject_id=None, error=None, opener=None, size=None, role=None):
+        self.name = name                    # as given, e.g. "CSE/Semester I/Physics/unit1.pdf"
+        self.filename = name.rsplit('/', 1)[-1]
+        self.subject_id = subject_id
+        self.error = error
+        self.opener = opener                # returns a binary stream of the content
+        self.size = size
+        self.role = role
+        self.uploader_id = None
+        self.sha256 = None
+        self.temp_path = None
+        self.material_id = None
+        self.status = 'rejected' if error else 'pending'
+
+    def reject(self, error):
+        self.error = error
+        self.status = 'rejected'
+
+    def report(self):
+        entry = {'file': self.name, 'status': self.status, 'subject_id': self.subject_id}
+        if self.material_id is not None:
+            entry['material_id'] = self.material_id
+        if self.error:
+            entry['error'] = self.error
+        return entry
+
+
+def _folder_key(name):
+    return ' '.join(name.replace('_', ' ').lower().split())
+
+
+def _find(items, folder, codes=False):
+    key = _folder_key(folder)
+    for item in items:
+        if _folder_key(item['name']) == key or (codes and (course_code(item['name']) or '').lower() == key):
+            return item
+    return None
+
+
+def resolve_subject(cat, folders, department_id=None, semester_id=None, subject_id=None):
+    """Subject id for a file under ``folders`` (below the given department/semester/subject), or raise ValueError."""
+    given = [department_id, semester_id, subject_id]
+    expected = 3 - sum(1 for level in given if level is not None)
+    if len(folders) != expected:
+        levels = ['department', 'semester', 'subject'][3 - expected:]
+        raise ValueError(f"expected {'/'.join(levels) or 'no'} folders, found {'/'.join(folders) or 'none'}")
+    if subject_id is not None:
+        return subject_id
+    folders = list(folders)
+    if semester_id is None:
+        if department_id is None:
+            department = _find(cat.departments, folders.pop(0))
+            if department is None:
+                raise ValueError('unknown department folder')
+            department_id = department['id']
+        semester = _find(cat.semesters_of(department_id), folders.pop(0))
+        if semester is None:
+            raise ValueError('unknown semester folder')
+        semester_id = semester['id']
+    subject = _find(cat.subjects_of(semester_id), folders.pop(0), codes=True)
+    if subject is None:
+        raise ValueError('unknown subject folder (use its name or course code)')
+    return subject['id']
+
+
+def _check_type_and_size(item, extension, size):
+    if extension not in ALLOWED_EXTENSIONS:
+        item.reject(f"files of type .{extension or '?'} are not accepted")
+    elif size is not None and size > upload_limit(item.role, extension):
+        item.reject(f"exceeds the {upload_limit(item.role, extension) // MB} MB limit for .{extension} files")
+
+
+def plan_files(files, subject_id, role=None):
+    """Items for uploaded ``file`` parts that all go to ``subject_id``.
+
+    Type and size were already enforced while the request streamed in.
+    """
+    items = []
+    for storage in files:
+        item = BulkItem(storage.filename or '', subject_id, role=role)
+        if not storage.filename:
+            item.reject('no file name')
+        else:
+            item.opener = lambda storage=storage: storage.stream
+            _check_type_and_size(item, file_extension(storage.filename), None)
+        items.append(item)
+    return items
+
+
+def plan_archive(archive, cat, role=None, department_id=None, semester_id=None, subject_id=None):
+    """Items for the files of an open ZipFile, each mapped to a subject by its folders.
+
+    Files sit in ``Department/Semester/Subject/``, or in fewer folders when
+    a department, semester or subject is given. Folder names match the catalog
+    ignoring case, underscores and extra spaces; subjects also match their
+    course code. Raises ValueError if the archive as a whole is unacceptable.
+    """
+    entries = [info for info in archive.infolist()
+               if not info.is_dir() and not IGNORED_ENTRY_RE.search(info.filename)]
+    if not entries:
+        raise ValueError('The archive contains no files')
+    if len(entries) > BULK_MAX_FILES:
+        raise ValueError(f"The archive contains {len(entries)} files; at most {BULK_MAX_FILES} per upload")
+    if sum(info.file_size for info in entries) > BULK_MAX_UNPACKED:
+        raise ValueError(f"The archive expands to more than {BULK_MAX_UNPACKED // MB} MB")
+
+    items = []
+    for info in entries:
+        name = info.filename.replace('\\', '/').strip('/')
+        item = BulkItem(name, size=info.file_size, role=role,
+                        opener=lambda info=info: archive.open(info))
+        try:
+            item.subject_id = resolve_subject(cat, name.split('/')[:-1], department_id, semester_id,
+                                              subject_id)
+        except ValueError as e:
+            item.reject(str(e))
+            items.append(item)
+            continue
+        if info.flag_bits & 0x1:
+            item.reject('encrypted archive entries are not supported')
+        else:
+            _check_type_and_size(item, file_extension(item.filename), info.file_size)
+        items.append(item)
+    return items
+
+
+class _Rewound:
+    """The sniffed head followed by the rest of a stream that cannot seek back."""
+
+    def __init__(self, head, rest):
+        self._head = head
+        self._rest = rest
+
+    def read(self, size=-1):
+        if not self._head:
+            return self._rest.read(size)
+        if size < 0:
+            data, self._head = self._head + self._rest.read(), b''
+        else:
+            data, self._head = self._head[:size], self._head[size:]
+        return data
+
+
+def _write_item(item):
+    stream = None
+    try:
+        stream = item.opener()
+        head = stream.read(SNIFF_BYTES)
+        extension = file_extension(item.filename)
+        if not head:
+            item.reject('the file is empty')
+            return item
+        if not matches_type(extension, head):
+            item.reject(f"does not look like a .{extension} file")
+            return item
+        item.sha256, item.size, item.temp_path = blob_store.write(_Rewound(head, stream))
+        item.status = 'written'
+    except (zipfile.BadZipFile, zlib.error, NotImplementedError, OSError, EOFError) as e:  # damaged entry
+        item.reject(f"could not be read: {e}")
+    finally:
+        if isinstance(stream, zipfile.ZipExtFile):
+            stream.close()  # request file streams are closed by Werkzeug
+    return item
+
+
+def write_items(items, workers=BULK_WORKERS):
+    """Hash and spool every acceptable item into blob temp files, ``workers`` at a time."""
+    pending = [item for item in items if item.status == 'pending']
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        list(executor.map(_write_item, pending))
+    return items
+
+
+def discard_items(items, status=None, error=None):
+    """Remove the temp files of items that will not be stored, optionally marking them."""
+    for item in items:
+        if item.temp_path:
+            blob_store.discard(item.temp_path)
+            item.temp_path = None
+        if status and item.status != 'rejected':
+            item.status, item.error = status, error
+
+
+def is_bulk(files):
+    """True if an upload form carries an ``archive`` or more than one ``file``."""
+    archive = files.get('archive')
+    return bool(archive and archive.filename) or sum(1 for f in files.getlist('file') if f.filename) > 1
+
+
+def summary(items, committed):
+    return {
+        'committed': committed,
+        'uploaded': sum(1 for item in items if item.status == 'uploaded'),
+        'rejected': sum(1 for item in items if item.status == 'rejected'),
+        'files': [item.report() for item in items],
+    }
@@ -0,0 +1,123 @@
+"""In-process cache of the department -> semester -> subject catalog.
+
+The catalog is reference data that changes a few times a year, so it is
+loaded with three queries and then served from memory. Lookups by id and by
+parent are plain dict lookups. Code that changes the catalog must call
+``catalog.invalidate()``; other worker processes pick the change up once
+CATALOG_TTL expires.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from database_config import get_db
+
+CATALOG_TTL = float(os.environ.get('CATALOG_TTL', 300))  # seconds
+
+
+class Catalog:
+    """An immutable snapshot of the catalog tables."""
+
+    def __init__(self, departments, semesters, subjects):
+        self.departments = departments
+        self.departments_by_id = {d['id']: d for d in departments}
+        self.semesters_by_id = {s['id']: s for s in semesters}
+        self.subjects_by_id = {s['id']: s for s in subjects}
+
+        self.semesters_by_department = {d['id']: [] for d in departments}
+        for sem in semesters:
+            self.semesters_by_department.setdefault(sem['department_id'], []).append(sem)
+
+        self.subjects_by_semester = {s['id']: [] for s in semesters}
+        for subj in subjects:
+            self.subjects_by_semester.setdefault(subj['semester_id'], []).append(subj)
+
+        digest = hashlib.sha1(json.dumps(
+            [departments, semesters, subjects], sort_keys=True, default=str
+        ).encode('utf-8'))
+        self.version = digest.hexdigest()[:16]
+        self._tree = None
+
+    def department(self, department_id):
+        return self.departments_by_id.get(department_id)
+
+    def semester(self, semester_id):
+        return self.semesters_by_id.get(semester_id)
+
+    def subject(self, subject_id):
+        return self.subjects_by_id.get(subject_id)
+
+    def semesters_of(self, department_id):
+        return self.semesters_by_department.get(department_id, [])
+
+    def subjects_of(self, semester_id):
+        return self.subjects_by_semester.get(semester_id, [])
+
+    def tree(self):
+        """The whole catalog as nested departments/semesters/subjects (built once per snapshot)."""
+        if self._tree is None:
+            self._tree = [
+                {
+                    'id': dept['id'],
+                    'name': dept['name'],
+                    'semesters': [
+                        {
+                            'id': sem['id'],
+                            'name': sem['name'],
+                            'subjects': [{'id': subj['id'], 'name': subj['name']}
+                                         for subj in self.subjects_of(sem['id'])],
+                        }
+                        for sem in self.semesters_of(dept['id'])
+                    ],
+                }
+                for dept in self.departments
+            ]
+        return self._tree
+
+
+class CatalogCache:
+    def __init__(self, ttl=CATALOG_TTL):
+        self.ttl = ttl
+        self._catalog = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, conn=None):
+        """Return the current catalog, loading it on first use or after expiry."""
+        catalog = self._catalog
+        if catalog is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return catalog
+        with self._lock:
+            if self._catalog is None or time.monotonic() - self._loaded_at >= self.ttl:
+                self._catalog = self._load(conn or get_db())
+                self._loaded_at = time.monotonic()
+            return self._catalog
+
+    def invalidate(self):
+        """Drop the cached catalog; the next ``get()`` reloads it."""
+        with self._lock:
+            self._catalog = None
+
+    def refresh(self, conn):
+        """Reload the catalog right away, e.g. after seeding."""
+        with self._lock:
+            self._catalog = self._load(conn)
+            self._loaded_at = time.monotonic()
+            return self._catalog
+
+    @staticmethod
+    def _load(conn):
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute('SELECT id, name FROM departments ORDER BY id')
+        departments = cursor.fetchall()
+        cursor.execute('SELECT id, name, department_id FROM semesters ORDER BY id')
+        semesters = cursor.fetchall()
+        cursor.execute('SELECT id, name, semester_id FROM subjects ORDER BY id')
+        subjects = cursor.fetchall()
+        cursor.close()
+        return Catalog(departments, semesters, subjects)
+
+
+catalog = CatalogCache()
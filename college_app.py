@@ -1,39 +1,102 @@
 import os
-import mysql.connector
-from flask import Flask, render_template, request, redirect, send_from_directory, flash, url_for, jsonify, abort
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+import click
+from flask import Flask, render_template, request, redirect, flash, url_for, jsonify, abort, send_file
 from flask_httpauth import HTTPBasicAuth
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.security import generate_password_hash
 from werkzeug.utils import secure_filename
 from flask_cors import CORS
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user, UserMixin
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from cryptography.fernet import Fernet
 import base64
 import os
+from database_config import DB_ERRORS, backend, get_db, init_app as init_db_pool, pool, record_queries
+from catalog import catalog
+from qa_threads import MAX_THREAD_DEPTH, assign_thread_path, build_threads, fetch_replies, threads_by_material
+from pagination import encode_cursor, page_size, paginate
+from indexes import find_full_scans, seed_benchmark_data
+from curriculum import load_curriculum, sync_curriculum
+from blob_store import (GC_GRACE_SECONDS, add_reference, add_references, blob_store, collect_garbage, drop_reference,
+                        hash_file, material_file, remove_unreferenced, store_file, store_upload)
+from downloads import send_stored_file, send_zip
+from bulk_upload import discard_items, is_bulk, plan_archive, plan_files, summary, write_items
+from upload_limits import (ALLOWED_EXTENSIONS, GuardedRequest, accepts_bulk, accepts_spreadsheets, file_extension,
+                           upload_limit)
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+import resumable_uploads
+from resumable_uploads import UploadError
+from migrations import LATEST_VERSION, migrate, pending_migrations, schema_version
+from jobs import JOB_WORKERS, queue_counts, start_workers, work
+from search import (SEARCH_KEYS, SEARCH_WORKERS, index_material, index_materials, query_terms, rebuild_index,
+                    reindex_subject, search_sql, unindex_material)
+from qa_search import THREAD_SEARCH_KEYS, highlight, index_message, search_threads_sql, unindex_material_messages
+from passwords import PASSWORD_HASH_METHOD, HashingBusy, check_password, configure_pool, hash_password
+from user_cache import fetch_user_record, forget_user, parse_session_token, session_token, user_cache
+from data_versions import bump_versions, record_change, versions
+from page_cache import cache_fragment, cached_page
+from http_cache import API_CATALOG_MAX_AGE, PublicSessionInterface, validated
+from assets import asset_url, build_assets, send_asset
+from user_import import USER_IMPORT_WORKERS, create_import, department_names, import_status, run_import
+from previews import (collect_preview_garbage, queue_missing_previews, queue_preview, queue_previews, remove_preview,
+                      thumbnail_mime_type, thumbnail_path)
 
 UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'pdf', 'docx', 'pptx', 'zip', 'txt', 'jpg', 'png'}
-MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB limit
 
 app = Flask(__name__)
+app.request_class = GuardedRequest  # upload size/type limits enforced while the body streams in
+app.session_interface = PublicSessionInterface()  # no Vary: Cookie on public API responses
 CORS(app)
 app.secret_key = os.environ.get('FLASK_SECRET', 'dev_secret_key_change_in_production')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+init_db_pool(app)
+
+@app.before_request
+def start_job_workers():
+    # started on the first request, so CLI commands and pre-fork masters never run jobs
+    start_workers(JOB_WORKERS)
+
+
+app.jinja_env.globals['cache_fragment'] = cache_fragment
+app.jinja_env.globals['asset_url'] = asset_url  # use instead of url_for('static', ...)
+
+
+@app.context_processor
+def inject_fragment_flag():
+    # ?fragment=1 renders only a page's content block (used by "Load more")
+    return {'fragment': request.args.get('fragment') == '1'}
+
+# Sort keys for paginated listings: (SQL expression, row field), unique last
+EVENT_KEYS = [('e.event_date', 'event_date'), ('e.created_at', 'created_at'), ('e.id', 'id')]
+QUESTION_KEYS = [('m.created_at', 'created_at'), ('m.id', 'msg_id')]
+ID_KEYS = [('id', 'id')]
+MATERIAL_KEYS = [('m.id', 'id')]
 
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
 class User(UserMixin):
-    def __init__(self, id, email, password_hash, role, name, user_key=None):
+    def __init__(self, id, email, password_hash, role, name, user_key=None, session_version=0):
         self.id = id
         self.email = email
         self.password_hash = password_hash
         self.role = role
         self.name = name
         self.user_key = user_key
-    
+        self.session_version = session_version or 0
+
+    def get_id(self):
+        # the session remembers the version it was issued for; revoke_sessions bumps it
+        return session_token(self.id, self.session_version)
+
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return check_password(self.password_hash, password)[0]
 
 def load_user_from_row(row):
     """Load user from database row, handling both dict and tuple formats"""
@@ -48,7 +111,8 @@ def load_user_from_row(row):
             row.get('password_hash'),
             row.get('role'),
             row.get('name'),
-            row.get('user_key')
+            row.get('user_key'),
+            row.get('session_version')
         )
     else:
         # Handle tuple/list format
@@ -63,15 +127,23 @@ def load_user_from_row(row):
 
 @login_manager.user_loader
 def load_user(user_id):
-    conn = get_db_connection()
-    if conn:
+    """User for a session, from the per-process cache; the database is read only on a miss."""
+    key = parse_session_token(user_id)
+    if key is None:
+        return None
+    user_cache.check(get_db)
+    record = user_cache.get(key)
+    if record is None:
+        conn = get_db()
+        if not conn:
+            return None
         cursor = conn.cursor(dictionary=True)
-        cursor.execute('SELECT * FROM users WHERE id=%s', (user_id,))
-        row = cursor.fetchone()
+        record = fetch_user_record(cursor, key[0])
         cursor.close()
-        conn.close()
-        return load_user_from_row(row) if row else None
-    return None
+        if record is None or (record['session_version'] or 0) != key[1]:
+            return None  # deleted, or its sessions were revoked
+        user_cache.put(key, record)
+    return User(record['id'], record['email'], None, record['role'], record['name'], session_version=key[1])
 
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
@@ -79,581 +151,257 @@ if not os.path.exists(UPLOAD_FOLDER):
 # --- AUTH SETUP ---
 auth = HTTPBasicAuth()
 users = {
-    "sakthi": generate_password_hash("sakthi")
+    "sakthi": generate_password_hash("sakthi", PASSWORD_HASH_METHOD)
 }
 @auth.verify_password
 def verify_password(username, password):
-    if username in users and check_password_hash(users.get(username), password):
+    if username in users and check_password(users.get(username), password)[0]:
         return username
 
-def get_db():
-    """Get MySQL database connection to college_db"""
-    try:
-        conn = mysql.connector.connect(
-            host='localhost',
-            user='root',
-            password='2005',
-            database='college_db',
-            auth_plugin='caching_sha2_password'
-        )
-        return conn
-    except mysql.connector.Error as e:
-        print(f"Error connecting to college_db: {e}")
-        return None
+def init_db():
+    """Check at boot that the database schema is current.
 
-def create_database():
-    """Create the college_db database if it doesn't exist"""
-    conn = get_db()
-    if not conn:
-        print("Failed to connect to MySQL server")
-        return False
-    
+    Workers never run DDL: migrations are applied ahead of a deploy with
+    ``flask db-upgrade`` (see migrations.py). The curriculum sync is a single
+    hash lookup unless curriculum.json changed.
+    """
     try:
-        cursor = conn.cursor()
-        cursor.execute("CREATE DATABASE IF NOT EXISTS college_db")
-        cursor.close()
-        conn.close()
-        return True
-    except mysql.connector.Error as e:
-        print(f"Error creating database: {e}")
+        with pool.connection() as conn:
+            version = schema_version(conn)
+            if version < LATEST_VERSION:
+                print(f"college_db schema is at version {version}, expected {LATEST_VERSION}; "
+                      f"run 'flask --app college_app db-upgrade'")
+                return False
+            sync_catalog(conn)
+            catalog.refresh(conn)
+            return True
+    except DB_ERRORS as e:
+        print(f"Failed to connect to college_db database: {e}")
         return False
 
-def get_db_connection():
-    """Get connection to college_db database"""
-    try:
-        conn = mysql.connector.connect(
-            host='localhost',
-            user='root',
-            password='2005',
-            database='college_db',
-            auth_plugin='caching_sha2_password'
-        )
-        return conn
-    except mysql.connector.Error as e:
-        print(f"Error connecting to college_db: {e}")
+
+def upgrade_db(target=LATEST_VERSION):
+    """Create the database if needed, apply pending migrations and seed reference data.
+
+    Returns the migration versions applied, or None if the database could not be created.
+    """
+    if not backend.create_database():
         return None
+    with pool.connection() as conn:
+        applied = migrate(conn, target)
+        if target >= LATEST_VERSION:
+            sync_catalog(conn)
+            _create_sample_users(conn)
+            catalog.refresh(conn)
+    return applied
+
+
+def sync_catalog(conn):
+    """Apply curriculum.json to the catalog tables if it changed since the last sync."""
+    changes = sync_curriculum(conn)
+    if changes is not None:
+        print(f"Curriculum synced: {changes.summary()}")
+        record_change(conn, 'catalog')
+        if changes.renamed:
+            cursor = conn.cursor()
+            for subject_id, _, _ in changes.renamed:
+                reindex_subject(cursor, subject_id)
+            conn.commit()
+            cursor.close()
+    return changes
 
-def init_db():
-    # First create the database
-    if not create_database():
-        return
-    
-    # Then connect to the specific database
-    conn = get_db_connection()
-    if not conn:
-        print("Failed to connect to college_db database")
-        return
-    
-    cursor = conn.cursor()
-    
-    # Create tables with MySQL syntax - ORDER MATTERS!
-    # First create users table since other tables reference it
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            email VARCHAR(255) UNIQUE NOT NULL,
-            password_hash VARCHAR(255) NOT NULL,
-            role VARCHAR(50) NOT NULL CHECK(role IN ('admin','faculty','student')),
-            name VARCHAR(255)
-        );
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS departments (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(255) UNIQUE
-        );
-    ''')
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS semesters (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(255),
-            department_id INT,
-            UNIQUE(name, department_id),
-            FOREIGN KEY(department_id) REFERENCES departments(id)
-        );
-    ''')
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS subjects (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(255),
-            semester_id INT,
-            UNIQUE(name, semester_id),
-            FOREIGN KEY(semester_id) REFERENCES semesters(id)
-        );
-    ''')
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS materials (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            subject_id INT,
-            filename VARCHAR(255),
-            original_filename VARCHAR(255),
-            uploader_id INT,
-            FOREIGN KEY(subject_id) REFERENCES subjects(id),
-            FOREIGN KEY(uploader_id) REFERENCES users(id)
-        );
-    ''')
 
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS events (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        department_id INT,
-        title VARCHAR(255) NOT NULL,
-        content TEXT NOT NULL,
-        author VARCHAR(255),
-        event_date DATE,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        image_url TEXT,
-        FOREIGN KEY (department_id) REFERENCES departments(id)
-    );
-    ''')
+def save_material(conn, file, subject_id, uploader_id=None):
+    """Store an uploaded file (deduplicated by content) and insert its materials row.
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS department_achievements (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            department_id INT NOT NULL,
-            title VARCHAR(255) NOT NULL,
-            description TEXT,
-            image_url TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(department_id) REFERENCES departments(id)
-        );
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            material_id INT NOT NULL,
-            sender_id INT NOT NULL,
-            receiver_id INT NOT NULL,
-            encrypted_message TEXT NOT NULL,
-            reply_to INT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(material_id) REFERENCES materials(id) ON DELETE CASCADE,
-            FOREIGN KEY(sender_id) REFERENCES users(id) ON DELETE CASCADE,
-            FOREIGN KEY(receiver_id) REFERENCES users(id) ON DELETE CASCADE,
-            FOREIGN KEY(reply_to) REFERENCES messages(id) ON DELETE CASCADE
-        );
-    ''')
+    ``filename`` stays the public name used in /uploads/ links; the bytes
+    live in the blob store under their SHA-256. The caller commits, which
+    also releases the preview job, then calls ``versions.expire()``.
+    """
+    cursor = conn.cursor()
+    sha256, _ = store_upload(cursor, file.stream)
+    material_id = insert_material(cursor, subject_id, file.filename, sha256, uploader_id)
+    bump_versions(cursor, 'materials')
+    queue_preview(cursor, sha256, file.filename)
+    index_material(cursor, material_id)
+    cursor.close()
+    return material_id
 
-    # === Populate Departments, Semesters, and Subjects ===
-    departments = [
-        ('CSE',), ('EEE',), ('MECH',), ('ECE',), ('CIVIL',), ('AIDS',), ('IT',)
-    ]
-    
-    # Use INSERT IGNORE for MySQL
-    insert_dept_query = "INSERT IGNORE INTO departments (name) VALUES (%s)"
-    cursor.executemany(insert_dept_query, departments)
-
-    # Example structure for CSE. You can expand for other departments.
-    SEMESTER_STRUCTURE = {
-         "CSE": {
-            "Semester I": [
-                "Professional English",
-                "Matrices and Calculus",
-                "Engineering Physics",
-                "CY3151 Engineering Chemistry",
-                "GE3151 Problem Solving and Python Programming",
-                "GE3152 தமிழர்மரபு / Heritage of Tamils"
-            ],
-            "Semester II": [
-                "HS3252 Professional English II",
-                "MA3251 Statistics and Numerical Methods",
-                "PH3256 Physics for Information Science",
-                "BE3251 Basic Electrical and Electronics Engineering",
-                "GE3251 Engineering Graphics",
-                "CS3251 Programming in C",
-                "GE3252 தமிழரும் தொழில்நுட்பமும் / Tamils and Technology"
-            ],
-            "Semester III": [
-                "MA3354 Discrete Mathematics",
-                "CS3351 Digital Principles and Computer Organization",
-                "CS3352 Foundations of Data Science",
-                "CS3301 Data Structures",
-                "CS3391 Object Oriented Programming"
-            ],
-            "Semester IV": [
-                "CS3452 Theory of Computation",
-                "CS3491 Artificial Intelligence and Machine Learning",
-                "CS3492 Database Management Systems",
-                "CS3401 Algorithms",
-                "CS3451 Introduction to Operating Systems",
-                "GE3451 Environmental Sciences and Sustainability"
-            ],
-            "Semester V": [
-                "CS3591 Computer Networks",
-                "CS3501 Compiler Design",
-                "CB3491 Cryptography and Cyber Security"
-            ],
-            "Semester VI": [
-                "CCS356 Object Oriented Software Engineering",
-                "CCS356 Object Oriented Software Engineering",
-                "CS3691 Embedded Systems and IoT"
-            ],
-            "Semester VII": [
-                "GE3791 Human Values and Ethics"
-            ]
-        },
-        "EEE": {
-            "Semester I": [
-                "HS3152 Professional English - I",
-                "MA3151 Matrices and Calculus",
-                "PH3151 Engineering Physics",
-                "CY3151 Engineering Chemistry",
-                "GE3151 Problem Solving and Python Programming",
-                "GE3152 த௘ழர்மர௖ / Heritage of Tamils"
-            ],
-            "Semester II": [
-                "HS3252 Professional English - II",
-                "MA3251 Statistics and Numerical Methods",
-                "PH3202 Physics for Electrical Engineering",
-                "BE3255 Basic Civil and Mechanical Engineering",
-                "GE3251 Engineering Graphics",
-                "EE3251 Electric Circuit Analysis",
-                "GE3252 தமிழரும் தொழில்நுட்பமும் / Tamils and Technology"
-            ],
-            "Semester III": [
-                "MA3303 Probability and Complex Functions",
-                "EE3301 Electromagnetic Fields",
-                "EE3302 Digital Logic Circuits",
-                "EC3301 Electron Devices and Circuits",
-                "EE3303 Electrical Machines - I",
-                "CS3353 C Programming and Data Structures"
-            ],
-            "Semester IV": [
-                "GE3451 Environmental Sciences and Sustainability",
-                "EE3401 Transmission and Distribution",
-                "EE3402 Linear Integrated Circuits",
-                "EE3403 Measurements and Instrumentation",
-                "EE3404 Microprocessor and Microcontroller",
-                "EE3405 Electrical Machines - II"
-            ],
-            "Semester V": [
-                "EE3501 Power System Analysis",
-                "EE3591 Power Electronics",
-                "EE3503 Control Systems"
-            ],
-            "Semester VI": [
-                "EE3601 Protection and Switchgear",
-                "EE3602 Power System Operation and Control"
-            ],
-            "Semester VII": [
-                "EE3701 High Voltage Engineering",
-                "GE3791 Human Values and Ethics"
-            ]
-        },
-        "MECH": {
-            "Semester I": [
-                "HS3152 Professional English - I",
-                "MA3151 Matrices and Calculus",
-                "PH3151 Engineering Physics",
-                "CY3151 Engineering Chemistry",
-                "GE3151 Problem Solving and Python Programming",
-                "GE3152 தமிழர்மரபு/Heritage of Tamils"
-            ],
-            "Semester II": [
-                "HS3252 Professional English - II",
-                "MA3251 Statistics and Numerical Methods",
-                "PH3251 Materials Science",
-                "BE3251 Basic Electrical and Electronics Engineering",
-                "GE3251 Engineering Graphics",
-                "GE3252 தமிழரும் ததொழில்நுட்பமும் / Tamils and Technology"
-            ],
-            "Semester III": [
-                "MA3351 Transforms and Partial Differential Equations",
-                "ME3351 Engineering Mechanics",
-                "ME3391 Engineering Thermodynamics",
-                "CE3391 Fluid Mechanics and Machinery",
-                "ME3392 Engineering Materials and Metallurgy",
-                "ME3393 Manufacturing Processes"
-            ],
-            "Semester IV": [
-                "ME3491 Theory of Machines",
-                "ME3451 Thermal Engineering",
-                "ME3492 Hydraulics and Pneumatics",
-                "ME3493 Manufacturing Technology",
-                "CE3491 Strength of Materials",
-                "GE3451 Environmental Sciences and Sustainability"
-            ],
-            "Semester V": [
-                "ME3591 Design of Machine Elements",
-                "ME3592 Metrology and Measurements"
-            ],
-            "Semester VI": [
-                "ME3691 Heat and Mass Transfer"
-            ],
-            "Semester VII": [
-                "ME3791 Mechatronics and IoT",
-                "ME3792 Computer Integrated Manufacturing",
-                "GE3791 Human Values and Ethics",
-                "GE3792 Industrial Management"
-            ]
-        },
-        "ECE": {
-            "Semester I": [
-                "HS3152 Professional English - I",
-                "MA3151 Matrices and Calculus",
-                "PH3151 Engineering Physics",
-                "CY3151 Engineering Chemistry",
-                "GE3151 Problem Solving and Python Programming",
-                "GE3152 தமிழர்மரபு /Heritage of Tamils"
-            ],
-            "Semester II": [
-                "HS3252 Professional English - II",
-                "MA3251 Statistics and Numerical Methods",
-                "PH3254 Physics for Electronics Engineering",
-                "BE3254 Electrical and Instrumentation Engineering",
-                "GE3251 Engineering Graphics",
-                "EC3251 Circuit Analysis",
-                "GE3252 தமிழரும் தொழில்நுட்பமும் /Tamils and Technology"
-            ],
-            "Semester III": [
-                "MA3355 Random Processes and Linear Algebra",
-                "CS3353 C Programming and Data Structures",
-                "EC3354 Signals and Systems",
-                "EC3353 Electronic Devices and Circuits",
-                "EC3351 Control Systems",
-                "EC3352 Digital Systems Design"
-            ],
-            "Semester IV": [
-                "EC3452 Electromagnetic Fields",
-                "EC3401 Networks and Security",
-                "EC3451 Linear Integrated Circuits",
-                "EC3492 Digital Signal Processing",
-                "EC3491 Communication Systems",
-                "GE3451 Environmental Sciences and Sustainability"
-            ],
-            "Semester V": [
-                "EC3501 Wireless Communication",
-                "EC3552 VLSI and Chip Design",
-                "EC3551 Transmission lines and RF Systems"
-            ],
-            "Semester VI": [
-                "ET3491 Embedded Systems and IOT Design",
-                "CS3491 Artificial Intelligence and Machine Learning"
-            ],
-            "Semester VII": [
-                "GE3791 Human Values and Ethics"
-            ]
-        },
-        "CIVIL": {
-            "Semester I": [
-                "HS3152 Professional English - I",
-                "MA3151 Matrices and Calculus",
-                "PH3151 Engineering Physics",
-                "CY3151 Engineering Chemistry",
-                "GE3151 Problem Solving and Python Programming",
-                "GE3152 தமிழர்மரபு / Heritage of Tamils"
-            ],
-            "Semester II": [
-                "HS3252 Professional English - II",
-                "MA3251 Statistics and Numerical Methods",
-                "PH3201 Physics for Civil Engineering",
-                "BE3252 Basic Electrical, Electronics and Instrumentation Engineering",
-                "GE3251 Engineering Graphics",
-                "GE3252 தமிழரும் தொழில்நுட்பமும் / Tamils and Technology"
-            ],
-            "Semester III": [
-                "MA3351 Transforms and Partial Differential Equations",
-                "ME3351 Engineering Mechanics",
-                "CE3301 Fluid Mechanics",
-                "CE3302 Construction Materials and Technology",
-                "CE3303 Water Supply and Wastewater Engineering",
-                "CE3351 Surveying and Levelling"
-            ],
-            "Semester IV": [
-                "CE3401 Applied Hydraulics Engineering",
-                "CE3402 Strength of Materials",
-                "CE3403 Concrete Technology",
-                "CE3404 Soil Mechanics",
-                "CE3405 Highway and Railway Engineering",
-                "GE3451 Environmental Sciences and Sustainability"
-            ],
-            "Semester V": [
-                "CE3501 Design of Reinforced Concrete Structural Elements",
-                "CE3502 Structural Analysis I",
-                "CE3503 Foundation Engineering"
-            ],
-            "Semester VI": [
-                "CE3601 Design of Steel Structural Elements",
-                "CE3602 Structural Analysis II",
-                "AG3601 Engineering Geology"
-            ],
-            "Semester VII": [
-                "CE3701 Estimation, Costing and Valuation Engineering",
-                "AI3404 Hydrology and Water Resources Engineering",
-                "GE3791 Human Values and Ethics",
-                "GE3752 Total Quality Management"
-            ]
-        },
-        "AIDS": {
-            "Semester I": [
-                "HS3152 Professional English - I",
-                "MA3151 Matrices and Calculus",
-                "PH3151 Engineering Physics",
-                "CY3151 Engineering Chemistry",
-                "GE3151 Problem Solving and Python Programming",
-                "GE3152 தமிழர்மரபு /Heritage of Tamils"
-            ],
-            "Semester II": [
-                "HS3252 Professional English - II",
-                "MA3251 Statistics and Numerical Methods",
-                "PH3256 Physics for Information Science",
-                "BE3251 Basic Electrical and Electronics Engineering",
-                "GE3251 Engineering Graphics",
-                "AD3251 Data Structures Design",
-                "GE3252 தமிழரும் தொழில்நுட்பமும் /Tamils and Technology"
-            ],
-            "Semester III": [
-                "MA3354 Discrete Mathematics",
-                "CS3351 Digital Principles and Computer Organization",
-                "AD3391 Database Design and Management",
-                "AD3351 Design and Analysis of Algorithms",
-                "AD3301 Data Exploration and Visualization",
-                "AL3391 Artificial Intelligence"
-            ],
-            "Semester IV": [
-                "MA3391 Probability and Statistics",
-                "AL3452 Operating Systems",
-                "AL3451 Machine Learning",
-                "AD3491 Fundamentals of Data Science and Analytics",
-                "CS3591 Computer Networks",
-                "GE3451 Environmental Sciences and Sustainability"
-            ],
-            "Semester V": [
-                "AD3501 Deep Learning",
-                "CW3551 Data and Information Security",
-                "CS3551 Distributed Computing P",
-                "CCS334 Big Data Analytics"
-            ],
-            "Semester VI": [
-                "CS3691 Embedded Systems and IoT"
-            ],
-            "Semester VII": [
-                "GE3791 Human Values and Ethics"
-            ]
-        },
-        "IT": {
-            "Semester I": [
-                "HS3152 Professional English - I",
-                "MA3151 Matrices and Calculus",
-                "PH3151 Engineering Physics",
-                "CY3151 Engineering Chemistry",
-                "GE3151 Problem Solving and Python Programming",
-                "GE3152 தமிழர்மரபு /Heritage of Tamils"
-            ],
-            "Semester II": [
-                "HS3252 Professional English - II",
-                "MA3251 Statistics and Numerical Methods",
-                "PH3256 Physics for Information Science",
-                "BE3251 Basic Electrical and Electronics Engineering",
-                "GE3251 Engineering Graphics",
-                "CS3251 Programming in C",
-                "GE3252 தமிழரும் தொழில்நுட்பமும் /Tamils and Technology"
-            ],
-            "Semester III": [
-                "MA3354 Discrete Mathematics",
-                "CS3351 Digital Principles and Computer Organization",
-                "CS3352 Foundations of Data Science",
-                "CD3291 Data Structures and Algorithms",
-                "CS3391 Object Oriented Programming"
-            ],
-            "Semester IV": [
-                "CS3452 Theory of Computation",
-                "CS3491 Artificial Intelligence and Machine Learning",
-                "CS3492 Database Management Systems",
-                "IT3401 Web Essentials",
-                "CS3451 Introduction to Operating Systems",
-                "GE3451 Environmental Sciences and Sustainability"
-            ],
-            "Semester V": [
-                "CS3591 Computer Networks",
-                "IT3501 Full Stack Web Development",
-                "CS3551 Distributed Computing",
-                "CS3691 Embedded Systems and IoT"
-            ],
-            "Semester VI": [
-                "CCS356 Object Oriented Software Engineering"
-            ],
-            "Semester VII": [
-                "GE3791 Human Values and Ethics"
-            ]
-        }
-    }
 
+def save_materials(conn, items):
+    """Store the written items of a bulk upload in one transaction and commit.
 
-    for dept_name, semesters in SEMESTER_STRUCTURE.items():
-        cursor.execute('SELECT id FROM departments WHERE name=%s', (dept_name,))
-        dept_id_row = cursor.fetchone()
-        if not dept_id_row:
-            continue
-        dept_id = dept_id_row[0]
-        for sem_name, subjects in semesters.items():
-            cursor.execute('INSERT IGNORE INTO semesters (name, department_id) VALUES (%s, %s)', (sem_name, dept_id))
-            cursor.execute('SELECT id FROM semesters WHERE name=%s AND department_id=%s', (sem_name, dept_id))
-            sem_id = cursor.fetchone()[0]
-            for subject in subjects:
-                cursor.execute('INSERT IGNORE INTO subjects (name, semester_id) VALUES (%s, %s)', (subject, sem_id))
-
-    # --- lightweight migration: ensure uploader_id exists ---
-    try:
-        cursor.execute('PRAGMA table_info(materials)')
-        cols = [r[1] for r in cursor.fetchall()]
-        if 'uploader_id' not in cols:
-            cursor.execute('ALTER TABLE materials ADD COLUMN uploader_id INTEGER')
-    except Exception:
-        pass
-    
-    # --- Add missing columns to users table ---
+    Blob references and materials rows are inserted together and the files
+    placed before the commit, as in ``save_material``. On failure everything
+    is rolled back, the files are removed and False is returned.
+    """
+    ready = [item for item in items if item.status == 'written']
+    cursor = conn.cursor()
+    placed = []
     try:
-        cursor.execute('DESCRIBE users')
-        existing_columns = [col[0] for col in cursor.fetchall()]
-        
-        if 'department' not in existing_columns:
-            cursor.execute('ALTER TABLE users ADD COLUMN department VARCHAR(50)')
-            print("Added department column to users table")
-        
-        if 'created_at' not in existing_columns:
-            cursor.execute('ALTER TABLE users ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
-            print("Added created_at column to users table")
-        
-        if 'last_login' not in existing_columns:
-            cursor.execute('ALTER TABLE users ADD COLUMN last_login TIMESTAMP NULL')
-            print("Added last_login column to users table")
-    except Exception as e:
-        print(f"Error adding columns to users table: {e}")
-    
-    conn.commit()
-    conn.close()
+        add_references(cursor, [(item.sha256, item.size) for item in ready])
+        material_ids = insert_materials(
+            cursor, [(item.subject_id, item.filename, item.sha256, item.uploader_id) for item in ready])
+        for item, material_id in zip(ready, material_ids):
+            item.material_id = material_id
+        index_materials(cursor, material_ids)
+        bump_versions(cursor, 'materials')
+        queue_previews(cursor, {item.sha256: item.filename for item in reversed(ready)})  # first name per blob
+        for item in ready:
+            blob_store.place(item.temp_path, item.sha256)
+            item.temp_path = None
+            placed.append(item.sha256)
+        conn.commit()
+    except (*DB_ERRORS, OSError) as e:
+        print(f"Bulk upload rolled back: {e}")
+        conn.rollback()
+        for sha256 in set(placed):
+            remove_unreferenced(cursor, sha256)  # unless other materials already used it
+        for item in ready:
+            item.material_id = None
+        discard_items(ready, 'failed', 'could not be stored; nothing was saved')
+        cursor.close()
+        return False
+    versions.expire()
+    for item in ready:
+        item.status = 'uploaded'
+    cursor.close()
+    return True
+
+
+def bulk_upload(conn, form, files, uploader_id=None):
+    """Run a bulk upload from a form: several ``file`` parts for one subject, or an ``archive`` ZIP.
+
+    Returns (report, error); error is a message when the request itself is
+    unusable. Unless ``skip_invalid`` is set, one rejected file stores nothing.
+    """
+    cat = catalog.get()
+    scope = {}
+    for level, lookup in (('department', cat.department), ('semester', cat.semester), ('subject', cat.subject)):
+        value = form.get(level, type=int)
+        if value is not None:
+            if lookup(value) is None:
+                return None, f'Unknown {level}.'
+            scope[f'{level}_id'] = value
+
+    archive = files.get('archive')
+    role = current_user.role if current_user.is_authenticated else None
+    if archive and archive.filename:
+        if not archive.filename.lower().endswith('.zip'):
+            return None, 'The archive must be a .zip file.'
+        try:
+            zip_file = zipfile.ZipFile(archive.stream)
+            items = plan_archive(zip_file, cat, role, **scope)
+        except (zipfile.BadZipFile, ValueError) as e:
+            return None, str(e) if isinstance(e, ValueError) else 'The archive is not a valid ZIP file.'
+    else:
+        uploads = [f for f in files.getlist('file') if f.filename]
+        if 'subject_id' not in scope or not uploads:
+            return None, 'Please select a subject and at least one file, or a ZIP archive.'
+        items = plan_files(uploads, scope['subject_id'], role)
+        zip_file = None
+
+    for item in items:
+        item.uploader_id = uploader_id
+    write_items(items)
+    if zip_file is not None:
+        zip_file.close()
+    if any(item.status == 'rejected' for item in items) and form.get('skip_invalid') not in ('1', 'on', 'true'):
+        discard_items(items, 'skipped', 'not stored because another file was rejected')
+        return summary(items, committed=False), None
+    return summary(items, committed=save_materials(conn, items)), None
+
+
+def insert_material(cursor, subject_id, original_filename, sha256, uploader_id=None):
+    saved_filename = f"{subject_id}_{secure_filename(original_filename)}"
+    cursor.execute(
+        'INSERT INTO materials (subject_id, filename, original_filename, uploader_id, blob_sha256) '
+        'VALUES (%s, %s, %s, %s, %s)',
+        (subject_id, saved_filename, original_filename, uploader_id, sha256)
+    )
+    return cursor.lastrowid
+
+
+def insert_materials(cursor, rows):
+    """``insert_material`` for many (subject_id, original_filename, sha256, uploader_id) rows; return their ids.
+
+    The rows go in with one ``executemany``, which does not report the ids
+    it generated, so they are read back: the newest rows matching each row.
+    """
+    if not rows:
+        return []
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM materials')
+    before = cursor.fetchone()[0]
+    cursor.executemany(
+        'INSERT INTO materials (subject_id, filename, original_filename, uploader_id, blob_sha256) '
+        'VALUES (%s, %s, %s, %s, %s)',
+        [(subject_id, f"{subject_id}_{secure_filename(original_filename)}", original_filename, uploader_id, sha256)
+         for subject_id, original_filename, sha256, uploader_id in rows]
+    )
+    cursor.execute('SELECT id, subject_id, original_filename, blob_sha256, uploader_id FROM materials '
+                   'WHERE id > %s ORDER BY id', (before,))
+    ids = {}
+    for material_id, *key in cursor.fetchall():
+        ids.setdefault(tuple(key), []).append(material_id)
+    return [ids[row].pop() for row in reversed(rows)][::-1]
 
 
+def material_path(material):
+    return material_file(material, app.config['UPLOAD_FOLDER'])
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def send_material(material):
+    return send_stored_file(material_path(material), material['original_filename'],
+                            etag=material.get('blob_sha256'), upload_root=app.config['UPLOAD_FOLDER'])
+
+
+def remove_material(conn, material):
+    """Delete a materials row and commit; its file goes once nothing else references it."""
+    cursor = conn.cursor()
+    unindex_material_messages(cursor, material['id'])  # the messages go with the material
+    cursor.execute('DELETE FROM materials WHERE id = %s', (material['id'],))
+    bump_versions(cursor, 'materials')
+    unindex_material(cursor, material['id'])
+    sha256 = material.get('blob_sha256')
+    orphaned = drop_reference(cursor, sha256) if sha256 else False
+    conn.commit()
+    versions.expire()
+    if orphaned:
+        remove_unreferenced(cursor, sha256)
+        remove_preview(cursor, sha256)
+        conn.commit()
+    elif not sha256:
+        cursor.execute('SELECT 1 FROM materials WHERE filename=%s AND blob_sha256 IS NULL LIMIT 1',
+                       (material['filename'],))
+        filepath = material_path(material)
+        if cursor.fetchone() is None and os.path.exists(filepath):
+            os.remove(filepath)
+    cursor.close()
 
 
 def get_all_departments():
-    with get_db() as conn:
-        departments = conn.execute('SELECT * FROM departments').fetchall()
-    return departments
+    return catalog.get().departments
 
-init_db()
+schema_ready = init_db()
 
 # ========== SAMPLE USERS SETUP ==========
 def create_sample_users():
     """Create sample users for testing different roles"""
-    from werkzeug.security import generate_password_hash
-    
-    conn = get_db_connection()
-    if not conn:
-        print("Failed to connect to database")
-        return
-    
     try:
-        cursor = conn.cursor()
+        with pool.connection() as conn:
+            _create_sample_users(conn)
+    except DB_ERRORS:
+        app.logger.exception("Could not create the sample users")
+
+
+def _create_sample_users(conn):
+    cursor = conn.cursor()
+    try:
         # Check if users already exist
         cursor.execute('SELECT COUNT(*) as count FROM users')
         existing_users = cursor.fetchone()[0]
@@ -669,119 +417,91 @@ def create_sample_users():
         ]
         
         for email, password, role, name in sample_users:
-            password_hash = generate_password_hash(password)
+            password_hash = hash_password(password)
             cursor.execute(
-                'INSERT INTO users (email, password_hash, role, name) VALUES (%s, %s, %s, %s)',
+                'INSERT IGNORE INTO users (email, password_hash, role, name) VALUES (%s, %s, %s, %s)',
                 (email, password_hash, role, name)
             )
         
         conn.commit()
         print("Sample users added successfully!")
-    except Exception as e:
-        print(f"Error creating sample users: {e}")
     finally:
-        conn.close()
+        cursor.close()
 
 # Create sample users on startup
-create_sample_users()
+if schema_ready:
+    create_sample_users()
+# Boot ran in the master process: close its connections so preforked workers don't share the sockets/files
+pool.close_all()
 
 # == ROUTES: STUDENT SIDE ==
 @app.route('/')
+@cached_page('events', 'catalog', per_visitor=False)
 def college_home():
-    conn = get_db_connection()
+    conn = get_db()
     if not conn:
         return "Database connection error", 500
     
-    try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute('''
-            SELECT e.*, d.name as department_name
-            FROM events e
-            JOIN departments d ON e.department_id = d.id
-            ORDER BY event_date DESC, created_at DESC
-            LIMIT 5
-        ''')
-        events = cursor.fetchall()
-        
-        cursor.execute('SELECT * FROM departments')
-        departments = cursor.fetchall()
-        cursor.close()
-        
-        return render_template('college_home.html', current_year=datetime.now().year, events=events, departments=departments)
-    finally:
-        conn.close()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute('''
+        SELECT e.*, d.name as department_name
+        FROM events e
+        JOIN departments d ON e.department_id = d.id
+        ORDER BY event_date DESC, created_at DESC
+        LIMIT 5
+    ''')
+    events = cursor.fetchall()
+    cursor.close()
+    
+    departments = catalog.get().departments
+    return render_template('college_home.html', current_year=datetime.now().year, events=events, departments=departments)
 
 
 @app.route('/college_home')
 @login_required
 def college_home_redirect():
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM departments')
-    departments = cursor.fetchall()
-    cursor.close()
+    departments = catalog.get().departments
     return render_template('index.html', departments=departments)
 
 
 @app.route("/materials")
 @login_required
 def index():
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)  # dictionary=True gives rows as dicts
-    cursor.execute("SELECT * FROM departments")
-    departments = cursor.fetchall()
-    cursor.close()
+    departments = catalog.get().departments
     return render_template("index.html", departments=departments)
 
 
 @app.route('/department/<int:department_id>')
 def show_semesters(department_id):
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM departments WHERE id=%s', (department_id,))
-    department = cursor.fetchone()
+    cat = catalog.get()
+    department = cat.department(department_id)
     if not department:
-        cursor.close()
         abort(404)
-    cursor.execute('SELECT * FROM semesters WHERE department_id=%s', (department_id,))
-    semesters = cursor.fetchall()
-    cursor.close()
+    semesters = cat.semesters_of(department_id)
     return render_template('semesters.html', department=department, semesters=semesters)
 
 
 @app.route('/semesters/<int:department_id>')
 @login_required
 def show_semesters_login_required(department_id):
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM departments WHERE id=%s', (department_id,))
-    department = cursor.fetchone()
+    cat = catalog.get()
+    department = cat.department(department_id)
     if not department:
-        cursor.close()
         abort(404)
-    cursor.execute('SELECT * FROM semesters WHERE department_id=%s', (department_id,))
-    semesters = cursor.fetchall()
-    cursor.close()
+    semesters = cat.semesters_of(department_id)
     return render_template('semesters.html', department=department, semesters=semesters)
 
 
 @app.route('/department/<int:department_id>/semester/<int:semester_id>')
 def show_subjects(department_id, semester_id):
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM departments WHERE id=%s', (department_id,))
-    department = cursor.fetchone()
+    cat = catalog.get()
+    department = cat.department(department_id)
     if not department:
-        cursor.close()
         abort(404)
-    cursor.execute('SELECT * FROM semesters WHERE id=%s AND department_id=%s', (semester_id, department_id))
-    semester = cursor.fetchone()
-    if not semester:
-        cursor.close()
+    semester = cat.semester(semester_id)
+    if not semester or semester['department_id'] != department_id:
         abort(404)
-    cursor.execute('SELECT * FROM subjects WHERE semester_id=%s', (semester_id,))
-    subjects = cursor.fetchall()
-    cursor.close()
+    subjects = cat.subjects_of(semester_id)
     return render_template('subjects.html',
                            department=department,
                            semester=semester,
@@ -792,55 +512,67 @@ def show_subjects(department_id, semester_id):
 @app.route("/materials/<int:subject_id>")
 @login_required
 def show_materials(subject_id):
+    subject = catalog.get().subject(subject_id)
+
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM subjects WHERE id=%s", (subject_id,))
-    subject = cursor.fetchone()
-
-    cursor.execute("SELECT * FROM materials WHERE subject_id=%s", (subject_id,))
-    materials = cursor.fetchall()
-
-    # Fetch all questions for these materials
-    cursor.execute("""
+    # precomputed previews (blob_previews is filled by the material_preview job)
+    materials_page = paginate(cursor, """
+        SELECT m.*, p.mime_type, p.size, p.page_count, p.thumbnail, p.excerpt
+        FROM materials m LEFT JOIN blob_previews p ON p.sha256 = m.blob_sha256
+        WHERE m.subject_id=%s AND {keyset}
+    """, (subject_id,), MATERIAL_KEYS, descending=False)
+
+    # One page of questions for these materials, newest first
+    questions_page = paginate(cursor, """
         SELECT m.id as msg_id, m.encrypted_message, m.created_at,
                u.name as student_name, mat.original_filename as file_name, mat.id as material_id
         FROM messages m
         JOIN users u ON m.sender_id = u.id
         JOIN materials mat ON m.material_id = mat.id
-        WHERE mat.subject_id = %s AND m.reply_to IS NULL
-        ORDER BY m.created_at DESC
-    """, (subject_id,))
-    questions = cursor.fetchall()
+        WHERE mat.subject_id = %s AND m.reply_to IS NULL AND {keyset}
+    """, (subject_id,), QUESTION_KEYS, param='q_cursor')
 
     # Organize into {material_id: {q_id: {q, replies}}}
-    q_dict = {}
-    for q in questions:
-        cursor.execute("""
-            SELECT m.encrypted_message, m.created_at, u.name as sender_name
-            FROM messages m
-            JOIN users u ON m.sender_id = u.id
-            WHERE m.reply_to = %s
-            ORDER BY m.created_at ASC
-        """, (q["msg_id"],))
-        replies = cursor.fetchall()
-
-        if q["material_id"] not in q_dict:
-            q_dict[q["material_id"]] = {}
-        q_dict[q["material_id"]][q["msg_id"]] = {"q": q, "replies": replies}
+    q_dict = threads_by_material(cursor, questions_page.items)
 
     cursor.close()
-    return render_template("materials.html", subject=subject, materials=materials, questions=q_dict)
+    return render_template("materials.html", subject=subject, materials=materials_page.items,
+                           materials_page=materials_page, questions=q_dict, questions_page=questions_page)
+
+
+@app.route('/materials/preview/<int:material_id>')
+@login_required
+def material_preview(material_id):
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute('SELECT p.sha256, p.thumbnail FROM materials m JOIN blob_previews p ON p.sha256 = m.blob_sha256 '
+                   'WHERE m.id=%s', (material_id,))
+    preview = cursor.fetchone()
+    cursor.close()
+    if not preview or not preview['thumbnail']:
+        abort(404)
+    path = os.path.abspath(thumbnail_path(preview['thumbnail']))
+    if not os.path.isfile(path):
+        abort(404)
+    # a material's content never changes, so browsers may keep its thumbnail for a day
+    response = send_file(path, mimetype=thumbnail_mime_type(preview['thumbnail']), conditional=True,
+                         etag=preview['sha256'], max_age=86400)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
 
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT original_filename FROM materials WHERE filename=%s', (filename,))
+    cursor.execute('SELECT filename, original_filename, blob_sha256 FROM materials WHERE filename=%s '
+                   'ORDER BY id DESC LIMIT 1', (filename,))
     mat = cursor.fetchone()
     cursor.close()
     if mat:
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True, download_name=mat['original_filename'])
+        return send_material(mat)
     abort(404)
 
 
@@ -849,21 +581,26 @@ def gpa_cgpa_page():
     return render_template('gpa_cgpa.html')
 
 
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    """Fingerprinted static files from ``flask build-assets`` (see assets.py)."""
+    return send_asset(app.static_folder, filename)
+
+
 # == ROUTES: ADMIN SIDE ==
 @app.route('/admin/events/new', methods=['GET', 'POST'])
 @auth.login_required
 def admin_events_new():
+    departments = catalog.get().departments
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM departments')
-    departments = cursor.fetchall()
 
     if request.method == 'POST':
         department_id = request.form['department_id']
         title = request.form['title']
         content = request.form['content']
         author = request.form.get('author')
-        event_date = request.form.get('event_date')
+        event_date = request.form.get('event_date') or datetime.now().date().isoformat()
         image_url = request.form.get('image_url') or None
 
         cursor.execute(
@@ -871,8 +608,10 @@ def admin_events_new():
                VALUES (%s, %s, %s, %s, %s, %s)''',
             (department_id, title, content, author, event_date, image_url)
         )
+        bump_versions(cursor, 'events')
         conn.commit()
         cursor.close()
+        versions.expire()
         flash("Event posted!")
         return redirect(url_for('events_all'))
 
@@ -882,11 +621,19 @@ def admin_events_new():
 
 @app.route('/admin/upload', methods=['GET', 'POST'])
 @auth.login_required
+@accepts_bulk
 def admin_upload():
+    departments = catalog.get().departments
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM departments')
-    departments = cursor.fetchall()
+
+    if request.method == 'POST' and is_bulk(request.files):
+        cursor.close()
+        report, error = bulk_upload(conn, request.form, request.files)
+        if error:
+            flash(error)
+            return redirect(request.url)
+        return render_template('admin_upload.html', departments=departments, report=report)
 
     if request.method == 'POST':
         department_id = request.form.get('department')
@@ -898,17 +645,10 @@ def admin_upload():
             flash('Please select department, semester, subject, and a valid file.')
             return redirect(request.url)
 
-        original_filename = file.filename
-        saved_filename = f"{subject_id}_{original_filename}".replace(" ", "_")
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], saved_filename)
-        file.save(filepath)
-
-        cursor.execute(
-            'INSERT INTO materials (subject_id, filename, original_filename) VALUES (%s, %s, %s)',
-            (subject_id, saved_filename, original_filename)
-        )
+        save_material(conn, file, subject_id)
         conn.commit()
         cursor.close()
+        versions.expire()
         flash('File uploaded successfully!')
         return redirect(url_for('admin_upload'))
 
@@ -919,11 +659,7 @@ def admin_upload():
 @app.route('/admin/semesters/<int:department_id>')
 @auth.login_required
 def admin_get_semesters(department_id):
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM semesters WHERE department_id=%s', (department_id,))
-    semesters = cursor.fetchall()
-    cursor.close()
+    semesters = catalog.get().semesters_of(department_id)
     data = [{'id': s['id'], 'name': s['name']} for s in semesters]
     return jsonify({"semesters": data})
 
@@ -931,11 +667,7 @@ def admin_get_semesters(department_id):
 @app.route('/admin/subjects/<int:semester_id>')
 @auth.login_required
 def admin_get_subjects(semester_id):
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM subjects WHERE semester_id=%s', (semester_id,))
-    subjects = cursor.fetchall()
-    cursor.close()
+    subjects = catalog.get().subjects_of(semester_id)
     data = [{'id': s['id'], 'name': s['name']} for s in subjects]
     return jsonify({"subjects": data})
 
@@ -963,13 +695,8 @@ def delete_material(material_id):
         flash('You are not allowed to delete this material.', 'danger')
         return redirect(request.referrer or url_for('index'))
 
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], material['filename'])
-    if os.path.exists(filepath):
-        os.remove(filepath)
-
-    cursor.execute('DELETE FROM materials WHERE id = %s', (material_id,))
-    conn.commit()
     cursor.close()
+    remove_material(conn, material)
     flash('Material deleted successfully!', 'success')
     return redirect(request.referrer or url_for('index'))
 
@@ -977,10 +704,9 @@ def delete_material(material_id):
 @app.route('/admin/department-achievements/new', methods=['GET', 'POST'])
 @auth.login_required
 def admin_department_achievement_new():
+    departments = catalog.get().departments
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM departments')
-    departments = cursor.fetchall()
 
     if request.method == 'POST':
         department_id = request.form['department_id']
@@ -997,8 +723,10 @@ def admin_department_achievement_new():
             INSERT INTO department_achievements (department_id, title, description, image_url)
             VALUES (%s, %s, %s, %s)
         ''', (department_id, title, description, image_url))
+        bump_versions(cursor, 'achievements')
         conn.commit()
         cursor.close()
+        versions.expire()
         flash('Achievement added successfully!')
         return redirect(url_for('admin_department_achievement_new'))
 
@@ -1008,99 +736,186 @@ def admin_department_achievement_new():
 
 # == API ENDPOINTS ==
 @app.route('/api/departments')
+@validated('catalog', max_age=API_CATALOG_MAX_AGE)
 def api_get_departments():
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM departments')
-    departments = cursor.fetchall()
-    cursor.close()
+    departments = catalog.get().departments
     data = [{'id': d['id'], 'name': d['name']} for d in departments]
     return jsonify(data)
 
 
 @app.route('/events')
+@cached_page('events', 'catalog')
 def events_all():
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute('''
-        SELECT e.*, d.name as department_name FROM events e
+    page = paginate(cursor, '''
+        SELECT e.*, d.name as department_name
+        FROM events e
         JOIN departments d ON e.department_id = d.id
-        ORDER BY event_date DESC, created_at DESC
-    ''')
-    events = cursor.fetchall()
+        WHERE {keyset}
+    ''', (), EVENT_KEYS)
     cursor.close()
-    return render_template('events.html', events=events)
+    return render_template('events.html', events=page.items, page=page)
 
 
 @app.route('/events/<int:department_id>')
+@cached_page('events', 'catalog')
 def events_by_dept(department_id):
+    dept = catalog.get().department(department_id)
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM departments WHERE id=%s', (department_id,))
-    dept = cursor.fetchone()
-    cursor.execute('''
-        SELECT * FROM events WHERE department_id=%s
-        ORDER BY event_date DESC, created_at DESC
-    ''', (department_id,))
-    events = cursor.fetchall()
+    page = paginate(cursor, '''
+        SELECT e.*
+        FROM events e
+        WHERE e.department_id=%s AND {keyset}
+    ''', (department_id,), EVENT_KEYS)
     cursor.close()
-    return render_template('events.html', department=dept, events=events)
+    return render_template('events.html', department=dept, events=page.items, page=page)
 
 
 @app.route('/api/semesters/<int:department_id>')
+@validated('catalog', max_age=API_CATALOG_MAX_AGE)
 def api_get_semesters(department_id):
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM semesters WHERE department_id=%s', (department_id,))
-    semesters = cursor.fetchall()
-    cursor.close()
+    semesters = catalog.get().semesters_of(department_id)
     data = [{'id': s['id'], 'name': s['name']} for s in semesters]
     return jsonify(data)
 
 
 @app.route('/api/subjects/<int:semester_id>')
+@validated('catalog', max_age=API_CATALOG_MAX_AGE)
 def api_get_subjects(semester_id):
+    subjects = catalog.get().subjects_of(semester_id)
+    data = [{'id': s['id'], 'name': s['name']} for s in subjects]
+    return jsonify(data)
+
+
+MAX_BATCH_IDS = 200
+
+
+def parse_id_list(arg_name):
+    """Parse ?name=1,2,3 (or repeated ?name=1&name=2) into a list of ints; abort 400 on bad input."""
+    raw = ','.join(request.args.getlist(arg_name))
+    try:
+        ids = [int(part) for part in raw.split(',') if part.strip()]
+    except ValueError:
+        abort(400, description=f"'{arg_name}' must be a comma-separated list of ids")
+    if not ids or len(ids) > MAX_BATCH_IDS:
+        abort(400, description=f"'{arg_name}' must list between 1 and {MAX_BATCH_IDS} ids")
+    return list(dict.fromkeys(ids))
+
+
+@app.route('/api/catalog')
+def api_get_catalog():
+    cat = catalog.get()
+    return jsonify({'version': cat.version, 'departments': cat.tree()})
+
+
+@app.route('/api/semesters')
+def api_get_semesters_batch():
+    cat = catalog.get()
+    data = {str(dept_id): [{'id': s['id'], 'name': s['name']} for s in cat.semesters_of(dept_id)]
+            for dept_id in parse_id_list('department_ids')}
+    return jsonify({'version': cat.version, 'semesters': data})
+
+
+@app.route('/api/subjects')
+def api_get_subjects_batch():
+    cat = catalog.get()
+    data = {str(sem_id): [{'id': s['id'], 'name': s['name']} for s in cat.subjects_of(sem_id)]
+            for sem_id in parse_id_list('semester_ids')}
+    return jsonify({'version': cat.version, 'subjects': data})
+
+
+@app.route('/api/materials')
+def api_get_materials_batch():
+    """The first page of materials of each subject; ``next`` links the subjects that have more."""
+    subject_ids = parse_id_list('subject_ids')
+    limit = page_size()
+    # one statement: a UNION ALL of index range scans, each stopping after its subject's page (and one more row)
+    branch = ('SELECT * FROM (SELECT id, subject_id, filename, original_filename FROM materials '
+              f'WHERE subject_id=%s ORDER BY id LIMIT {int(limit) + 1}) AS page{{}}')
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM subjects WHERE semester_id=%s', (semester_id,))
-    subjects = cursor.fetchall()
+    cursor.execute(' UNION ALL '.join(branch.format(i) for i in range(len(subject_ids))), subject_ids)
+    materials = cursor.fetchall()
     cursor.close()
-    data = [{'id': s['id'], 'name': s['name']} for s in subjects]
-    return jsonify(data)
+    data = {str(subject_id): [] for subject_id in subject_ids}
+    more = {}
+    for m in materials:
+        rows = data[str(m['subject_id'])]
+        if len(rows) == limit:
+            more[str(m['subject_id'])] = url_for(
+                'api_get_materials', subject_id=m['subject_id'], limit=limit,
+                cursor=encode_cursor([rows[-1][field] for _, field in ID_KEYS]))
+            continue
+        rows.append({'id': m['id'], 'filename': m['filename'], 'original_filename': m['original_filename']})
+    return jsonify({'materials': data, 'next': more})
 
 
 @app.route('/api/materials/<int:subject_id>')
+@validated('materials')
 def api_get_materials(subject_id):
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM materials WHERE subject_id=%s', (subject_id,))
-    materials = cursor.fetchall()
+    page = paginate(cursor, 'SELECT * FROM materials WHERE subject_id=%s AND {keyset}',
+                    (subject_id,), ID_KEYS, descending=False)
     cursor.close()
-    data = [{'id': m['id'], 'filename': m['filename'], 'original_filename': m['original_filename']} for m in materials]
-    return jsonify(data)
+    data = [{'id': m['id'], 'filename': m['filename'], 'original_filename': m['original_filename']} for m in page.items]
+    return paged_json(data, page)
+
+
+def paged_json(data, page):
+    """JSON list response pointing at the next page with a Link header."""
+    response = jsonify(data)
+    if page.has_more:
+        response.headers['Link'] = f'<{page.next_url()}>; rel="next"'
+        response.headers['X-Next-Cursor'] = page.next_cursor
+    return response
+
+
+@app.route('/api/search')
+def api_search():
+    """Ranked full-text search over material names, subjects, course codes and document text."""
+    terms = query_terms(request.args.get('q'))
+    if not terms:
+        return jsonify({'error': "Missing search query 'q'"}), 400
+    department_id = request.args.get('department_id', type=int)
+    semester_id = request.args.get('semester_id', type=int)
+    sql, params = search_sql(terms, department_id, semester_id)
+
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    page = paginate(cursor, sql, params, SEARCH_KEYS)
+    cursor.close()
+    data = [{
+        'id': m['id'], 'filename': m['filename'], 'original_filename': m['original_filename'],
+        'subject_id': m['subject_id'], 'subject': m['subject'], 'course_code': m['course_code'],
+        'semester_id': m['semester_id'], 'semester': m['semester'],
+        'department_id': m['department_id'], 'department': m['department'],
+        'score': round(m['score'], 4),
+    } for m in page.items]
+    return paged_json(data, page)
 
 
 @app.route('/api/upload', methods=['POST'])
 @auth.login_required
+@accepts_bulk
 def api_upload():
+    if is_bulk(request.files):
+        report, error = bulk_upload(get_db(), request.form, request.files)
+        if error:
+            return jsonify({'error': error}), 400
+        return jsonify(report), 200 if report['committed'] else 422
+
     file = request.files.get('file')
     subject_id = request.form.get('subject')
     if not subject_id or not file or not allowed_file(file.filename):
         return jsonify({'error': 'Missing subject or invalid file'}), 400
 
-    original_filename = file.filename
-    saved_filename = f"{subject_id}_{original_filename}".replace(" ", "_")
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], saved_filename)
-    file.save(filepath)
-
     conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        'INSERT INTO materials (subject_id, filename, original_filename) VALUES (%s, %s, %s)',
-        (subject_id, saved_filename, original_filename)
-    )
+    save_material(conn, file, subject_id)
     conn.commit()
-    cursor.close()
+    versions.expire()
     return jsonify({'message': 'File uploaded successfully'})
 
 
@@ -1115,13 +930,8 @@ def api_delete_material(material_id):
         cursor.close()
         return jsonify({'error': 'Material not found'}), 404
 
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], material['filename'])
-    if os.path.exists(filepath):
-        os.remove(filepath)
-
-    cursor.execute('DELETE FROM materials WHERE id = %s', (material_id,))
-    conn.commit()
     cursor.close()
+    remove_material(conn, material)
     return jsonify({'message': 'Material deleted successfully'})
 
 
@@ -1134,25 +944,21 @@ def verify_departments():
 
 
 @app.route('/department-highlights')
+@cached_page('catalog')
 def department_highlights():
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM departments')
-    departments = cursor.fetchall()
-    cursor.close()
+    departments = catalog.get().departments
     return render_template('department_highlights.html', departments=departments)
 
 
 @app.route('/department/<int:department_id>/achievements')
+@cached_page('achievements', 'catalog')
 def department_achievements(department_id):
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM departments WHERE id=%s', (department_id,))
-    department = cursor.fetchone()
+    department = catalog.get().department(department_id)
     if not department:
-        cursor.close()
         abort(404)
 
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
     cursor.execute('''
         SELECT * FROM department_achievements 
         WHERE department_id=%s
@@ -1194,22 +1000,28 @@ def login():
         password = request.form['password']
         selected_role = request.form['role']
 
-        conn = get_db_connection()
+        conn = get_db()
         if not conn:
             flash("Database connection error", "danger")
             return render_template('login.html')
         
+        cursor = conn.cursor(dictionary=True)
         try:
-            cursor = conn.cursor(dictionary=True)
             cursor.execute('SELECT * FROM users WHERE email = %s', (email,))
             row = cursor.fetchone()
         finally:
             cursor.close()
-            conn.close()
 
         if row:
             user = load_user_from_row(row)
-            if user.check_password(password):
+            try:
+                valid, upgraded_hash = check_password(user.password_hash, password)
+            except HashingBusy:
+                flash("Too many sign-ins right now. Please try again in a few seconds.", "warning")
+                return render_template('login.html'), 503, {'Retry-After': '5'}
+            if valid:
+                if upgraded_hash:
+                    save_upgraded_hash(conn, user, upgraded_hash)
                 if user.role != selected_role:
                     flash(f"You selected role '{selected_role}', but your account is registered as '{user.role}'. Please select the correct role.", "warning")
                     return redirect(url_for('login'))
@@ -1228,6 +1040,25 @@ def login():
     return render_template('login.html')
 
 
+def save_upgraded_hash(conn, user, password_hash):
+    """Store a rehash made with the current PASSWORD_HASH_METHOD, unless the password changed meanwhile."""
+    cursor = conn.cursor()
+    cursor.execute('UPDATE users SET password_hash=%s WHERE id=%s AND password_hash=%s',
+                   (password_hash, user.id, user.password_hash))
+    conn.commit()
+    cursor.close()
+    user.password_hash = password_hash
+
+
+@app.errorhandler(HashingBusy)
+def hashing_busy(e):
+    # password checks outside the login form (HTTP basic auth, registration, user creation)
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'Server busy, retry shortly'}), 503, {'Retry-After': '5'}
+    # a page, not a redirect: behind basic auth the retried GET would hit the busy pool again
+    return render_template('busy.html', retry_url=request.url), 503, {'Retry-After': '5'}
+
+
 @app.route('/logout')
 @login_required
 def logout():
@@ -1249,7 +1080,7 @@ def user_register():
             flash("All fields are required.", "warning")
             return redirect(url_for("register"))
 
-        hashed_pw = generate_password_hash(password)
+        hashed_pw = hash_password(password)
         conn = get_db()
         cursor = conn.cursor(dictionary=True)
         try:
@@ -1281,12 +1112,13 @@ def admin_dashboard():
 
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM users WHERE role='faculty'")
-    faculties = cursor.fetchall()
-    cursor.execute("SELECT * FROM users WHERE role='student'")
-    students = cursor.fetchall()
+    faculties = paginate(cursor, "SELECT * FROM users WHERE role='faculty' AND {keyset}", (),
+                         ID_KEYS, descending=False, param='faculty_cursor')
+    students = paginate(cursor, "SELECT * FROM users WHERE role='student' AND {keyset}", (),
+                        ID_KEYS, descending=False, param='student_cursor')
     cursor.close()
-    return render_template('admin_dashboard.html', faculties=faculties, students=students)
+    return render_template('admin_dashboard.html', faculties=faculties.items, students=students.items,
+                           faculties_page=faculties, students_page=students)
 
 
 @app.route('/student/dashboard')
@@ -1318,7 +1150,67 @@ def download_material(material_id):
     cursor.close()
     if not material:
         abort(404)
-    return send_from_directory(app.config['UPLOAD_FOLDER'], material['filename'], as_attachment=True, download_name=material['original_filename'])
+    return send_material(material)
+
+
+def material_zip_entries(cursor, where, params, subject_folders=False):
+    """(archive name, path, content id) of the materials matching ``where``, for send_zip."""
+    cursor.execute(
+        'SELECT m.id, m.filename, m.original_filename, m.blob_sha256, s.name AS subject_name '
+        f'FROM materials m JOIN subjects s ON s.id = m.subject_id WHERE {where} ORDER BY m.id', params
+    )
+    entries = []
+    for m in cursor.fetchall():
+        name = os.path.basename((m['original_filename'] or m['filename']).replace('\\', '/'))
+        if subject_folders:
+            name = f"{m['subject_name'].replace('/', '-')}/{name}"
+        entries.append((name, material_path(m), m['blob_sha256'] or m['filename']))
+    if subject_folders:
+        entries.sort(key=lambda entry: entry[0].split('/', 1)[0])  # stable: keeps upload order per subject
+    return entries
+
+
+@app.route('/materials/<int:subject_id>/download.zip')
+@login_required
+def download_subject_zip(subject_id):
+    subject = catalog.get().subject(subject_id)
+    if not subject:
+        abort(404)
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    entries = material_zip_entries(cursor, 'm.subject_id=%s', (subject_id,))
+    cursor.close()
+    return send_zip(entries, f"{secure_filename(subject['name']) or 'materials'}.zip")
+
+
+@app.route('/semesters/<int:semester_id>/download.zip')
+@login_required
+def download_semester_zip(semester_id):
+    cat = catalog.get()
+    semester = cat.semester(semester_id)
+    if not semester:
+        abort(404)
+    department = cat.department(semester['department_id'])
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    entries = material_zip_entries(cursor, 'm.subject_id IN (SELECT id FROM subjects WHERE semester_id=%s)',
+                                   (semester_id,), subject_folders=True)
+    cursor.close()
+    name = secure_filename(f"{department['name'] if department else ''} {semester['name']}") or 'semester'
+    return send_zip(entries, f"{name}.zip")
+
+
+@app.route('/materials/download.zip')
+@login_required
+def download_selection_zip():
+    """ZIP of the materials listed in ?ids=1,2,3 (one folder per subject)."""
+    ids = parse_id_list('ids')
+    placeholders = ','.join(['%s'] * len(ids))
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    entries = material_zip_entries(cursor, f'm.id IN ({placeholders})', ids, subject_folders=True)
+    cursor.close()
+    return send_zip(entries, 'materials.zip')
 
 
 @app.route('/admin/users', methods=['GET', 'POST'])
@@ -1342,19 +1234,18 @@ def manage_users():
         if exists:
             flash('User already exists', 'warning')
         else:
-            pw_hash = generate_password_hash(password)
+            pw_hash = hash_password(password)
             cursor.execute('INSERT INTO users (email, password_hash, role, name, department) VALUES (%s, %s, %s, %s, %s)',
                            (email, pw_hash, role, name, department))
             conn.commit()
             flash('User added.', 'success')
 
-    cursor.execute('SELECT * FROM departments')
-    departments = cursor.fetchall()
+    departments = catalog.get().departments
     
-    cursor.execute('SELECT * FROM users')
-    users = cursor.fetchall()
+    page = paginate(cursor, 'SELECT * FROM users WHERE {keyset}', (), ID_KEYS, descending=False)
     cursor.close()
-    return render_template('manage_users.html', users=users, departments=departments)
+    return render_template('manage_users.html', users=page.items, page=page, departments=departments,
+                           import_id=request.args.get('import_id', type=int))
 
 @app.route('/admin/add_user', methods=['POST'])
 @login_required
@@ -1376,7 +1267,7 @@ def add_user():
     if exists:
         flash('Student already exists', 'warning')
     else:
-        pw_hash = generate_password_hash(password)
+        pw_hash = hash_password(password)
         cursor.execute('INSERT INTO users (email, password_hash, role, name, department) VALUES (%s, %s, %s, %s, %s)',
                        (email, pw_hash, role, name, department))
         conn.commit()
@@ -1386,6 +1277,43 @@ def add_user():
     return redirect(url_for('manage_users'))
 
 
+@app.route('/admin/users/import', methods=['POST'])
+@login_required
+@accepts_spreadsheets
+def import_users():
+    if current_user.role != "admin":
+        abort(403)
+
+    file = request.files.get('file')
+    extension = file.filename.rsplit('.', 1)[-1].lower() if file and '.' in file.filename else ''
+    if extension not in ('csv', 'xlsx'):
+        flash('Choose a .csv or .xlsx file with email, name and password columns.', 'warning')
+        return redirect(url_for('manage_users'))
+
+    conn = get_db()
+    cursor = conn.cursor()
+    import_id = create_import(cursor, file.stream, file.filename, extension, current_user.id)
+    conn.commit()
+    cursor.close()
+    flash('Import started.', 'success')
+    return redirect(url_for('manage_users', import_id=import_id))
+
+
+@app.route('/api/user-imports/<int:import_id>')
+@login_required
+def api_user_import(import_id):
+    if current_user.role != "admin":
+        abort(403)
+
+    conn = get_db()
+    cursor = conn.cursor()
+    status = import_status(cursor, import_id)
+    cursor.close()
+    if status is None:
+        return jsonify({'error': 'Import not found'}), 404
+    return jsonify(status)
+
+
 @app.route('/admin/users/delete/<int:user_id>', methods=['POST'])
 @login_required
 def delete_user(user_id):
@@ -1397,6 +1325,7 @@ def delete_user(user_id):
     cursor.execute('DELETE FROM users WHERE id=%s AND role != %s', (user_id, 'admin'))
     conn.commit()
     cursor.close()
+    forget_user(user_id)
     flash("User deleted.", "success")
     return redirect(url_for('manage_users'))
 
@@ -1409,13 +1338,19 @@ def edit_user(user_id):
     name = request.form['name']
     email = request.form['email']
     department = request.form.get('department', '')
+    role = request.form.get('role')
 
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute('UPDATE users SET name=%s, email=%s, department=%s WHERE id=%s', 
-                   (name, email, department, user_id))
+    # a new session version: the user's cached entries go in every process (they sign in again)
+    cursor.execute('UPDATE users SET name=%s, email=%s, department=%s, session_version = session_version + 1 '
+                   'WHERE id=%s', (name, email, department, user_id))
+    if role in ('student', 'faculty'):
+        cursor.execute('UPDATE users SET role=%s WHERE id=%s AND role NOT IN (%s, %s)',
+                       (role, user_id, role, 'admin'))
     conn.commit()
     cursor.close()
+    forget_user(user_id)
     flash("User updated successfully.", "success")
     return redirect(url_for('student_records'))
 
@@ -1428,13 +1363,14 @@ def student_records():
     cursor = conn.cursor(dictionary=True)
     
     if department:
-        cursor.execute("SELECT * FROM users WHERE role='student' AND department=%s", (department,))
+        page = paginate(cursor, "SELECT * FROM users WHERE role='student' AND department=%s AND {keyset}",
+                        (department,), ID_KEYS, descending=False)
     else:
-        cursor.execute("SELECT * FROM users WHERE role='student'")
+        page = paginate(cursor, "SELECT * FROM users WHERE role='student' AND {keyset}",
+                        (), ID_KEYS, descending=False)
         
-    students = cursor.fetchall()
     cursor.close()
-    return render_template("student_records.html", students=students, selected_department=department)
+    return render_template("student_records.html", students=page.items, page=page, selected_department=department)
 
 
 # == FACULTY ROUTES ==
@@ -1445,46 +1381,7 @@ def faculty_dashboard():
         flash("Access denied.", "danger")
         return redirect(url_for("index"))
 
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-
-    # fetch materials uploaded by this faculty
-    cursor.execute(
-        "SELECT * FROM materials WHERE uploader_id = %s", (current_user.id,)
-    )
-    materials = cursor.fetchall()
-
-    # fetch all student questions for those materials
-    cursor.execute("""
-        SELECT m.id as msg_id, m.encrypted_message, m.created_at,
-               s.name as student_name, mat.original_filename as file_name
-        FROM messages m
-        JOIN users s ON m.sender_id = s.id
-        JOIN materials mat ON m.material_id = mat.id
-        WHERE mat.uploader_id = %s AND m.reply_to IS NULL
-        ORDER BY m.created_at DESC
-    """, (current_user.id,))
-    questions = cursor.fetchall()
-
-    # fetch replies for each question
-    q_dict = {}
-    for q in questions:
-        cursor.execute("""
-            SELECT m.encrypted_message, m.created_at, u.name as sender_name
-            FROM messages m
-            JOIN users u ON m.sender_id = u.id
-            WHERE m.reply_to = %s
-            ORDER BY m.created_at ASC
-        """, (q["msg_id"],))
-        replies = cursor.fetchall()
-        q_dict[q["msg_id"]] = {"q": q, "replies": replies}
-
-    cursor.close()
-    return render_template(
-        "faculty_dashboard.html",
-        materials=materials,
-        questions=q_dict
-    )
+    return render_template("faculty_dashboard.html")
 
 
 @app.route('/faculty/my-materials')
@@ -1496,7 +1393,8 @@ def faculty_my_materials():
 
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute(
+    page = paginate(
+        cursor,
         """
         SELECT m.id, m.original_filename, m.filename,
                s.name AS subject_name,
@@ -1506,14 +1404,13 @@ def faculty_my_materials():
         JOIN subjects s ON m.subject_id = s.id
         JOIN semesters sem ON s.semester_id = sem.id
         JOIN departments d ON sem.department_id = d.id
-        WHERE m.uploader_id = %s
-        ORDER BY m.id DESC
+        WHERE m.uploader_id = %s AND {keyset}
         """,
         (current_user.id,),
+        [('m.id', 'id')],
     )
-    materials = cursor.fetchall()
     cursor.close()
-    return render_template("faculty_my_materials.html", materials=materials)
+    return render_template("faculty_my_materials.html", materials=page.items, page=page)
 
 
 @app.route('/faculty/delete-material/<int:material_id>', methods=['POST'])
@@ -1536,13 +1433,8 @@ def faculty_delete_material(material_id):
         flash("You don't have permission to delete this file.", "danger")
         return redirect(url_for("faculty_my_materials"))
 
-    filepath = os.path.join(app.config["UPLOAD_FOLDER"], mat["filename"])
-    if os.path.exists(filepath):
-        os.remove(filepath)
-
-    cursor.execute("DELETE FROM materials WHERE id=%s", (material_id,))
-    conn.commit()
     cursor.close()
+    remove_material(conn, mat)
 
     flash("Material deleted successfully.", "success")
     return redirect(url_for("faculty_my_materials"))
@@ -1554,13 +1446,7 @@ def faculty_semesters(dept_id):
     if current_user.role != 'faculty':
         return jsonify({"error": "Access denied"}), 403
 
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        "SELECT * FROM semesters WHERE department_id=%s", (dept_id,)
-    )
-    semesters = cursor.fetchall()
-    cursor.close()
+    semesters = catalog.get().semesters_of(dept_id)
     return jsonify({"semesters": [dict(row) for row in semesters]})
 
 
@@ -1570,27 +1456,29 @@ def faculty_subjects(semester_id):
     if current_user.role != 'faculty':
         return jsonify({"error": "Access denied"}), 403
 
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        "SELECT * FROM subjects WHERE semester_id=%s", (semester_id,)
-    )
-    subjects = cursor.fetchall()
-    cursor.close()
+    subjects = catalog.get().subjects_of(semester_id)
     return jsonify({"subjects": [dict(row) for row in subjects]})
 
 
 @app.route('/faculty/upload', methods=['GET', 'POST'])
 @login_required
+@accepts_bulk
 def faculty_upload():
     if current_user.role != 'faculty':
         flash("Access denied.", "danger")
         return redirect(url_for("index"))
 
+    departments = catalog.get().departments
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM departments')
-    departments = cursor.fetchall()
+
+    if request.method == 'POST' and is_bulk(request.files):
+        cursor.close()
+        report, error = bulk_upload(conn, request.form, request.files, current_user.id)
+        if error:
+            flash(error, 'warning')
+            return redirect(request.url)
+        return render_template('faculty_upload.html', departments=departments, report=report)
 
     if request.method == 'POST':
         department_id = request.form.get('department')
@@ -1603,17 +1491,10 @@ def faculty_upload():
             flash('Please select department, semester, subject, and a valid file.', 'warning')
             return redirect(request.url)
 
-        original_filename = file.filename
-        saved_filename = f"{subject_id}_{secure_filename(original_filename)}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], saved_filename)
-        file.save(filepath)
-
-        cursor.execute(
-            'INSERT INTO materials (subject_id, filename, original_filename, uploader_id) VALUES (%s, %s, %s, %s)',
-            (subject_id, saved_filename, original_filename, current_user.id)
-        )
+        save_material(conn, file, subject_id, current_user.id)
         conn.commit()
         cursor.close()
+        versions.expire()
         flash('Material uploaded successfully!', 'success')
         return redirect(url_for('faculty_my_materials'))
 
@@ -1621,6 +1502,152 @@ def faculty_upload():
     return render_template('faculty_upload.html', departments=departments)
 
 
+@app.errorhandler(RequestEntityTooLarge)
+@app.errorhandler(UnsupportedMediaType)
+def upload_rejected(e):
+    if request.path.startswith('/api/'):
+        return jsonify({'error': e.description}), e.code
+    flash(e.description, 'danger')
+    return redirect(request.url)
+
+
+# == RESUMABLE UPLOADS ==
+# Protocol in resumable_uploads.py: create a session, send numbered chunks
+# (in any order, retry freely), poll progress, then complete.
+@app.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify({'error': e.message}), e.status
+
+
+def _load_upload_session(cursor, session_id):
+    if current_user.role not in ('faculty', 'admin'):
+        raise UploadError('Access denied', 403)
+    session = resumable_uploads.get_session(cursor, session_id)
+    if session is None or session['uploader_id'] != current_user.id:
+        raise UploadError('Upload session not found', 404)
+    return session
+
+
+def _upload_headers(info):
+    return {'Upload-Offset': str(info['offset']), 'Upload-Length': str(info['size']),
+            'Cache-Control': 'no-store'}
+
+
+@app.route('/api/uploads', methods=['POST'])
+@login_required
+def create_upload():
+    if current_user.role not in ('faculty', 'admin'):
+        raise UploadError('Access denied', 403)
+    data = request.get_json(silent=True) or request.form
+    filename = (data.get('filename') or '').strip()
+    try:
+        subject_id = int(data.get('subject_id') or data.get('subject'))
+        size = int(data.get('size'))
+        chunk_size = int(data.get('chunk_size') or resumable_uploads.DEFAULT_CHUNK_SIZE)
+    except (TypeError, ValueError):
+        raise UploadError("'subject_id', 'size' and 'chunk_size' must be integers")
+    if not allowed_file(filename):
+        raise UploadError('Missing or unsupported file name')
+    if catalog.get().subject(subject_id) is None:
+        raise UploadError('Unknown subject', 404)
+    if not 0 <= size <= resumable_uploads.MAX_UPLOAD_SIZE:
+        raise UploadError(f"Uploads are limited to {resumable_uploads.MAX_UPLOAD_SIZE} bytes", 413)
+    limit = upload_limit(current_user.role, file_extension(filename))
+    if size > limit:
+        raise UploadError(f"Uploads of this type are limited to {limit} bytes", 413)
+
+    conn = get_db()
+    cursor = conn.cursor()
+    resumable_uploads.expire_sessions(cursor)
+    session_id = resumable_uploads.create_session(cursor, current_user.id, subject_id, filename, size, chunk_size)
+    conn.commit()
+    info = resumable_uploads.progress(cursor, resumable_uploads.get_session(cursor, session_id))
+    cursor.close()
+    response = jsonify(info)
+    response.status_code = 201
+    response.headers.update(_upload_headers(info))
+    response.headers['Location'] = url_for('upload_status', session_id=session_id)
+    return response
+
+
+@app.route('/api/uploads/<session_id>', methods=['GET', 'HEAD'])
+@login_required
+def upload_status(session_id):
+    cursor = get_db().cursor()
+    info = resumable_uploads.progress(cursor, _load_upload_session(cursor, session_id))
+    cursor.close()
+    response = jsonify(info)
+    response.headers.update(_upload_headers(info))
+    return response
+
+
+@app.route('/api/uploads/<session_id>/chunks/<int:number>', methods=['PUT', 'PATCH'])
+@app.route('/api/uploads/<session_id>', methods=['PATCH'])
+@login_required
+def upload_chunk(session_id, number=None):
+    conn = get_db()
+    cursor = conn.cursor()
+    session = _load_upload_session(cursor, session_id)
+    offset = request.headers.get('Upload-Offset', type=int)
+    if number is None:
+        # plain tus PATCH: the chunk follows from a chunk-aligned offset
+        if offset is None or offset % session['chunk_size']:
+            raise UploadError('PATCH needs an Upload-Offset at a chunk boundary', 409)
+        number = offset // session['chunk_size']
+    try:
+        resumable_uploads.write_chunk(
+            cursor, session, number, request.stream, request.content_length, offset,
+            resumable_uploads.parse_checksum(request.headers.get('Upload-Checksum')),
+            limit=upload_limit(current_user.role, file_extension(session['original_filename']))
+        )
+    finally:
+        conn.commit()
+    info = resumable_uploads.progress(cursor, session)
+    cursor.close()
+    return '', 204, _upload_headers(info)
+
+
+@app.route('/api/uploads/<session_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(session_id):
+    conn = get_db()
+    cursor = conn.cursor()
+    session = _load_upload_session(cursor, session_id)
+    info = resumable_uploads.progress(cursor, session)
+    if not info['complete']:
+        raise UploadError(f"Chunks still missing: {info['missing_chunks'][:20]}", 409)
+
+    part = resumable_uploads.part_path(session_id)
+    sha256, size = hash_file(part)
+    expected = (request.get_json(silent=True) or {}).get('sha256')
+    if expected and expected.lower() != sha256:
+        raise UploadError('Checksum of the assembled file does not match', 460)
+
+    store_file(cursor, part, sha256, size)
+    uploader_id = current_user.id if current_user.role == 'faculty' else None
+    material_id = insert_material(cursor, session['subject_id'], session['original_filename'], sha256, uploader_id)
+    bump_versions(cursor, 'materials')
+    queue_preview(cursor, sha256, session['original_filename'])
+    index_material(cursor, material_id)
+    resumable_uploads.delete_session(cursor, session_id, keep_file=True)  # the part file became the blob
+    conn.commit()
+    cursor.close()
+    versions.expire()
+    return jsonify({'material_id': material_id, 'sha256': sha256, 'size': size}), 201
+
+
+@app.route('/api/uploads/<session_id>', methods=['DELETE'])
+@login_required
+def cancel_upload(session_id):
+    conn = get_db()
+    cursor = conn.cursor()
+    _load_upload_session(cursor, session_id)
+    resumable_uploads.delete_session(cursor, session_id)
+    conn.commit()
+    cursor.close()
+    return '', 204
+
+
 # == QUESTION/ANSWER SYSTEM ==
 @app.route("/ask/<int:material_id>", methods=["POST"])
 @login_required
@@ -1652,6 +1679,9 @@ def ask_question(material_id):
         INSERT INTO messages (material_id, sender_id, receiver_id, encrypted_message)
         VALUES (%s, %s, %s, %s)
     """, (material_id, current_user.id, receiver_id, encrypted_msg))
+    message_id = cursor.lastrowid
+    assign_thread_path(cursor, message_id)
+    index_message(cursor, message_id, encrypted_msg)
     conn.commit()
     cursor.close()
 
@@ -1670,37 +1700,66 @@ def faculty_questions():
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
 
-    # fetch top-level questions
-    cursor.execute("""
+    query = (request.args.get('q') or '').strip()
+    terms = query_terms(query)
+    if terms:
+        # threads this user received with a matching question or reply, best match highlighted
+        sql, params = search_threads_sql(terms, receiver_id=current_user.id)
+        page = paginate(cursor, sql, params, THREAD_SEARCH_KEYS)
+        cursor.close()
+        results = [dict(row, highlight=highlight(row['match_body'], terms)) for row in page.items]
+        return render_template("faculty_questions.html", results=results, query=query, page=page)
+
+    # fetch one page of top-level questions
+    page = paginate(cursor, """
         SELECT m.id, m.encrypted_message, m.created_at,
                s.name AS student_name, mat.original_filename AS file_name
         FROM messages m
         JOIN users s   ON m.sender_id = s.id
         JOIN materials mat ON m.material_id = mat.id
-        WHERE m.receiver_id = %s AND m.reply_to IS NULL
-        ORDER BY m.created_at DESC
-    """, (current_user.id,))
-    questions = cursor.fetchall()
+        WHERE m.receiver_id = %s AND m.reply_to IS NULL AND {keyset}
+    """, (current_user.id,), [('m.created_at', 'created_at'), ('m.id', 'id')])
+    questions = page.items
 
     # attach replies
+    replies = fetch_replies(cursor, [q["id"] for q in questions])
     q_list = []
     for q in questions:
-        cursor.execute("""
-            SELECT r.id, r.encrypted_message, r.created_at,
-                   u.name AS sender_name
-            FROM messages r
-            JOIN users u ON r.sender_id = u.id
-            WHERE r.reply_to = %s
-            ORDER BY r.created_at ASC
-        """, (q["id"],))
-        replies = cursor.fetchall()
-
         q_dict = dict(q)
-        q_dict["replies"] = [dict(r) for r in replies]
+        q_dict["replies"] = [dict(r) for r in replies[q["id"]]]
         q_list.append(q_dict)
 
     cursor.close()
-    return render_template("faculty_questions.html", questions=q_list)
+    return render_template("faculty_questions.html", questions=q_list, page=page, query=query)
+
+
+@app.route('/api/questions/search')
+@login_required
+def api_search_questions():
+    """Search Q&A threads of a material or subject, or (faculty/admin) the threads sent to you."""
+    terms = query_terms(request.args.get('q'))
+    if not terms:
+        return jsonify({'error': "Missing search query 'q'"}), 400
+    material_id = request.args.get('material_id', type=int)
+    subject_id = request.args.get('subject_id', type=int)
+    receiver_id = None
+    if material_id is None and subject_id is None:
+        if current_user.role not in ('faculty', 'admin'):
+            return jsonify({'error': 'Pass material_id or subject_id'}), 400
+        receiver_id = current_user.id  # same visibility as /faculty/questions
+
+    sql, params = search_threads_sql(terms, receiver_id, material_id, subject_id)
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    page = paginate(cursor, sql, params, THREAD_SEARCH_KEYS)
+    cursor.close()
+    data = [{
+        'thread_id': t['thread_id'], 'material_id': t['material_id'], 'subject_id': t['subject_id'],
+        'file_name': t['file_name'], 'student_name': t['student_name'], 'created_at': t['created_at'],
+        'question': b64decode_filter(t['encrypted_message']), 'match_id': t['match_id'],
+        'highlight': str(highlight(t['match_body'], terms)), 'score': round(t['score'], 4),
+    } for t in page.items]
+    return paged_json(data, page)
 
 
 # Faculty/Admin → reply
@@ -1719,7 +1778,7 @@ def reply_question(msg_id):
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
     cursor.execute(
-        "SELECT sender_id, material_id FROM messages WHERE id=%s",
+        "SELECT sender_id, material_id, root_id, thread_path, depth FROM messages WHERE id=%s",
         (msg_id,)
     )
     parent = cursor.fetchone()
@@ -1727,11 +1786,18 @@ def reply_question(msg_id):
         cursor.close()
         flash("Original message not found.")
         return redirect(url_for("faculty_questions"))
+    if parent["depth"] + 1 > MAX_THREAD_DEPTH:
+        cursor.close()
+        flash("This conversation is nested too deeply to reply here.")
+        return redirect(url_for("faculty_questions"))
 
     cursor.execute("""
         INSERT INTO messages (material_id, sender_id, receiver_id, encrypted_message, reply_to)
         VALUES (%s, %s, %s, %s, %s)
     """, (parent["material_id"], current_user.id, parent["sender_id"], encrypted_msg, msg_id))
+    reply_id = cursor.lastrowid
+    assign_thread_path(cursor, reply_id, parent)
+    index_message(cursor, reply_id, encrypted_msg)
     conn.commit()
     cursor.close()
 
@@ -1739,5 +1805,327 @@ def reply_question(msg_id):
     return redirect(url_for("faculty_questions"))
 
 
+# == MAINTENANCE COMMANDS ==
+LOAD_MORE_RE = re.compile(r'data-load-more-wrap="[^"]+">\s*<a href="([^"]+)"')
+
+
+@app.cli.command('db-upgrade')
+@click.option('--to', 'target', type=int, default=LATEST_VERSION, show_default=True,
+              help='Stop after this migration version.')
+def db_upgrade_command(target):
+    """Apply pending schema migrations (run once per deploy, before the workers start)."""
+    applied = upgrade_db(target)
+    if applied is None:
+        raise click.ClickException('Could not create the database')
+    if applied:
+        click.echo(f"Migrated to version {applied[-1]}")
+    else:
+        click.echo('Schema already up to date')
+
+
+@app.cli.command('db-status')
+def db_status_command():
+    """Show the schema version and the migrations still to apply."""
+    with pool.connection() as conn:
+        version = schema_version(conn)
+    click.echo(f"Schema version {version} (latest {LATEST_VERSION})")
+    for number, description, _ in pending_migrations(version):
+        click.echo(f"  pending {number}: {description}")
+
+
+@app.cli.command('sync-curriculum')
+@click.option('--force', is_flag=True, help='Diff against the database even if the file hash is unchanged.')
+@click.option('--dry-run', is_flag=True, help='Show what would change without applying it.')
+def sync_curriculum_command(force, dry_run):
+    """Apply curriculum.json to the department/semester/subject tables."""
+    curriculum, digest = load_curriculum()
+    with pool.connection() as conn:
+        changes = sync_curriculum(conn, force=force, dry_run=dry_run)
+        if changes and not dry_run:
+            record_change(conn, 'catalog')
+            catalog.refresh(conn)
+    if changes is None:
+        click.echo(f"Curriculum version {curriculum.get('version')} ({digest[:12]}) already applied")
+        return
+    for subject_id, old, new in changes.renamed:
+        click.echo(f"  rename subject {subject_id}: {old!r} -> {new!r}")
+    for subject_id, name in changes.kept:
+        click.echo(f"  keep unlisted subject {subject_id} {name!r} (has materials)")
+    prefix = 'Would apply' if dry_run else 'Applied'
+    click.echo(f"{prefix} curriculum version {curriculum.get('version')}: {changes.summary()}")
+
+
+@app.cli.command('import-legacy-uploads')
+def import_legacy_uploads_command():
+    """Move files stored by name in the uploads folder into the blob store."""
+    imported = missing = 0
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT filename, COUNT(*) FROM materials WHERE blob_sha256 IS NULL GROUP BY filename')
+        for filename, references in cursor.fetchall():
+            legacy_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            if not os.path.isfile(legacy_path):
+                click.echo(f"  missing file for {filename!r} ({references} materials)")
+                missing += 1
+                continue
+            with open(legacy_path, 'rb') as f:
+                sha256, size, temp_path = blob_store.write(f)
+            for _ in range(references):
+                add_reference(cursor, sha256, size)
+            blob_store.place(temp_path, sha256)
+            cursor.execute('UPDATE materials SET blob_sha256=%s WHERE filename=%s AND blob_sha256 IS NULL',
+                           (sha256, filename))
+            conn.commit()
+            os.remove(legacy_path)
+            imported += 1
+        cursor.close()
+    click.echo(f"Imported {imported} files into the blob store, {missing} missing")
+
+
+@app.cli.command('gc-blobs')
+@click.option('--grace', type=int, default=GC_GRACE_SECONDS, show_default=True,
+              help='Leave files younger than this many seconds alone.')
+def gc_blobs_command(grace):
+    """Recount blob references and delete stored files nothing uses."""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        removed = collect_garbage(cursor, grace)
+        previews = collect_preview_garbage(cursor)
+        conn.commit()
+        cursor.close()
+    click.echo(f"Removed {removed} unreferenced files and {previews} previews")
+
+
+@app.cli.command('gc-uploads')
+@click.option('--ttl', type=int, default=resumable_uploads.UPLOAD_SESSION_TTL, show_default=True,
+              help='Remove upload sessions idle for longer than this many seconds.')
+def gc_uploads_command(ttl):
+    """Delete abandoned resumable upload sessions and their partial files."""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        removed = resumable_uploads.expire_sessions(cursor, ttl)
+        conn.commit()
+        cursor.close()
+    click.echo(f"Removed {removed} abandoned upload sessions")
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress the static files for /assets/ URLs."""
+    manifest = build_assets(app.static_folder, echo=click.echo)
+    click.echo(f"Built {len(manifest)} assets in {os.path.join(app.static_folder, 'dist')}")
+
+
+@app.cli.command('run-jobs')
+@click.option('--once', is_flag=True, help='Exit when the queue is empty instead of waiting for new jobs.')
+def run_jobs_command(once):
+    """Run background jobs (previews) in this process; set JOB_WORKERS=0 on the web workers to use only these."""
+    try:
+        work(once=once)
+    except KeyboardInterrupt:
+        pass
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        counts = queue_counts(cursor)
+        cursor.close()
+    click.echo('Jobs: ' + (', '.join(f"{n} {status}" for status, n in sorted(counts.items())) or 'none'))
+
+
+@app.cli.command('queue-previews')
+def queue_previews_command():
+    """Queue preview jobs for stored materials that have no preview yet."""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        queued = queue_missing_previews(cursor)
+        conn.commit()
+        cursor.close()
+    click.echo(f"Queued {queued} preview jobs")
+
+
+@app.cli.command('reindex-search')
+@click.option('--workers', type=int, default=SEARCH_WORKERS, show_default=True,
+              help='Processes extracting document text.')
+@click.option('--names-only', is_flag=True, help='Index names, subjects and course codes without reading files.')
+def reindex_search_command(workers, names_only):
+    """Rebuild the material search index from the stored files."""
+    with pool.connection() as conn:
+        documents, extracted = rebuild_index(conn, workers, names_only, app.config['UPLOAD_FOLDER'], click.echo)
+    click.echo(f"Indexed {documents} materials, text extracted from {extracted} files")
+
+
+@app.cli.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', type=int, default=USER_IMPORT_WORKERS, show_default=True,
+              help='Processes hashing passwords.')
+def import_users_command(path, workers):
+    """Create users from a CSV or XLSX file with email, name, password, role and department columns."""
+    extension = path.rsplit('.', 1)[-1].lower()
+    if extension not in ('csv', 'xlsx'):
+        raise click.ClickException('Expected a .csv or .xlsx file')
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        with open(path, 'rb') as f:
+            import_id = create_import(cursor, f, os.path.basename(path), extension, queue=False)
+        conn.commit()
+        cursor.close()
+        progress = run_import(conn, import_id, department_names(conn), workers, click.echo)
+    for error in progress['errors']:
+        click.echo(f"  row {error['row']}: {error['email']} {error['error']}")
+    if progress['status'] == 'failed':
+        raise click.ClickException('Import failed')
+    click.echo(f"Created {progress['created']} users, skipped {progress['skipped']} of {progress['total']} rows")
+
+
+@app.cli.command('bench-login')
+@click.option('--sizes', default='1,2,4,8', show_default=True, help='Comma-separated password pool sizes to compare.')
+@click.option('--logins', type=int, default=100, show_default=True, help='Logins per pool size.')
+@click.option('--concurrency', type=int, default=32, show_default=True, help='Clients logging in at once.')
+def bench_login_command(sizes, logins, concurrency):
+    """Measure login throughput and page latency at several password pool sizes.
+
+    Run it against a scratch SQLite database:
+    DB_BACKEND=sqlite SQLITE_PATH=/tmp/bench.db flask --app college_app bench-login
+    """
+    if backend.name != 'sqlite':
+        raise click.ClickException('bench-login adds a test user; run it on a scratch SQLite database')
+
+    upgrade_db()
+    email, password = 'bench-login@college.local', 'bench-login-password'
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('INSERT IGNORE INTO users (email, password_hash, role, name) VALUES (%s, %s, %s, %s)',
+                       (email, generate_password_hash(password, PASSWORD_HASH_METHOD), 'student', 'Bench Login'))
+        conn.commit()
+        cursor.close()
+
+    def log_in(_):
+        started = time.perf_counter()
+        response = app.test_client().post('/login', data={'email': email, 'password': password, 'role': 'student'})
+        return response.status_code, time.perf_counter() - started
+
+    def browse(stop, timings):
+        # a cheap route fetched meanwhile: its latency shows whether logins starve other requests
+        client = app.test_client()
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get('/api/departments')
+            timings.append(time.perf_counter() - started)
+
+    def ms(timings, fraction):
+        return f"{1000 * sorted(timings)[int(fraction * (len(timings) - 1))]:.1f}" if timings else '-'
+
+    click.echo(f"{logins} logins, {concurrency} concurrent, hash method {PASSWORD_HASH_METHOD}")
+    click.echo('pool  logins/s  login p50/p95 ms  busy (503)  page p50/p95 ms')
+    for size in [int(value) for value in sizes.split(',')]:
+        configure_pool(size)
+        stop, page_timings = threading.Event(), []
+        browser = threading.Thread(target=browse, args=(stop, page_timings))
+        browser.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(log_in, range(logins)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        browser.join()
+        ok = [seconds for status, seconds in results if status == 302]
+        busy = sum(1 for status, _ in results if status == 503)
+        click.echo(f"{size:>4}  {len(ok) / elapsed:>8.1f}  {ms(ok, 0.5):>7}/{ms(ok, 0.95):<8}  {busy:>10}  "
+                   f"{ms(page_timings, 0.5):>7}/{ms(page_timings, 0.95)}")
+
+
+@app.cli.command('check-query-plans')
+@click.option('--seed/--no-seed', default=True, help='Load the benchmark dataset first.')
+def check_query_plans_command(seed):
+    """Replay the main routes on the benchmark dataset and fail on full table scans.
+
+    Run it against a scratch SQLite database:
+    DB_BACKEND=sqlite SQLITE_PATH=/tmp/bench.db flask --app college_app check-query-plans
+    """
+    if backend.name != 'sqlite':
+        raise click.ClickException('check-query-plans records queries on the SQLite backend; set DB_BACKEND=sqlite')
+
+    upgrade_db()
+    scratch = tempfile.mkdtemp(prefix='query-plans-')
+    # the benchmark's blob files go to a scratch store, not the real uploads folder
+    blob_store.root, blob_store.tmp_dir = scratch, os.path.join(scratch, 'tmp')
+    try:
+        failures, statements, errors = _check_query_plans(seed)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    for path, status in errors:
+        click.echo(f'WARNING: {path} answered {status}; only the queries before the error were checked')
+    for sql, plan in failures:
+        click.echo('FULL SCAN: ' + ' '.join(sql.split()))
+        for _, detail in plan:
+            click.echo(f'    {detail}')
+    click.echo(f'{len(statements)} statements checked, {len(failures)} full table scans')
+    if failures:
+        raise SystemExit(1)
+
+
+def _check_query_plans(seed):
+    """Seed (optionally) and replay the routes; return (full scans, statements, [(path, status)] errors)."""
+    with pool.connection() as conn:
+        if seed:
+            seed_benchmark_data(conn)
+            conn.cursor().execute('ANALYZE')
+            conn.commit()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT id, role FROM users WHERE role IN ('admin', 'student') ORDER BY id")
+        role_users = {row['role']: row['id'] for row in cursor.fetchall()}
+        cursor.execute('SELECT uploader_id, COUNT(*) AS n FROM materials GROUP BY uploader_id ORDER BY n DESC LIMIT 1')
+        faculty_id = cursor.fetchone()['uploader_id']
+        cursor.execute('SELECT subject_id, COUNT(*) AS n FROM materials GROUP BY subject_id ORDER BY n DESC LIMIT 1')
+        subject_id = cursor.fetchone()['subject_id']
+        cursor.execute('SELECT id, filename FROM materials WHERE subject_id=%s LIMIT 1', (subject_id,))
+        material = cursor.fetchone()
+        cursor.close()
+
+    urls = {
+        None: ['/', '/events', '/events/1', '/department/1/achievements',
+               f'/api/materials/{subject_id}?limit=5', f'/api/materials?subject_ids={subject_id},1,2',
+               '/api/search?q=bench&limit=5', '/api/search?q=bench+pdf&department_id=1&limit=5',
+               f'/uploads/{material["filename"]}'],
+        role_users.get('admin'): ['/admin/dashboard', '/admin/users', '/admin/students',
+                                  '/admin/students?department=CSE', '/api/user-imports/1'],
+        faculty_id: ['/faculty/dashboard', '/faculty/my-materials', '/faculty/questions',
+                     '/faculty/questions?q=question&limit=5'],
+        role_users.get('student'): ['/student/dashboard', f'/materials/{subject_id}',
+                                    f'/download/{material["id"]}', f'/materials/preview/{material["id"]}',
+                                    f'/api/questions/search?q=answer&subject_id={subject_id}&limit=5',
+                                    f'/materials/{subject_id}/download.zip', '/semesters/1/download.zip',
+                                    f'/materials/download.zip?ids={material["id"]},1,2'],
+    }
+
+    errors = []
+    with record_queries() as statements:
+        for user_id, paths in urls.items():
+            client = app.test_client()
+            if user_id is not None:
+                with client.session_transaction() as sess:
+                    sess['_user_id'] = str(user_id)
+            for path in paths:
+                # a fresh app context per request, so g (login, db connection) is not
+                # shared through the context the CLI runs in
+                with app.app_context():
+                    response = client.get(path)
+                    body = response.get_data().decode('utf-8', 'replace')  # runs streamed (ZIP) bodies too
+                    if response.status_code >= 400:
+                        errors.append((path, response.status_code))
+                # follow one "next page" link so keyset conditions are checked too
+                next_url = response.headers.get('Link', '').partition('>')[0].lstrip('<')
+                match = LOAD_MORE_RE.search(body)
+                if match:
+                    next_url = match.group(1).replace('&amp;', '&')
+                if next_url:
+                    with app.app_context():
+                        client.get(next_url)
+
+    with pool.connection() as conn:
+        return find_full_scans(conn, statements), statements, errors
+
+
 if __name__ == "__main__":
+    # the development server migrates itself; deployments run `flask db-upgrade`
+    upgrade_db()
     app.run(debug=True)
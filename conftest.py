@@ -0,0 +1,40 @@
+"""Shared test setup.
+
+The app modules read their settings from the environment when they are
+first imported, so before any test module imports them this points them at
+a throwaway SQLite database and working directory (uploads, imports), keeps
+the background job threads off and makes password hashing cheap.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+import pytest
+
+WORK_DIR = tempfile.mkdtemp(prefix='college-tests-')
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+os.environ['DB_BACKEND'] = 'sqlite'
+os.environ['SQLITE_PATH'] = os.path.join(WORK_DIR, 'college.db')
+os.environ['JOB_WORKERS'] = '0'
+os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+os.chdir(WORK_DIR)
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The application on a migrated database holding the sample users."""
+    import college_app
+    college_app.upgrade_db()
+    return college_app.app
+
+
+@pytest.fixture
+def login(app):
+    """``login(email, password, role)`` -> a test client signed in through the login form."""
+    def login(email, password, role):
+        client = app.test_client()
+        response = client.post('/login', data={'email': email, 'password': password, 'role': role})
+        assert response.status_code == 302, response.get_data(as_text=True)
+        return client
+    return login
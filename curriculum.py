@@ -0,0 +1,195 @@
+"""Sync the department -> semester -> subject catalog from curriculum.json.
+
+The curriculum lives in a versioned data file instead of code. Syncing
+reads the current catalog with a few bulk queries, works out the
+difference and applies only that, in batched statements:
+
+- departments, semesters and subjects missing from the database are inserted;
+- a subject whose course code (e.g. ``CS3351``) is still listed in the same
+  semester under a new name is renamed in place, keeping its materials;
+- subjects no longer listed are removed unless materials were uploaded to
+  them, and semesters left without subjects are removed.
+
+Departments are never removed: users and events refer to them. The SHA-256
+of the file is stored in ``app_meta`` once applied, so a boot with an
+unchanged curriculum costs one indexed lookup.
+"""
+import hashlib
+import json
+import os
+import re
+
+from database_config import backend
+
+CURRICULUM_PATH = os.environ.get(
+    'CURRICULUM_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'curriculum.json')
+)
+CURRICULUM_LOCK = 'college_db_curriculum'
+CURRICULUM_LOCK_TIMEOUT = 60  # seconds
+HASH_KEY = 'curriculum_hash'
+DELETE_BATCH_SIZE = 500
+
+COURSE_CODE_RE = re.compile(r'^([A-Z]{2,4}\d{3,4})\b')
+
+
+def course_code(subject_name):
+    match = COURSE_CODE_RE.match(subject_name)
+    return match.group(1) if match else None
+
+
+def load_curriculum(path=CURRICULUM_PATH):
+    """Return (curriculum, sha256 hex digest of its canonical form)."""
+    with open(path, encoding='utf-8') as f:
+        curriculum = json.load(f)
+    canonical = json.dumps(curriculum, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return curriculum, hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def get_meta(cursor, name):
+    cursor.execute('SELECT value FROM app_meta WHERE name=%s', (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def set_meta(cursor, name, value):
+    cursor.execute('DELETE FROM app_meta WHERE name=%s', (name,))
+    cursor.execute('INSERT INTO app_meta (name, value) VALUES (%s, %s)', (name, value))
+
+
+class CurriculumChanges:
+    def __init__(self):
+        self.departments = []       # names inserted
+        self.semesters = []         # (department, semester) inserted
+        self.subjects = []          # (semester_id, name) inserted
+        self.renamed = []           # (subject_id, old name, new name)
+        self.removed = []           # subject ids deleted
+        self.removed_semesters = []
+        self.kept = []              # (subject_id, name) unlisted but holding materials
+
+    def __bool__(self):
+        return bool(self.departments or self.semesters or self.subjects or self.renamed
+                    or self.removed or self.removed_semesters)
+
+    def summary(self):
+        return (f"{len(self.departments)} departments, {len(self.semesters)} semesters and "
+                f"{len(self.subjects)} subjects added, {len(self.renamed)} subjects renamed, "
+                f"{len(self.removed)} subjects and {len(self.removed_semesters)} semesters removed, "
+                f"{len(self.kept)} unlisted subjects kept for their materials")
+
+
+def _read_catalog(cursor):
+    cursor.execute('SELECT id, name FROM departments')
+    departments = {name: dept_id for dept_id, name in cursor.fetchall()}
+    cursor.execute('SELECT id, name, department_id FROM semesters')
+    semesters = {(dept_id, name): sem_id for sem_id, name, dept_id in cursor.fetchall()}
+    return departments, semesters
+
+
+def _delete_ids(cursor, table, ids):
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        batch = ids[start:start + DELETE_BATCH_SIZE]
+        cursor.execute(f"DELETE FROM {table} WHERE id IN ({','.join(['%s'] * len(batch))})", batch)
+
+
+def apply_curriculum(cursor, departments):
+    """Bring the catalog tables in line with ``departments`` ({dept: {semester: [subject, ...]}})."""
+    changes = CurriculumChanges()
+    db_departments, db_semesters = _read_catalog(cursor)
+
+    changes.departments = [name for name in departments if name not in db_departments]
+    changes.semesters = [(dept, sem) for dept, sems in departments.items() for sem in sems
+                         if (db_departments.get(dept), sem) not in db_semesters]
+    if changes.departments:
+        cursor.executemany('INSERT IGNORE INTO departments (name) VALUES (%s)',
+                           [(name,) for name in changes.departments])
+        db_departments, db_semesters = _read_catalog(cursor)
+    if changes.semesters:
+        cursor.executemany('INSERT IGNORE INTO semesters (name, department_id) VALUES (%s, %s)',
+                           [(sem, db_departments[dept]) for dept, sem in changes.semesters])
+        db_departments, db_semesters = _read_catalog(cursor)
+
+    # desired subjects per semester id; semesters missing from the file keep none
+    wanted = {sem_id: [] for (dept_id, _), sem_id in db_semesters.items()
+              if dept_id in {db_departments[d] for d in departments}}
+    for dept, sems in departments.items():
+        for sem, subjects in sems.items():
+            wanted[db_semesters[(db_departments[dept], sem)]] = list(dict.fromkeys(subjects))
+
+    existing = {sem_id: {} for sem_id in wanted}
+    cursor.execute('SELECT id, name, semester_id FROM subjects')
+    for subject_id, name, sem_id in cursor.fetchall():
+        if sem_id in existing:
+            existing[sem_id][name] = subject_id
+    cursor.execute('SELECT DISTINCT subject_id FROM materials WHERE subject_id IS NOT NULL')
+    in_use = {row[0] for row in cursor.fetchall()}
+
+    emptied = []
+    for sem_id, names in wanted.items():
+        current = existing[sem_id]
+        missing = [name for name in names if name not in current]
+        extra = {name: subject_id for name, subject_id in current.items() if name not in names}
+        extra_by_code = {}
+        for name, subject_id in extra.items():
+            if course_code(name):
+                extra_by_code.setdefault(course_code(name), []).append(name)
+
+        for name in missing:
+            candidates = extra_by_code.get(course_code(name)) if course_code(name) else None
+            if candidates:
+                old = candidates.pop(0)
+                changes.renamed.append((extra.pop(old), old, name))
+            else:
+                changes.subjects.append((sem_id, name))
+
+        for name, subject_id in extra.items():
+            if subject_id in in_use:
+                changes.kept.append((subject_id, name))
+            else:
+                changes.removed.append(subject_id)
+        if not names and not any(subject_id in in_use for subject_id in extra.values()):
+            emptied.append(sem_id)
+
+    if changes.renamed:
+        cursor.executemany('UPDATE subjects SET name=%s WHERE id=%s',
+                           [(new, subject_id) for subject_id, _, new in changes.renamed])
+    if changes.subjects:
+        cursor.executemany('INSERT IGNORE INTO subjects (name, semester_id) VALUES (%s, %s)',
+                           [(name, sem_id) for sem_id, name in changes.subjects])
+    _delete_ids(cursor, 'subjects', changes.removed)
+    changes.removed_semesters = emptied
+    _delete_ids(cursor, 'semesters', emptied)
+    return changes
+
+
+def sync_curriculum(conn, path=CURRICULUM_PATH, force=False, dry_run=False):
+    """Apply curriculum.json if it changed since the last sync.
+
+    Returns the CurriculumChanges, or None when the stored hash already
+    matches the file. With ``dry_run`` the changes are computed and rolled back.
+    """
+    curriculum, digest = load_curriculum(path)
+    cursor = conn.cursor()
+    try:
+        if not force and get_meta(cursor, HASH_KEY) == digest:
+            return None
+        conn.rollback()  # start the locked section on a fresh snapshot
+        backend.acquire_lock(cursor, CURRICULUM_LOCK, CURRICULUM_LOCK_TIMEOUT)
+        try:
+            # another worker may have synced while we waited for the lock
+            if not force and get_meta(cursor, HASH_KEY) == digest:
+                conn.rollback()
+                return None
+            changes = apply_curriculum(cursor, curriculum['departments'])
+            if dry_run:
+                conn.rollback()
+            else:
+                set_meta(cursor, HASH_KEY, digest)
+                conn.commit()
+            return changes
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            backend.release_lock(cursor, CURRICULUM_LOCK)
+    finally:
+        cursor.close()
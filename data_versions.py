@@ -0,0 +1,84 @@
+"""Version counters that tell caches when shared data changed.
+
+The ``data_versions`` table holds one counter per kind of data (``events``,
+``achievements``, ``catalog``...). Code that changes that data calls
+``bump_versions(cursor, name)`` in the same transaction, commits and then
+``versions.expire()`` (skipping it only delays this process like the
+others). A cache stores the counters its entry was built from and the
+entry is stale as soon as one of them moved.
+
+Reading the counters is one query on a tiny table, made at most once every
+DATA_VERSION_INTERVAL seconds per process: the process that committed a
+change sees it at once, other worker processes within that interval.
+"""
+import os
+import threading
+import time
+
+from catalog import catalog
+from database_config import get_db
+
+DATA_VERSION_INTERVAL = float(os.environ.get('DATA_VERSION_INTERVAL', 1))  # seconds
+
+
+def bump_versions(cursor, *names):
+    """Count a change to each of ``names``; the caller commits, then calls ``versions.expire()``."""
+    rows = [(name,) for name in names]
+    cursor.executemany('INSERT IGNORE INTO data_versions (name, version) VALUES (%s, 0)', rows)
+    cursor.executemany('UPDATE data_versions SET version = version + 1 WHERE name=%s', rows)
+
+
+class DataVersions:
+    def __init__(self, interval=DATA_VERSION_INTERVAL):
+        self.interval = interval
+        self._versions = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self, names, conn=None):
+        """The counters of ``names`` as a tuple (0 for data never changed)."""
+        versions = self._versions
+        if versions is None or time.monotonic() - self._loaded_at >= self.interval:
+            with self._lock:
+                if self._versions is None or time.monotonic() - self._loaded_at >= self.interval:
+                    self._versions = self._load(conn or get_db())
+                    self._loaded_at = time.monotonic()
+                versions = self._versions
+        return tuple(versions.get(name, 0) for name in names)
+
+    def expire(self):
+        """Re-read the counters on the next ``current()``; call it after committing a bump."""
+        with self._lock:
+            self._versions = None
+
+    @staticmethod
+    def _load(conn):
+        cursor = conn.cursor()
+        cursor.execute('SELECT name, version FROM data_versions')
+        versions = dict(cursor.fetchall())
+        cursor.close()
+        return versions
+
+
+versions = DataVersions()
+
+
+def data_state(names):
+    """The counters of ``names``, plus this process's catalog snapshot version if ``catalog`` is one of them.
+
+    Data served from the in-memory catalog changes when the snapshot is
+    reloaded, which can be after the counter moved.
+    """
+    state = versions.current(names)
+    if 'catalog' in names:
+        state += (catalog.get().version,)
+    return state
+
+
+def record_change(conn, *names):
+    """Bump ``names`` in a transaction of its own, for changes committed elsewhere (e.g. a catalog sync)."""
+    cursor = conn.cursor()
+    bump_versions(cursor, *names)
+    conn.commit()
+    cursor.close()
+    versions.expire()
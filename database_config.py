@@ -1,4 +1,13 @@
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
 import mysql.connector
+from flask import g
 from mysql.connector import Error
 
 DB_CONFIG = {
@@ -7,11 +16,31 @@ DB_CONFIG = {
     'password': '2005',
     'database': 'college_db',
     'auth_plugin': 'caching_sha2_password',
-    'raise_on_warnings': True,
+    'raise_on_warnings': False,  # startup DDL/seeding relies on IF NOT EXISTS / INSERT IGNORE warnings
     'use_unicode': True,
     'charset': 'utf8mb4'
 }
 
+# Storage engine: 'mysql' (default) or 'sqlite'
+DB_BACKEND = os.environ.get('DB_BACKEND', 'mysql').lower()
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'college.db')
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',        # readers never block the writer
+    'synchronous': 'NORMAL',      # durable at checkpoints, safe with WAL
+    'foreign_keys': 'ON',
+    'busy_timeout': 5000,         # ms to wait on a locked database
+    'temp_store': 'MEMORY',
+    'cache_size': -20000,         # ~20MB page cache per connection
+    'mmap_size': 128 * 1024 * 1024,
+}
+
+# Pool tuning (override through the environment)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))          # seconds to wait for a free connection
+DB_POOL_RECYCLE = float(os.environ.get('DB_POOL_RECYCLE', 1800))       # reconnect connections older than this
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', 30))   # ping idle connections on checkout
+
+
 def create_database_if_not_exists():
     """Create the database if it doesn't exist"""
     try:
@@ -30,11 +59,413 @@ def create_database_if_not_exists():
         print(f"Error creating database: {e}")
         return False
 
-def get_db_connection():
-    """Get a MySQL database connection"""
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
+
+class PoolTimeout(Error):
+    """Raised when no connection becomes free within DB_POOL_TIMEOUT."""
+
+
+class LockTimeout(Error):
+    """Raised when a named database lock is not granted in time."""
+
+
+class ConnectionPool:
+    """A small thread-safe pool of MySQL connections.
+
+    Connections are created lazily up to ``size``. On checkout a connection
+    that has been idle for a while is pinged, and one that is too old or
+    fails the ping is replaced by a fresh connection.
+    """
+
+    def __init__(self, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                 recycle=DB_POOL_RECYCLE, ping_after=DB_POOL_PING_AFTER, **connect_args):
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self.connect_args = connect_args or DB_CONFIG
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.connect_args)
+        conn._pool_created_at = time.monotonic()
         return conn
-    except Error as e:
-        print(f"Error connecting to MySQL: {e}")
-        return None
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def _healthy(self, conn):
+        now = time.monotonic()
+        if now - conn._pool_created_at > self.recycle:
+            return False
+        if now - conn._pool_returned_at < self.ping_after:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    def acquire(self):
+        """Borrow a healthy connection, waiting up to ``timeout`` seconds."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = None
+
+            if conn is not None:
+                if self._healthy(conn):
+                    return conn
+                self._discard(conn)
+                continue
+
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._connect()
+                except Error:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PoolTimeout(msg=f"No free database connection after {self.timeout}s")
+            try:
+                conn = self._idle.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if self._healthy(conn):
+                return conn
+            self._discard(conn)
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back any open transaction."""
+        try:
+            conn.rollback()
+        except Error:
+            self._discard(conn)
+            return
+        conn._pool_returned_at = time.monotonic()
+        self._idle.put(conn)
+
+    def connection(self):
+        """Context manager for code running outside a request (startup, CLI)."""
+        return _PooledConnection(self)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+class _PooledConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+
+    def __enter__(self):
+        self.conn = self.pool.acquire()
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.pool.release(self.conn)
+        self.conn = None
+        return False
+
+
+# --- SQLite backend ---
+# The app's SQL is written for MySQL. The SQLite cursor rewrites the few
+# constructs that differ so the same statements run on both engines.
+_SQLITE_REWRITES = [
+    (re.compile(r'\bINT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b', re.I), 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    (re.compile(r'\bINSERT\s+IGNORE\b', re.I), 'INSERT OR IGNORE'),
+    (re.compile(r'%s'), '?'),
+]
+
+
+_query_observers = []
+
+
+class record_queries:
+    """Collect the (sql, params) of every statement run on SQLite connections.
+
+    Used by the query-plan check to capture what the routes really execute.
+    """
+
+    def __enter__(self):
+        self.statements = []
+        _query_observers.append(self._observe)
+        return self.statements
+
+    def __exit__(self, exc_type, exc, tb):
+        _query_observers.remove(self._observe)
+        return False
+
+    def _observe(self, sql, params):
+        self.statements.append((sql, tuple(params)))
+
+
+@lru_cache(maxsize=512)
+def to_sqlite_sql(sql):
+    for pattern, replacement in _SQLITE_REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+class SQLiteCursor:
+    """mysql.connector-style cursor over sqlite3 (``dictionary=True`` rows as dicts)."""
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self.dictionary = dictionary
+
+    def _row(self, row):
+        if row is None:
+            return None
+        return dict(row) if self.dictionary else tuple(row)
+
+    def execute(self, sql, params=()):
+        sql = to_sqlite_sql(sql)
+        for observer in _query_observers:
+            observer(sql, params)
+        self._cursor.execute(sql, params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(to_sqlite_sql(sql), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return (self._row(row) for row in self._cursor)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """Wraps a sqlite3 connection with the subset of the MySQL connection API the app uses."""
+
+    def __init__(self, path=SQLITE_PATH, pragmas=SQLITE_PRAGMAS):
+        self._conn = sqlite3.connect(path, timeout=pragmas.get('busy_timeout', 5000) / 1000)
+        self._conn.row_factory = sqlite3.Row
+        for name, value in pragmas.items():
+            self._conn.execute(f'PRAGMA {name}={value}')
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self._conn.cursor(), dictionary=dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self, reconnect=False):
+        self._conn.execute('SELECT 1')
+
+    def close(self):
+        self._conn.close()
+
+
+class ThreadLocalConnections:
+    """One long-lived SQLite connection per thread, with the pool interface.
+
+    SQLite connections are cheap to keep but must not cross threads, so
+    instead of a shared pool each worker thread reuses its own connection.
+    """
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = set()
+
+    def acquire(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or conn not in self._all:  # not yet opened, or closed by close_all()
+            conn = SQLiteConnection(self.path)
+            self._local.conn = conn
+            with self._lock:
+                self._all.add(conn)
+        return conn
+
+    def release(self, conn):
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+
+    def _discard(self, conn):
+        if getattr(self._local, 'conn', None) is conn:
+            self._local.conn = None
+        with self._lock:
+            self._all.discard(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def connection(self):
+        """Context manager for code running outside a request (startup, CLI)."""
+        return _PooledConnection(self)
+
+    def close_all(self):
+        with self._lock:
+            conns, self._all = self._all, set()
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+
+# --- Backends ---
+class MySQLBackend:
+    name = 'mysql'
+    transactional_ddl = False  # DDL commits implicitly
+
+    def __init__(self):
+        self.pool = ConnectionPool()
+
+    def create_database(self):
+        return create_database_if_not_exists()
+
+    def table_columns(self, cursor, table):
+        cursor.execute(f'DESCRIBE {table}')
+        return [row[0] for row in cursor.fetchall()]
+
+    def ensure_index(self, cursor, table, name, columns):
+        cursor.execute(
+            'SELECT 1 FROM information_schema.statistics '
+            'WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1',
+            (table, name)
+        )
+        if not cursor.fetchone():
+            cursor.execute(f'CREATE INDEX {name} ON {table} ({columns})')
+
+    def table_exists(self, cursor, table):
+        cursor.execute(
+            'SELECT 1 FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+            (table,)
+        )
+        return cursor.fetchone() is not None
+
+    def acquire_lock(self, cursor, name, timeout):
+        """Take a server-wide named lock (held by this connection until released)."""
+        cursor.execute('SELECT GET_LOCK(%s, %s)', (name, int(timeout)))
+        if cursor.fetchone()[0] != 1:
+            raise LockTimeout(msg=f"Could not take lock {name!r} within {timeout}s")
+
+    def release_lock(self, cursor, name):
+        cursor.execute('SELECT RELEASE_LOCK(%s)', (name,))
+        cursor.fetchone()
+
+
+class SQLiteBackend:
+    name = 'sqlite'
+    transactional_ddl = True
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self.pool = ThreadLocalConnections(path)
+
+    def create_database(self):
+        return True  # the file is created on first connect
+
+    def table_columns(self, cursor, table):
+        cursor.execute(f'PRAGMA table_info({table})')
+        return [row[1] for row in cursor.fetchall()]
+
+    def ensure_index(self, cursor, table, name, columns):
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+
+    def table_exists(self, cursor, table):
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=%s", (table,))
+        return cursor.fetchone() is not None
+
+    def acquire_lock(self, cursor, name, timeout):
+        """Take the database write lock; it is held until the transaction ends.
+
+        SQLite has one writer at a time, so an IMMEDIATE transaction is the
+        lock: other writers wait or fail until commit/rollback.
+        """
+        cursor.execute(f'PRAGMA busy_timeout = {int(timeout * 1000)}')
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError as e:
+            raise LockTimeout(msg=f"Could not take lock {name!r} within {timeout}s: {e}")
+        finally:
+            cursor.execute(f"PRAGMA busy_timeout = {SQLITE_PRAGMAS['busy_timeout']}")
+
+    def release_lock(self, cursor, name):
+        pass  # released by the commit or rollback that ends the transaction
+
+
+BACKENDS = {'mysql': MySQLBackend, 'sqlite': SQLiteBackend}
+if DB_BACKEND not in BACKENDS:
+    raise ValueError(f"Unknown DB_BACKEND {DB_BACKEND!r}; expected one of {sorted(BACKENDS)}")
+
+backend = BACKENDS[DB_BACKEND]()
+pool = backend.pool
+
+# Catch these to handle a database error regardless of the configured engine
+DB_ERRORS = (Error, sqlite3.Error)
+
+
+def init_app(app):
+    """Tie connection borrowing to the Flask app context.
+
+    ``get_db()`` hands out one pooled connection per request; it is returned
+    to the pool on teardown, also when the view raised.
+    """
+    app.teardown_appcontext(_release_request_connection)
+
+
+def get_db():
+    """Get the pooled connection for the current request (or app context)."""
+    if 'db_conn' not in g:
+        try:
+            g.db_conn = pool.acquire()
+        except DB_ERRORS as e:
+            print(f"Error connecting to college_db ({backend.name}): {e}")
+            return None
+    return g.db_conn
+
+
+def _release_request_connection(exc=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        pool.release(conn)
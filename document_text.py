@@ -0,0 +1,93 @@
+"""Plain text from uploaded documents, for search and preview excerpts.
+
+DOCX and PPTX are zip files of XML and are read with the standard
+library. PDF text needs pypdf or poppler's ``pdftotext``; without either,
+PDFs are indexed by name only. Extraction is capped at ``limit``
+characters and never raises on a damaged file, so it is safe to run over
+a whole uploads tree in worker processes.
+"""
+import html
+import re
+import shutil
+import subprocess
+import zipfile
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # optional: PDF text without poppler
+    PdfReader = None
+
+MAX_TEXT_CHARS = 500_000
+MAX_XML_BYTES = 8 * 1024 * 1024  # read at most this much of one entry inside a DOCX/PPTX
+PDFTOTEXT = shutil.which('pdftotext')
+
+XML_TEXT_RE = re.compile(r'<(?:w|a):t(?:\s[^>]*)?>([^<]*)</(?:w|a):t>')
+XML_PARAGRAPH_RE = re.compile(r'</(?:w|a):p>')
+SLIDE_RE = re.compile(r'^ppt/slides/slide(\d+)\.xml$')
+
+
+def read_entry(archive, name, limit=MAX_XML_BYTES):
+    with archive.open(name) as entry:
+        return entry.read(limit).decode('utf-8', 'replace')
+
+
+def office_xml_text(xml):
+    xml = XML_PARAGRAPH_RE.sub(' ', xml)
+    return html.unescape(' '.join(XML_TEXT_RE.findall(xml)))
+
+
+def office_parts(archive, extension):
+    """Names of the parts holding the body text, in reading order."""
+    if extension == 'pptx':
+        slides = [(int(m.group(1)), name) for name in archive.namelist() for m in [SLIDE_RE.match(name)] if m]
+        return [name for _, name in sorted(slides)]
+    return ['word/document.xml']
+
+
+def _office_text(path, extension, limit):
+    parts = []
+    size = 0
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        for name in office_parts(archive, extension):
+            if name in names:
+                parts.append(office_xml_text(read_entry(archive, name)))
+                size += len(parts[-1])
+                if size >= limit:
+                    break
+    return ' '.join(parts)
+
+
+def _pdf_text(path, limit):
+    if PdfReader is not None:
+        parts = []
+        size = 0
+        for page in PdfReader(path).pages:
+            parts.append(page.extract_text() or '')
+            size += len(parts[-1])
+            if size >= limit:
+                break
+        return ' '.join(parts)
+    if PDFTOTEXT:
+        result = subprocess.run([PDFTOTEXT, '-q', '-enc', 'UTF-8', path, '-'],
+                                capture_output=True, timeout=120)
+        return result.stdout.decode('utf-8', 'replace')
+    return ''
+
+
+def extract_text(path, extension, limit=MAX_TEXT_CHARS):
+    """Whitespace-normalized text of a PDF, DOCX, PPTX or TXT file ('' for other types)."""
+    try:
+        if extension == 'txt':
+            with open(path, 'rb') as f:
+                text = f.read(limit * 4).decode('utf-8', 'replace')
+        elif extension in ('docx', 'pptx'):
+            text = _office_text(path, extension, limit)
+        elif extension == 'pdf':
+            text = _pdf_text(path, limit)
+        else:
+            return ''
+    except Exception as e:  # damaged or unexpected files are indexed by name only
+        print(f"Could not extract text from {path}: {e}")
+        return ''
+    return ' '.join(text.split())[:limit]
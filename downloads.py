@@ -0,0 +1,178 @@
+"""Sending material files: validators, byte ranges and proxy offload.
+
+Every download answers with a strong ETag (the blob's SHA-256, which
+changes only with the content) and Last-Modified, so a repeated download
+is a 304, and with ``Accept-Ranges`` so an interrupted one resumes with a
+Range request.
+
+With DOWNLOAD_OFFLOAD set, Flask only authorizes and the front-end proxy
+sends the bytes:
+
+- ``x-accel-redirect`` (nginx): the response carries
+  ``X-Accel-Redirect: <X_ACCEL_PREFIX><path under the uploads folder>``,
+  served from an ``internal`` location that aliases the uploads folder;
+- ``x-sendfile`` (Apache mod_xsendfile, lighttpd): ``X-Sendfile: <absolute path>``.
+
+The proxy then handles ranges itself; 304s are still answered here.
+
+``send_zip`` streams many materials as one ZIP archive, built while it is
+sent: no temporary file, and memory bounded by one read chunk plus a
+small directory entry per member. Files that are compressed already are
+stored as is, the rest deflated. Its ETag hashes the member list (names,
+contents and mtimes), so an unchanged selection is answered with a 304.
+"""
+import hashlib
+import os
+import time
+import zipfile
+
+from flask import Response, abort, request, send_file
+from werkzeug.http import quote_etag
+
+DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD', '').lower()  # '', 'x-accel-redirect' or 'x-sendfile'
+X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/protected-uploads/')
+OFFLOAD_MODES = ('', 'x-accel-redirect', 'x-sendfile')
+ZIP_CHUNK_SIZE = 256 * 1024
+STORED_EXTENSIONS = {'pdf', 'docx', 'pptx', 'zip', 'jpg', 'png'}  # deflating these gains next to nothing
+
+if DOWNLOAD_OFFLOAD not in OFFLOAD_MODES:
+    raise ValueError(f"Unknown DOWNLOAD_OFFLOAD {DOWNLOAD_OFFLOAD!r}; expected one of {OFFLOAD_MODES[1:]}")
+
+
+def send_stored_file(path, download_name, etag=None, upload_root='uploads', offload=None):
+    """Send ``path`` as an attachment honouring conditional and range headers.
+
+    ``etag`` is the content digest for blob files; files stored before the
+    blob store fall back to Werkzeug's mtime/size based tag.
+    """
+    offload = DOWNLOAD_OFFLOAD if offload is None else offload
+    path = os.path.abspath(path)
+    if not os.path.isfile(path):
+        abort(404)
+
+    if offload not in ('x-accel-redirect', 'x-sendfile'):
+        # send_file answers If-None-Match / If-Modified-Since with 304 and Range with 206
+        response = send_file(path, as_attachment=True, download_name=download_name,
+                             conditional=True, etag=etag or True)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True  # revalidate with the ETag before reuse
+        return response
+
+    response = send_file(path, as_attachment=True, download_name=download_name,
+                         conditional=False, etag=etag or True)
+    response.close()  # the proxy reads the file; never stream it from here
+    response.response = []
+    response.direct_passthrough = False
+    del response.headers['Content-Length']  # the proxy sets it for the file it sends
+    if offload == 'x-accel-redirect':
+        relative = os.path.relpath(path, os.path.abspath(upload_root)).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = X_ACCEL_PREFIX.rstrip('/') + '/' + relative
+    else:
+        response.headers['X-Sendfile'] = path
+
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    if etag:
+        response.headers['ETag'] = quote_etag(etag)
+    if response.status_code == 200:
+        response.make_conditional(request.environ, accept_ranges=True)
+        if response.status_code == 304:
+            response.headers.pop('X-Accel-Redirect', None)
+            response.headers.pop('X-Sendfile', None)
+    return response
+
+
+class _ZipSink:
+    """Unseekable file object that collects what ZipFile writes until the stream drains it.
+
+    Without seek() ZipFile writes data descriptors after each member instead
+    of going back to patch its header, which is what makes streaming work.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def write(self, data):
+        self._buffer += data
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def pending(self):
+        return len(self._buffer)  # not __len__: ZipFile treats an empty (falsy) file as closed
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def zip_members(entries):
+    """Resolve (archive name, path, content id) entries to members with their size and mtime.
+
+    Missing files are left out; names are made unique ("notes (2).pdf").
+    """
+    members, seen = [], set()
+    for name, path, content_id in entries:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        name = name.replace('\\', '/').lstrip('/')
+        base, dot, extension = name.rpartition('.')
+        unique, copy = name, 1
+        while unique.lower() in seen:
+            copy += 1
+            unique = f"{base} ({copy}).{extension}" if dot else f"{name} ({copy})"
+        seen.add(unique.lower())
+        members.append((unique, path, content_id, stat.st_size, int(stat.st_mtime)))
+    return members
+
+
+def zip_etag(members):
+    digest = hashlib.sha256()
+    for name, _, content_id, size, mtime in members:
+        digest.update(f"{name}\0{content_id}\0{size}\0{mtime}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def generate_zip(members, chunk_size=ZIP_CHUNK_SIZE):
+    """Yield the bytes of a ZIP archive of ``members`` as it is written."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for name, path, _, size, mtime in members:
+            info = zipfile.ZipInfo(name, date_time=time.localtime(max(mtime, 315532800))[:6])  # ZIP dates start in 1980
+            info.file_size = size  # lets ZipFile choose ZIP64 headers up front for huge files
+            extension = name.rsplit('.', 1)[-1].lower()
+            info.compress_type = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as source, archive.open(info, 'w') as target:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    if sink.pending() >= chunk_size:
+                        yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()  # the central directory
+
+
+def send_zip(entries, download_name):
+    """Stream ``entries`` ((archive name, path, content id) tuples) as a ZIP attachment."""
+    members = zip_members(entries)
+    if not members:
+        abort(404)
+    response = Response(generate_zip(members), mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    response.set_etag(zip_etag(members))
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.implicit_sequence_conversion = False  # keep it streaming; the length is unknown
+    # 304 when If-None-Match matches; the generator is then never started
+    return response.make_conditional(request.environ)
@@ -0,0 +1,72 @@
+"""Conditional GET for the JSON API, validated by data version counters.
+
+``@validated('materials')`` gives a view an ETag derived from its path and
+query string and the data versions (see data_versions.py) its body is
+built from, so the tag is known before the view runs. A request whose
+``If-None-Match`` already holds it gets ``304 Not Modified`` without any
+query or serialisation; otherwise the view runs as before and its 200
+response carries the tag.
+
+Responses are public (they do not depend on the visitor) and may be reused
+for ``max_age`` seconds, then revalidated. Catalog endpoints use
+API_CATALOG_MAX_AGE, matching how long a worker serves its in-memory
+catalog anyway; endpoints over data that changes during the day default to
+API_MAX_AGE, 0 (revalidate every time, which is what a 304 makes cheap).
+"""
+import hashlib
+import os
+from functools import wraps
+
+from flask import current_app, make_response, request
+from flask.sessions import SecureCookieSessionInterface
+
+from catalog import CATALOG_TTL
+from data_versions import data_state
+
+API_MAX_AGE = int(os.environ.get('API_MAX_AGE', 0))  # seconds
+API_CATALOG_MAX_AGE = int(os.environ.get('API_CATALOG_MAX_AGE', CATALOG_TTL))
+
+
+def _etag(names):
+    key = repr((request.endpoint, request.full_path, data_state(names)))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+
+
+def _cache_headers(response, etag, max_age):
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.must_revalidate = True
+    response.vary.add('Accept-Encoding')  # a proxy may keep compressed and plain copies
+    return response
+
+
+class PublicSessionInterface(SecureCookieSessionInterface):
+    """The default cookie sessions, without ``Vary: Cookie`` on public responses.
+
+    Flask-Login reads the session after every request, which makes Flask
+    add ``Vary: Cookie`` everywhere; a proxy would then keep one copy of an
+    API response per visitor. Responses marked ``public`` are the same for
+    everyone, so unless they set a cookie the header is dropped again.
+    """
+
+    def save_session(self, app, session, response):
+        super().save_session(app, session, response)
+        if response.cache_control.public and 'Set-Cookie' not in response.headers:
+            response.vary = [header for header in response.vary if header.lower() != 'cookie']
+
+
+def validated(*names, max_age=API_MAX_AGE):
+    """Answer GETs with an ETag from the versions of ``names`` and 304 when the client has it."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = _etag(names)
+            if request.if_none_match.contains_weak(etag):
+                return _cache_headers(current_app.response_class(status=304), etag, max_age)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            return _cache_headers(response, etag, max_age)
+        return wrapper
+    return decorator
@@ -0,0 +1,199 @@
+"""Secondary indexes derived from the app's query patterns, and a plan check.
+
+``INDEXES`` lists every index the routes rely on, next to the lookup it
+serves. ``ensure_indexes`` creates the missing ones; schema migrations call
+it with the names they introduce, so a new entry here needs a new migration.
+
+``find_full_scans`` EXPLAINs recorded statements and reports those that
+read a whole table. It backs the ``flask check-query-plans`` command, which
+seeds a benchmark dataset, replays the routes and fails on any full scan.
+"""
+import io
+import random
+import re
+
+from blob_store import blob_store
+from database_config import backend
+from qa_threads import backfill_thread_paths
+from qa_search import index_all_messages
+from search import index_names
+
+# (table, index name, columns) -- the query each one serves is noted alongside
+INDEXES = [
+    ('materials', 'idx_materials_filename', 'filename'),                  # /uploads/<filename>
+    ('materials', 'idx_materials_subject', 'subject_id'),                 # materials of a subject
+    ('materials', 'idx_materials_uploader', 'uploader_id, id'),           # faculty "my materials"
+    ('materials', 'idx_materials_blob', 'blob_sha256'),                   # blob reference counts
+    ('messages', 'idx_messages_reply_created', 'reply_to, created_at'),   # top-level questions
+    ('messages', 'idx_messages_receiver', 'receiver_id, reply_to, created_at'),  # faculty questions
+    ('messages', 'idx_messages_root_path', 'root_id, thread_path'),       # reply trees
+    ('messages', 'idx_messages_material_path', 'material_id, thread_path'),  # questions per material
+    ('users', 'idx_users_role_department', 'role, department'),           # student records, dashboards
+    ('users', 'idx_users_role_id', 'role, id'),                           # user lists by role, in id order
+    ('events', 'idx_events_date', 'event_date, created_at'),              # latest events
+    ('events', 'idx_events_department', 'department_id, event_date, created_at'),  # events of a department
+    ('department_achievements', 'idx_achievements_department', 'department_id, created_at'),
+    ('upload_sessions', 'idx_upload_sessions_activity', 'last_activity'),  # expiring idle uploads
+    ('jobs', 'idx_jobs_runnable', 'status, run_after, id'),               # next job to claim
+]
+
+# Reference tables small enough (and cached in memory) that scanning them is fine
+SMALL_TABLES = {'departments', 'semesters', 'subjects', 'data_versions', 'sqlite_sequence'}
+
+TABLE_ALIAS_RE = re.compile(
+    r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|JOIN\b|LEFT\b|INNER\b|ORDER\b|GROUP\b|LIMIT\b)(\w+))?',
+    re.I
+)
+
+WHERE_RE = re.compile(r'\bWHERE\b(.*?)(?:\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|$)', re.I | re.S)
+
+
+def ensure_indexes(cursor, names=None):
+    """Create the missing indexes of ``INDEXES`` (only those in ``names`` if given)."""
+    for table, name, columns in INDEXES:
+        if names is None or name in names:
+            backend.ensure_index(cursor, table, name, columns)
+
+
+def explain(cursor, sql, params):
+    """Return the query plan as a list of (table, detail) rows."""
+    if backend.name == 'sqlite':
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [(None, row[-1]) for row in cursor.fetchall()]
+    cursor.execute('EXPLAIN ' + sql, params)
+    columns = [d[0] for d in cursor.description]
+    return [(row[columns.index('table')], row[columns.index('type')]) for row in cursor.fetchall()]
+
+
+def is_full_scan(sql, plan):
+    """True if a plan reads a whole (non-reference) table.
+
+    A SQLite "SCAN t USING [COVERING] INDEX ..." walks an index in the
+    requested order and is accepted when a LIMIT stops it early. A bare
+    "SCAN t" reads the table row by row and counts even with a LIMIT when
+    the statement filters rows (a filter may skip most of the table); only
+    an unfiltered listing in primary-key order, which SQLite also reports
+    as a bare SCAN, stops after LIMIT rows. Full-text MATCH lookups and
+    scans over a subquery's (already filtered) rows pass.
+    """
+    ordered_limit = ' LIMIT ' in sql.upper() and not any('TEMP B-TREE' in d for _, d in plan)
+    where = WHERE_RE.search(sql)
+    filtered = where is not None and where.group(1).strip() not in ('', '1=1')
+    aliases = {alias or table: table for table, alias in TABLE_ALIAS_RE.findall(sql)}
+    subqueries = {detail.split(None, 1)[1] for _, detail in plan if detail.startswith(('CO-ROUTINE', 'MATERIALIZE'))}
+    for table, detail in plan:
+        if backend.name == 'sqlite':
+            words = detail.split()
+            if words[2:4] == ['VIRTUAL', 'TABLE'] and ':M' in words[-1]:
+                continue  # full-text MATCH lookup
+            if len(words) >= 2 and words[0] == 'SCAN' and words[1] in subqueries:
+                continue  # rows an inner query already selected
+            if len(words) >= 2 and words[0] == 'SCAN' and aliases.get(words[1], words[1]) not in SMALL_TABLES:
+                if not ordered_limit or ('INDEX' not in words and filtered):
+                    return True
+        elif detail == 'ALL' and table not in SMALL_TABLES:
+            return True
+    return False
+
+
+def find_full_scans(conn, statements):
+    """EXPLAIN each distinct SELECT in ``statements`` ((sql, params) pairs)."""
+    cursor = conn.cursor()
+    failures = []
+    seen = set()
+    for sql, params in statements:
+        key = (sql, tuple(params or ()))
+        if key in seen or not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        seen.add(key)
+        plan = explain(cursor, sql, params or ())
+        if is_full_scan(sql, plan):
+            failures.append((sql, plan))
+    cursor.close()
+    return failures
+
+
+def _seed_blobs(cursor, count, rnd):
+    """Store ``count`` small PDF files in the blob store; return their digests."""
+    digests = []
+    for i in range(count):
+        data = b'%PDF-1.4\n% benchmark file ' + str(i).encode() + b'\n' + rnd.randbytes(2048)
+        sha256, size, temp_path = blob_store.write(io.BytesIO(data))
+        blob_store.place(temp_path, sha256)
+        cursor.execute('INSERT IGNORE INTO blobs (sha256, size, refcount) VALUES (%s, %s, 0)', (sha256, size))
+        digests.append(sha256)
+    return digests
+
+
+def seed_benchmark_data(conn, students=2000, faculty=50, materials=3000, questions=8000,
+                        replies=12000, events=2000, achievements=500, blobs=50, password_hash='x'):
+    """Fill the database with a realistic volume of rows for plan checks.
+
+    Materials point at ``blobs`` real files written to the blob store, so
+    download and ZIP routes serve them and run their actual queries; point
+    ``blob_store`` at a scratch directory first.
+    """
+    rnd = random.Random(42)
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, name FROM departments')
+    departments = cursor.fetchall()
+    cursor.execute('SELECT id FROM subjects')
+    subject_ids = [row[0] for row in cursor.fetchall()]
+
+    cursor.executemany(
+        'INSERT INTO users (email, password_hash, role, name, department) VALUES (%s, %s, %s, %s, %s)',
+        [(f'bench-faculty{i}@college.local', password_hash, 'faculty', f'Faculty {i}',
+          rnd.choice(departments)[1]) for i in range(faculty)]
+        + [(f'bench-student{i}@college.local', password_hash, 'student', f'Student {i}',
+            rnd.choice(departments)[1]) for i in range(students)]
+    )
+    cursor.execute("SELECT id FROM users WHERE role='faculty'")
+    faculty_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT id FROM users WHERE role='student'")
+    student_ids = [row[0] for row in cursor.fetchall()]
+
+    digests = _seed_blobs(cursor, blobs, rnd)
+    cursor.executemany(
+        'INSERT INTO materials (subject_id, filename, original_filename, uploader_id, blob_sha256) '
+        'VALUES (%s, %s, %s, %s, %s)',
+        [(rnd.choice(subject_ids), f'bench_{i}.pdf', f'Bench {i}.pdf', rnd.choice(faculty_ids), rnd.choice(digests))
+         for i in range(materials)]
+    )
+    cursor.execute(
+        'UPDATE blobs SET refcount = (SELECT COUNT(*) FROM materials m WHERE m.blob_sha256 = blobs.sha256)'
+    )
+    cursor.execute('SELECT id, uploader_id FROM materials')
+    material_rows = cursor.fetchall()
+
+    cursor.executemany(
+        'INSERT INTO messages (material_id, sender_id, receiver_id, encrypted_message) VALUES (%s, %s, %s, %s)',
+        [(mat_id, rnd.choice(student_ids), uploader, 'cXVlc3Rpb24=')
+         for mat_id, uploader in (rnd.choice(material_rows) for _ in range(questions))]
+    )
+    cursor.execute('SELECT id, material_id, sender_id, receiver_id FROM messages')
+    question_rows = cursor.fetchall()
+    cursor.executemany(
+        'INSERT INTO messages (material_id, sender_id, receiver_id, encrypted_message, reply_to) '
+        'VALUES (%s, %s, %s, %s, %s)',
+        [(mat_id, receiver, sender, 'YW5zd2Vy', msg_id)
+         for msg_id, mat_id, sender, receiver in (rnd.choice(question_rows) for _ in range(replies))]
+    )
+
+    cursor.executemany(
+        'INSERT INTO events (department_id, title, content, author, event_date) VALUES (%s, %s, %s, %s, %s)',
+        [(rnd.choice(departments)[0], f'Event {i}', 'Benchmark event', 'bench',
+          f'20{rnd.randint(15, 25)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}') for i in range(events)]
+    )
+    cursor.executemany(
+        'INSERT INTO department_achievements (department_id, title, description) VALUES (%s, %s, %s)',
+        [(rnd.choice(departments)[0], f'Achievement {i}', 'Benchmark') for i in range(achievements)]
+    )
+    cursor.execute(
+        "INSERT INTO user_imports (filename, path, status, total_rows, processed_rows, created_count) "
+        "VALUES ('bench.csv', 'bench.csv', 'done', %s, %s, %s)", (students, students, students)
+    )
+    backfill_thread_paths(cursor)
+    index_names(cursor)
+    index_all_messages(cursor)
+    conn.commit()
+    cursor.close()
@@ -0,0 +1,170 @@
+"""A small durable job queue backed by the ``jobs`` table.
+
+Request handlers ``enqueue`` work in the same transaction as the rows it
+is about, so a job exists exactly when its data does. Worker threads
+(``start_workers``, JOB_WORKERS per process) or a separate
+``flask run-jobs`` process claim queued jobs and run the handler
+registered for the job's kind with ``@handler('kind')``.
+
+A claim is an UPDATE guarded by ``status='queued'``, so two workers never
+run the same job. Failures are retried with backoff up to JOB_MAX_ATTEMPTS;
+jobs left 'running' by a worker that died are requeued after
+JOB_LOCK_TIMEOUT.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+
+from database_config import DB_ERRORS, pool
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))              # threads per app process; 0 disables
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2))  # seconds between polls when idle
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_LOCK_TIMEOUT = int(os.environ.get('JOB_LOCK_TIMEOUT', 600))    # seconds before a running job is retried
+
+HANDLERS = {}
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def handler(kind):
+    """Register the function that runs jobs of ``kind``; it receives (conn, payload)."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(cursor, kind, payload, delay=0):
+    """Queue a job; it becomes visible to workers when the caller commits."""
+    cursor.execute(
+        'INSERT INTO jobs (kind, payload, status, attempts, run_after) VALUES (%s, %s, %s, 0, %s)',
+        (kind, json.dumps(payload), 'queued', int(time.time() + delay))
+    )
+    _wakeup.set()
+    return cursor.lastrowid
+
+
+def enqueue_many(cursor, kind, payloads, delay=0):
+    """Queue one job of ``kind`` per payload with a single batched insert."""
+    run_after = int(time.time() + delay)
+    cursor.executemany(
+        'INSERT INTO jobs (kind, payload, status, attempts, run_after) VALUES (%s, %s, %s, 0, %s)',
+        [(kind, json.dumps(payload), 'queued', run_after) for payload in payloads]
+    )
+    _wakeup.set()
+
+
+def _requeue_stale(cursor, now):
+    cursor.execute(
+        "UPDATE jobs SET status='queued', locked_by=NULL WHERE status='running' AND locked_at < %s",
+        (now - JOB_LOCK_TIMEOUT,)
+    )
+
+
+def claim_next(conn, worker_id):
+    """Claim the oldest runnable job; return (id, kind, payload, attempts) or None."""
+    cursor = conn.cursor()
+    now = int(time.time())
+    try:
+        _requeue_stale(cursor, now)
+        while True:
+            cursor.execute(
+                "SELECT id, kind, payload, attempts FROM jobs WHERE status='queued' AND run_after <= %s "
+                'ORDER BY run_after, id LIMIT 1', (now,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                conn.commit()
+                return None
+            cursor.execute(
+                "UPDATE jobs SET status='running', locked_by=%s, locked_at=%s, attempts=attempts+1 "
+                "WHERE id=%s AND status='queued'",
+                (worker_id, now, row[0])
+            )
+            conn.commit()
+            if cursor.rowcount == 1:
+                return row[0], row[1], json.loads(row[2]), row[3] + 1
+            # another worker won this one; try the next
+    finally:
+        cursor.close()
+
+
+def _finish(conn, job_id, status, error=None, retry_in=None):
+    cursor = conn.cursor()
+    if retry_in is not None:
+        cursor.execute(
+            "UPDATE jobs SET status='queued', locked_by=NULL, last_error=%s, run_after=%s WHERE id=%s",
+            (error, int(time.time() + retry_in), job_id)
+        )
+    else:
+        cursor.execute(
+            'UPDATE jobs SET status=%s, locked_by=NULL, last_error=%s, finished_at=%s WHERE id=%s',
+            (status, error, int(time.time()), job_id)
+        )
+    conn.commit()
+    cursor.close()
+
+
+def run_one(conn, worker_id):
+    """Claim and run a single job; return False if the queue was empty."""
+    job = claim_next(conn, worker_id)
+    if job is None:
+        return False
+    job_id, kind, payload, attempts = job
+    func = HANDLERS.get(kind)
+    if func is None:
+        _finish(conn, job_id, 'failed', f'No handler for job kind {kind!r}')
+        return True
+    try:
+        func(conn, payload)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        error = traceback.format_exc(limit=5)
+        print(f"Job {job_id} ({kind}) failed on attempt {attempts}: {error.strip().splitlines()[-1]}")
+        if attempts < JOB_MAX_ATTEMPTS:
+            _finish(conn, job_id, 'queued', error, retry_in=30 * 2 ** (attempts - 1))
+        else:
+            _finish(conn, job_id, 'failed', error)
+        return True
+    _finish(conn, job_id, 'done')
+    return True
+
+
+def work(stop=None, once=False, worker_id=None):
+    """Process jobs until ``stop`` is set (or the queue is empty, with ``once``)."""
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    while stop is None or not stop.is_set():
+        try:
+            with pool.connection() as conn:
+                while run_one(conn, worker_id):
+                    if stop is not None and stop.is_set():
+                        return
+        except DB_ERRORS as e:
+            print(f"Job worker database error: {e}")
+        if once:
+            return
+        _wakeup.wait(JOB_POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def start_workers(count=JOB_WORKERS):
+    """Start ``count`` daemon worker threads in this process (once)."""
+    with _workers_lock:
+        if _workers or count <= 0:
+            return
+        for i in range(count):
+            thread = threading.Thread(target=work, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            _workers.append(thread)
+
+
+def queue_counts(cursor):
+    cursor.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status')
+    return dict(cursor.fetchall())
@@ -0,0 +1,382 @@
+"""Numbered schema migrations, applied by ``flask db-upgrade``.
+
+Each migration runs once and is recorded in the ``schema_version`` table.
+``migrate`` holds a database-wide lock while it works, so when several
+processes start an upgrade only one of them applies the pending steps; the
+others wait and then find nothing left to do. App workers only read the
+current version at boot (``schema_version``) instead of running DDL.
+
+On SQLite a whole upgrade is one transaction. MySQL commits DDL implicitly,
+so each migration is committed with its version row and is written to be
+safe to re-run if a previous attempt stopped half way.
+
+Migrations 1-5 bring both fresh databases and ones created by the old
+startup code up to date. Append new steps to ``MIGRATIONS``; never edit or
+renumber one that has shipped.
+"""
+import os
+
+from database_config import backend
+from indexes import ensure_indexes
+from qa_threads import backfill_thread_paths
+from qa_search import create_message_search, index_all_messages
+from search import create_search_index, index_names
+
+MIGRATION_LOCK = 'college_db_migrate'
+MIGRATION_LOCK_TIMEOUT = float(os.environ.get('MIGRATION_LOCK_TIMEOUT', 60))  # seconds
+
+
+def create_base_tables(cursor):
+    
+    # Create tables with MySQL syntax - ORDER MATTERS!
+    # First create users table since other tables reference it
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            role VARCHAR(50) NOT NULL CHECK(role IN ('admin','faculty','student')),
+            name VARCHAR(255),
+            department VARCHAR(50),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP NULL
+        );
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS departments (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) UNIQUE
+        );
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS semesters (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255),
+            department_id INT,
+            UNIQUE(name, department_id),
+            FOREIGN KEY(department_id) REFERENCES departments(id)
+        );
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subjects (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255),
+            semester_id INT,
+            UNIQUE(name, semester_id),
+            FOREIGN KEY(semester_id) REFERENCES semesters(id)
+        );
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS materials (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            subject_id INT,
+            filename VARCHAR(255),
+            original_filename VARCHAR(255),
+            uploader_id INT,
+            FOREIGN KEY(subject_id) REFERENCES subjects(id),
+            FOREIGN KEY(uploader_id) REFERENCES users(id)
+        );
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS events (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        department_id INT,
+        title VARCHAR(255) NOT NULL,
+        content TEXT NOT NULL,
+        author VARCHAR(255),
+        event_date DATE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        image_url TEXT,
+        FOREIGN KEY (department_id) REFERENCES departments(id)
+    );
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS department_achievements (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            department_id INT NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            description TEXT,
+            image_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(department_id) REFERENCES departments(id)
+        );
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            material_id INT NOT NULL,
+            sender_id INT NOT NULL,
+            receiver_id INT NOT NULL,
+            encrypted_message TEXT NOT NULL,
+            reply_to INT NULL,
+            root_id INT NULL,
+            thread_path VARCHAR(700) NULL,
+            depth INT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(material_id) REFERENCES materials(id) ON DELETE CASCADE,
+            FOREIGN KEY(sender_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY(receiver_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY(reply_to) REFERENCES messages(id) ON DELETE CASCADE
+        );
+    ''')
+
+
+def add_user_and_uploader_columns(cursor):
+    """Columns added after the first release (no-ops on databases created since)."""
+    if 'uploader_id' not in backend.table_columns(cursor, 'materials'):
+        cursor.execute('ALTER TABLE materials ADD COLUMN uploader_id INTEGER')
+
+    existing_columns = backend.table_columns(cursor, 'users')
+    if 'department' not in existing_columns:
+        cursor.execute('ALTER TABLE users ADD COLUMN department VARCHAR(50)')
+    if 'created_at' not in existing_columns:
+        if backend.name == 'sqlite':
+            # SQLite cannot add a column with a non-constant default
+            cursor.execute('ALTER TABLE users ADD COLUMN created_at TIMESTAMP')
+        else:
+            cursor.execute('ALTER TABLE users ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
+    if 'last_login' not in existing_columns:
+        cursor.execute('ALTER TABLE users ADD COLUMN last_login TIMESTAMP NULL')
+
+
+def add_message_thread_paths(cursor):
+    existing_columns = backend.table_columns(cursor, 'messages')
+    if 'root_id' not in existing_columns:
+        cursor.execute('ALTER TABLE messages ADD COLUMN root_id INT NULL')
+    if 'thread_path' not in existing_columns:
+        cursor.execute('ALTER TABLE messages ADD COLUMN thread_path VARCHAR(700) NULL')
+    if 'depth' not in existing_columns:
+        cursor.execute('ALTER TABLE messages ADD COLUMN depth INT NOT NULL DEFAULT 0')
+    backfill_thread_paths(cursor)
+
+
+def normalize_event_dates(cursor):
+    # Undated events sort by their posting day (keeps event_date indexable)
+    cursor.execute("UPDATE events SET event_date = DATE(created_at) WHERE event_date IS NULL OR event_date = ''")
+
+
+def create_secondary_indexes(cursor):
+    ensure_indexes(cursor, [
+        'idx_materials_filename', 'idx_materials_subject', 'idx_materials_uploader',
+        'idx_messages_reply_created', 'idx_messages_receiver', 'idx_messages_root_path',
+        'idx_messages_material_path', 'idx_users_role_department', 'idx_events_date',
+        'idx_events_department', 'idx_achievements_department',
+    ])
+
+
+def create_app_meta(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS app_meta (
+            name VARCHAR(64) PRIMARY KEY,
+            value VARCHAR(255),
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def create_blobs(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 CHAR(64) PRIMARY KEY,
+            size BIGINT NOT NULL,
+            refcount INT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    if 'blob_sha256' not in backend.table_columns(cursor, 'materials'):
+        cursor.execute('ALTER TABLE materials ADD COLUMN blob_sha256 CHAR(64) NULL')
+    ensure_indexes(cursor, ['idx_materials_blob'])
+
+
+def create_upload_sessions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id CHAR(32) PRIMARY KEY,
+            uploader_id INT NULL,
+            subject_id INT NOT NULL,
+            original_filename VARCHAR(255) NOT NULL,
+            total_size BIGINT NOT NULL,
+            chunk_size INT NOT NULL,
+            last_activity BIGINT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(subject_id) REFERENCES subjects(id),
+            FOREIGN KEY(uploader_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_chunks (
+            session_id CHAR(32) NOT NULL,
+            chunk_no INT NOT NULL,
+            size INT NOT NULL,
+            sha256 CHAR(64) NOT NULL,
+            PRIMARY KEY (session_id, chunk_no),
+            FOREIGN KEY(session_id) REFERENCES upload_sessions(id) ON DELETE CASCADE
+        )
+    ''')
+    ensure_indexes(cursor, ['idx_upload_sessions_activity'])
+
+
+def create_jobs_and_previews(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            kind VARCHAR(64) NOT NULL,
+            payload TEXT NOT NULL,
+            status VARCHAR(16) NOT NULL,
+            attempts INT NOT NULL DEFAULT 0,
+            run_after BIGINT NOT NULL,
+            locked_by VARCHAR(255) NULL,
+            locked_at BIGINT NULL,
+            last_error TEXT NULL,
+            finished_at BIGINT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blob_previews (
+            sha256 CHAR(64) PRIMARY KEY,
+            mime_type VARCHAR(100) NOT NULL,
+            size BIGINT NOT NULL,
+            page_count INT NULL,
+            thumbnail VARCHAR(100) NULL,
+            excerpt TEXT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    ensure_indexes(cursor, ['idx_jobs_runnable'])
+
+
+def create_material_search(cursor):
+    create_search_index(cursor)
+    index_names(cursor)  # document text is added by `flask reindex-search`
+
+
+def create_message_search_index(cursor):
+    create_message_search(cursor)
+    index_all_messages(cursor)
+
+
+def create_user_imports(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_imports (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            filename VARCHAR(255) NOT NULL,
+            path VARCHAR(512) NOT NULL,
+            status VARCHAR(16) NOT NULL,
+            total_rows INT NOT NULL DEFAULT 0,
+            processed_rows INT NOT NULL DEFAULT 0,
+            created_count INT NOT NULL DEFAULT 0,
+            skipped_count INT NOT NULL DEFAULT 0,
+            errors TEXT NULL,
+            created_by INT NULL,
+            finished_at BIGINT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(created_by) REFERENCES users(id) ON DELETE SET NULL
+        )
+    ''')
+
+
+def add_session_versions(cursor):
+    if 'session_version' not in backend.table_columns(cursor, 'users'):
+        cursor.execute('ALTER TABLE users ADD COLUMN session_version INT NOT NULL DEFAULT 0')
+
+
+def create_data_versions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name VARCHAR(64) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def add_users_role_index(cursor):
+    ensure_indexes(cursor, ['idx_users_role_id'])
+
+
+# (version, description, function) -- in order, append only
+MIGRATIONS = [
+    (1, 'create base tables', create_base_tables),
+    (2, 'add user and uploader columns', add_user_and_uploader_columns),
+    (3, 'add message thread paths', add_message_thread_paths),
+    (4, 'normalize event dates', normalize_event_dates),
+    (5, 'create secondary indexes', create_secondary_indexes),
+    (6, 'create app_meta table', create_app_meta),
+    (7, 'content-addressed material blobs', create_blobs),
+    (8, 'resumable upload sessions', create_upload_sessions),
+    (9, 'background jobs and material previews', create_jobs_and_previews),
+    (10, 'full-text material search', create_material_search),
+    (11, 'Q&A message search', create_message_search_index),
+    (12, 'bulk user imports', create_user_imports),
+    (13, 'user session versions', add_session_versions),
+    (14, 'data version counters', create_data_versions),
+    (15, 'users by role in id order', add_users_role_index),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _ensure_version_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _current_version(cursor):
+    cursor.execute('SELECT MAX(version) FROM schema_version')
+    return cursor.fetchone()[0] or 0
+
+
+def schema_version(conn):
+    """The version the database is at (0 if it was never migrated)."""
+    cursor = conn.cursor()
+    try:
+        if not backend.table_exists(cursor, 'schema_version'):
+            return 0
+        return _current_version(cursor)
+    finally:
+        cursor.close()
+
+
+def pending_migrations(version):
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def migrate(conn, target=LATEST_VERSION):
+    """Apply the pending migrations up to ``target``; return the versions applied."""
+    cursor = conn.cursor()
+    backend.acquire_lock(cursor, MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT)
+    applied = []
+    try:
+        _ensure_version_table(cursor)
+        # read the version under the lock: another process may just have migrated
+        for version, description, apply in pending_migrations(_current_version(cursor)):
+            if version > target:
+                break
+            print(f"Applying migration {version}: {description}")
+            apply(cursor)
+            cursor.execute(
+                'INSERT INTO schema_version (version, description) VALUES (%s, %s)',
+                (version, description)
+            )
+            if not backend.transactional_ddl:
+                conn.commit()
+            applied.append(version)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        backend.release_lock(cursor, MIGRATION_LOCK)
+        cursor.close()
+    return applied
@@ -0,0 +1,101 @@
+"""Per-process cache of rendered public pages and page fragments.
+
+``@cached_page(*tags)`` serves a GET view from memory, keyed by the view
+and its full path (query string included, so every "Load more" page is its
+own entry). ``tags`` name the data versions (see data_versions.py) the page
+is built from: an entry is used only while none of them changed and for at
+most its ttl, so a page is fresh right after an admin posts an event.
+
+Pages that extend base.html show the visitor's menu and flashed messages,
+so whole responses are cached only for visitors who are not logged in and
+have no message pending. For everyone else the templates wrap their shared
+content in ``{% call cache_fragment(name, tags) %}``, which caches just that
+markup under the same rules; the view still runs its queries.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from markupsafe import Markup
+
+from data_versions import data_state
+
+PAGE_CACHE_TTL = float(os.environ.get('PAGE_CACHE_TTL', 300))  # seconds
+PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 256))  # pages and fragments per process
+
+
+class PageCache:
+    def __init__(self, size=PAGE_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()  # key -> (expires at, data versions, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, state):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[0] or entry[1] != state:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def put(self, key, state, value, ttl=PAGE_CACHE_TTL):
+        if self.size <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, state, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+page_cache = PageCache()
+
+
+def _shared_response():
+    """True if this visitor gets the same page as everyone else (not logged in, no flashed message)."""
+    return '_user_id' not in session and '_flashes' not in session
+
+
+def cached_page(*tags, ttl=PAGE_CACHE_TTL, per_visitor=True):
+    """Cache a GET view's 200 responses; ``per_visitor=False`` for pages that never show the visitor's state."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or (per_visitor and not _shared_response()):
+                return view(*args, **kwargs)
+            key = ('page', request.endpoint, request.full_path)
+            state = data_state(tags)  # before the view reads: a racing change leaves the entry stale
+            cached = page_cache.get(key, state)
+            if cached is not None:
+                body, content_type = cached
+                return current_app.response_class(body, content_type=content_type)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                page_cache.put(key, state, (response.get_data(), response.content_type), ttl)
+            return response
+        return wrapper
+    return decorator
+
+
+def cache_fragment(name, tags=(), ttl=PAGE_CACHE_TTL, caller=None):
+    """Template helper: ``{% call cache_fragment('events', ['events']) %}...{% endcall %}``.
+
+    The fragment is keyed by ``name`` and the request's endpoint and full path.
+    """
+    key = ('fragment', name, request.endpoint, request.full_path)
+    state = data_state(tuple(tags))
+    html = page_cache.get(key, state)
+    if html is None:
+        html = Markup(caller())
+        page_cache.put(key, state, html, ttl)
+    return html
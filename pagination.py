@@ -0,0 +1,104 @@
+"""Keyset (cursor) pagination for listings.
+
+Instead of OFFSET, a page continues strictly after the sort key of the last
+row it returned, so every page is one bounded index range scan however deep
+the reader goes. Cursors are opaque url-safe tokens holding that sort key;
+every key list ends with the primary key so the order is total.
+"""
+import base64
+import json
+import os
+
+from flask import abort, request, url_for
+
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 25))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 100))
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=str, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        abort(400, description='Invalid page cursor')
+    if not isinstance(values, list):
+        abort(400, description='Invalid page cursor')
+    return values
+
+
+def page_size(default=PAGE_SIZE):
+    try:
+        size = int(request.args.get('limit', default))
+    except ValueError:
+        abort(400, description="'limit' must be an integer")
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_condition(exprs, values, descending):
+    """SQL for "row sorts after (values)" on the given key expressions."""
+    op = '<' if descending else '>'
+    clauses = []
+    for i, expr in enumerate(exprs):
+        parts = [f'{prev} = %s' for prev in exprs[:i]] + [f'{expr} {op} %s']
+        clauses.append('(' + ' AND '.join(parts) + ')')
+    params = []
+    for i in range(len(exprs)):
+        params.extend(values[:i + 1])
+    return '(' + ' OR '.join(clauses) + ')', params
+
+
+class Page:
+    def __init__(self, items, next_cursor, param):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.param = param
+
+    @property
+    def has_more(self):
+        return self.next_cursor is not None
+
+    def next_url(self):
+        args = request.args.to_dict()
+        args.pop('fragment', None)
+        args[self.param] = self.next_cursor
+        return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def paginate(cursor, sql, params, keys, descending=True, param='cursor', limit=None):
+    """Run one page of ``sql`` and return a Page.
+
+    ``sql`` is a SELECT whose WHERE clause contains a ``{keyset}`` marker;
+    ORDER BY and LIMIT are appended here. ``keys`` is a list of
+    (sql_expression, row_field) pairs, the last one unique.
+    """
+    limit = limit or page_size()
+    after = decode_cursor(request.args.get(param))
+    exprs = [expr for expr, _ in keys]
+
+    if after is not None:
+        if len(after) != len(keys):
+            abort(400, description='Invalid page cursor')
+        keyset, keyset_params = keyset_condition(exprs, after, descending)
+    else:
+        keyset, keyset_params = '1=1', []
+
+    direction = 'DESC' if descending else 'ASC'
+    order_by = ', '.join(f'{expr} {direction}' for expr in exprs)
+    cursor.execute(
+        sql.replace('{keyset}', keyset) + f' ORDER BY {order_by} LIMIT {int(limit) + 1}',
+        list(params) + keyset_params
+    )
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][field] for _, field in keys])
+    return Page(rows, next_cursor, param)
@@ -0,0 +1,105 @@
+"""Password hashing on a bounded worker pool.
+
+Checking a password is deliberately expensive (scrypt by default), so a
+burst of logins run on the request threads would take every worker and
+stall unrelated pages. ``check_password`` and ``hash_password`` instead run
+on a pool of PASSWORD_POOL_SIZE threads; hashlib releases the GIL while it
+hashes, so the pool uses that many cores and no more. At most
+PASSWORD_POOL_QUEUE further requests wait for it. A request that cannot
+get a place, or whose result is not ready within PASSWORD_TIMEOUT seconds,
+gets ``HashingBusy`` and the caller answers 503 instead of piling up.
+
+PASSWORD_HASH_METHOD sets the cost of new hashes (a Werkzeug method such as
+``scrypt:32768:8:1`` or ``pbkdf2:sha256:600000``). A hash made with other
+parameters still verifies; ``check_password`` then also returns a new hash
+so the caller can store the upgrade.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_POOL_SIZE = int(os.environ.get('PASSWORD_POOL_SIZE', os.cpu_count() or 2))
+PASSWORD_POOL_QUEUE = int(os.environ.get('PASSWORD_POOL_QUEUE', 4 * PASSWORD_POOL_SIZE))
+PASSWORD_TIMEOUT = float(os.environ.get('PASSWORD_TIMEOUT', 10))  # seconds, waiting included
+
+
+class HashingBusy(Exception):
+    """The hashing pool is saturated; retry later."""
+
+
+class HashingPool:
+    def __init__(self, size=PASSWORD_POOL_SIZE, queue=PASSWORD_POOL_QUEUE, timeout=PASSWORD_TIMEOUT):
+        self.size = size
+        self.queue = queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(size + queue)  # running plus waiting
+
+    def run(self, func, *args):
+        """Run ``func(*args)`` on the pool and return its result, or raise HashingBusy."""
+        deadline = time.monotonic() + self.timeout
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Too many password checks waiting')
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            future.cancel()  # if it has not started, its place goes to the next request
+            raise HashingBusy('Password check timed out') from None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+password_pool = HashingPool()
+
+
+def configure_pool(size, queue=None, timeout=PASSWORD_TIMEOUT):
+    """Replace the pool (used by ``flask bench-login`` to compare sizes)."""
+    global password_pool
+    old, password_pool = password_pool, HashingPool(size, 4 * size if queue is None else queue, timeout)
+    old.shutdown()
+    return password_pool
+
+
+def _method(password_hash):
+    return password_hash.split('$', 1)[0]
+
+
+@lru_cache(maxsize=None)
+def current_method():
+    """PASSWORD_HASH_METHOD with Werkzeug's defaults filled in (e.g. 'scrypt' -> 'scrypt:32768:8:1')."""
+    return _method(generate_password_hash('', PASSWORD_HASH_METHOD))
+
+
+def needs_rehash(password_hash):
+    return _method(password_hash) != current_method()
+
+
+def hash_password(password):
+    """A new hash of ``password`` with the configured method, computed on the pool."""
+    return password_pool.run(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def _check(password_hash, password):
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if needs_rehash(password_hash):
+        return True, generate_password_hash(password, PASSWORD_HASH_METHOD)
+    return True, None
+
+
+def check_password(password_hash, password):
+    """Return (valid, upgraded hash or None) for a stored hash, computed on the pool.
+
+    Raises HashingBusy when the pool is saturated.
+    """
+    if not password_hash:
+        return False, None
+    return password_pool.run(_check, password_hash, password)
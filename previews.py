@@ -0,0 +1,263 @@
+"""Metadata and small previews for stored material files, built by a background job.
+
+After an upload commits, the ``material_preview`` job reads the blob once
+and records its MIME type, size, page (or slide) count and a short text
+excerpt in ``blob_previews``, and renders a first-page thumbnail under
+PREVIEW_ROOT. Previews are keyed by the blob's SHA-256 like the blob
+itself, so identical uploads share one.
+
+Rendering uses what is installed: Pillow for JPG/PNG (and to shrink the
+thumbnails embedded in DOCX/PPTX files), PyMuPDF or poppler's
+``pdftoppm`` for PDFs; excerpts come from ``document_text``. Without them a file still gets its metadata and
+excerpt, and the listing shows an icon instead of a thumbnail.
+"""
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import zipfile
+
+from blob_store import blob_store
+from document_text import SLIDE_RE, extract_text, read_entry
+from jobs import enqueue, enqueue_many, handler
+from upload_limits import file_extension, matches_type
+
+try:
+    from PIL import Image
+except ImportError:  # optional: image thumbnails
+    Image = None
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:  # optional: PDF thumbnails without poppler
+    fitz = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # optional: exact PDF page counts
+    PdfReader = None
+
+PREVIEW_ROOT = os.environ.get('PREVIEW_ROOT', os.path.join('uploads', 'previews'))
+THUMBNAIL_PX = int(os.environ.get('PREVIEW_THUMBNAIL_PX', 320))  # longest side
+EXCERPT_CHARS = 300
+SCAN_BLOCK = 1024 * 1024
+SCAN_OVERLAP = 256  # longer than any dictionary fragment the PDF patterns match
+PDFTOPPM = shutil.which('pdftoppm')
+
+MIME_TYPES = {
+    'pdf': 'application/pdf',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'zip': 'application/zip',
+    'txt': 'text/plain',
+    'jpg': 'image/jpeg',
+    'png': 'image/png',
+}
+THUMBNAIL_MIME_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png'}
+
+PDF_COUNT_RE = re.compile(rb'/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b', re.S)
+PDF_PAGE_RE = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+
+
+def thumbnail_path(name):
+    return os.path.join(PREVIEW_ROOT, name)
+
+
+def thumbnail_mime_type(name):
+    return THUMBNAIL_MIME_TYPES[file_extension(name)]
+
+
+def queue_preview(cursor, sha256, filename):
+    """Queue the preview job for a newly stored blob unless it already has one."""
+    cursor.execute('SELECT 1 FROM blob_previews WHERE sha256=%s', (sha256,))
+    if cursor.fetchone() is None:
+        enqueue(cursor, 'material_preview', {'sha256': sha256, 'extension': file_extension(filename)})
+
+
+def queue_previews(cursor, blobs):
+    """``queue_preview`` for many blobs ({sha256: filename}): one lookup, one batched insert."""
+    if not blobs:
+        return
+    placeholders = ','.join(['%s'] * len(blobs))
+    cursor.execute(f'SELECT sha256 FROM blob_previews WHERE sha256 IN ({placeholders})', list(blobs))
+    done = {row[0] for row in cursor.fetchall()}
+    enqueue_many(cursor, 'material_preview', [{'sha256': sha256, 'extension': file_extension(filename)}
+                                              for sha256, filename in blobs.items() if sha256 not in done])
+
+
+def _excerpt(text):
+    return text[:EXCERPT_CHARS] + ('…' if len(text) > EXCERPT_CHARS else '') if text else None
+
+
+def pdf_page_count(path):
+    if PdfReader is not None:
+        try:
+            return len(PdfReader(path).pages)
+        except Exception:
+            pass  # damaged file: fall back to scanning it
+    counts, pages, tail = [], 0, b''
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(SCAN_BLOCK)
+            if not block:
+                break
+            data = tail + block
+            # only count matches that end in this block's new bytes; the overlap is rescanned next time
+            limit = len(data) - SCAN_OVERLAP if len(block) == SCAN_BLOCK else len(data)
+            counts.extend(int(m.group(1) or m.group(2)) for m in PDF_COUNT_RE.finditer(data)
+                          if len(tail) < m.end() and m.start() < limit)
+            pages += sum(1 for m in PDF_PAGE_RE.finditer(data) if len(tail) < m.end() and m.start() < limit)
+            tail = data[limit:] if limit < len(data) else b''
+    # the root /Pages node carries the total; page objects may be hidden in compressed streams
+    return max(counts) if counts else (pages or None)
+
+
+def _render_pdf(path, target_base):
+    """Render page 1 to ``target_base``.png; return the file name or None."""
+    if fitz is not None:
+        with fitz.open(path) as document:
+            page = document[0]
+            zoom = THUMBNAIL_PX / max(page.rect.width, page.rect.height)
+            page.get_pixmap(matrix=fitz.Matrix(zoom, zoom)).save(target_base + '.png')
+        return target_base + '.png'
+    if PDFTOPPM:
+        subprocess.run([PDFTOPPM, '-png', '-f', '1', '-l', '1', '-singlefile', '-scale-to', str(THUMBNAIL_PX),
+                        path, target_base], check=True, timeout=60, capture_output=True)
+        return target_base + '.png'
+    return None
+
+
+def _shrink_image(source, target_base, extension):
+    """Write a THUMBNAIL_PX thumbnail of an image file or stream; return the file name or None."""
+    if Image is None:
+        return None
+    with Image.open(source) as image:
+        image.thumbnail((THUMBNAIL_PX, THUMBNAIL_PX))
+        if extension == 'jpg':
+            image.convert('RGB').save(target_base + '.jpg', 'JPEG', quality=80, optimize=True)
+        else:
+            image.save(target_base + '.png', 'PNG', optimize=True)
+    return f'{target_base}.{extension}'
+
+
+def describe_office(path, extension, target_base):
+    """Page/slide count and embedded thumbnail of a DOCX or PPTX file."""
+    info = {'page_count': None, 'thumbnail': None}
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        if 'docProps/app.xml' in names:
+            tag = 'Slides' if extension == 'pptx' else 'Pages'
+            match = re.search(rf'<{tag}>(\d+)</{tag}>', read_entry(archive, 'docProps/app.xml'))
+            if match:
+                info['page_count'] = int(match.group(1))
+        if extension == 'pptx' and info['page_count'] is None:
+            info['page_count'] = sum(1 for name in names if SLIDE_RE.match(name)) or None
+
+        # Office saves a first-page/slide thumbnail when "save preview picture" is on
+        for name, kind in (('docProps/thumbnail.jpeg', 'jpg'), ('docProps/thumbnail.png', 'png')):
+            if name in names:
+                with archive.open(name) as entry:
+                    if Image is not None:
+                        info['thumbnail'] = _shrink_image(entry, target_base, kind)
+                    else:
+                        with open(f'{target_base}.{kind}', 'wb') as out:
+                            shutil.copyfileobj(entry, out)
+                        info['thumbnail'] = f'{target_base}.{kind}'
+                break
+    return info
+
+
+def describe(path, extension, target_base):
+    """Collect the preview fields for one file; thumbnails are written next to ``target_base``."""
+    with open(path, 'rb') as f:
+        head = f.read(8)
+    info = {
+        'mime_type': MIME_TYPES.get(extension, 'application/octet-stream') if matches_type(extension, head)
+        else 'application/octet-stream',
+        'size': os.path.getsize(path),
+        'page_count': None,
+        'excerpt': None,
+        'thumbnail': None,
+    }
+    if info['mime_type'] == 'application/octet-stream':
+        return info
+    if extension == 'pdf':
+        info['page_count'] = pdf_page_count(path)
+        info['thumbnail'] = _render_pdf(path, target_base)
+    elif extension in ('jpg', 'png'):
+        info['page_count'] = 1
+        info['thumbnail'] = _shrink_image(path, target_base, extension)
+    elif extension in ('docx', 'pptx'):
+        try:
+            info.update(describe_office(path, extension, target_base))
+        except zipfile.BadZipFile:
+            pass
+    info['excerpt'] = _excerpt(extract_text(path, extension, limit=EXCERPT_CHARS + 1))
+    return info
+
+
+@handler('material_preview')
+def build_preview(conn, payload):
+    sha256 = payload['sha256']
+    cursor = conn.cursor()
+    cursor.execute('SELECT 1 FROM blob_previews WHERE sha256=%s', (sha256,))
+    if cursor.fetchone() is not None or not blob_store.exists(sha256):
+        cursor.close()
+        return  # already built, or the material was deleted before the job ran
+
+    # render into a scratch directory, then move the thumbnail into place
+    directory = os.path.join(PREVIEW_ROOT, sha256[:2])
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=PREVIEW_ROOT) as scratch:
+        info = describe(blob_store.path(sha256), payload.get('extension', ''), os.path.join(scratch, sha256))
+        thumbnail = None
+        if info['thumbnail'] and os.path.getsize(info['thumbnail']) > 0:
+            thumbnail = f'{sha256[:2]}/{os.path.basename(info["thumbnail"])}'
+            os.replace(info['thumbnail'], thumbnail_path(thumbnail))
+
+    cursor.execute(
+        'INSERT IGNORE INTO blob_previews (sha256, mime_type, size, page_count, thumbnail, excerpt) '
+        'VALUES (%s, %s, %s, %s, %s, %s)',
+        (sha256, info['mime_type'], info['size'], info['page_count'], thumbnail, info['excerpt'])
+    )
+    cursor.close()
+
+
+def remove_preview(cursor, sha256):
+    """Drop the preview of a blob whose last reference is gone; the caller commits."""
+    cursor.execute('SELECT 1 FROM blobs WHERE sha256=%s', (sha256,))
+    if cursor.fetchone() is not None:
+        return  # the same content was uploaded again meanwhile
+    cursor.execute('SELECT thumbnail FROM blob_previews WHERE sha256=%s', (sha256,))
+    row = cursor.fetchone()
+    cursor.execute('DELETE FROM blob_previews WHERE sha256=%s', (sha256,))
+    if row and row[0]:
+        try:
+            os.remove(thumbnail_path(row[0]))
+        except FileNotFoundError:
+            pass
+
+
+def collect_preview_garbage(cursor):
+    """Delete previews of blobs that no longer exist; return how many. The caller commits."""
+    cursor.execute('SELECT p.sha256 FROM blob_previews p LEFT JOIN blobs b ON b.sha256 = p.sha256 '
+                   'WHERE b.sha256 IS NULL')
+    orphaned = [row[0] for row in cursor.fetchall()]
+    for sha256 in orphaned:
+        remove_preview(cursor, sha256)
+    return len(orphaned)
+
+
+def queue_missing_previews(cursor):
+    """Queue preview jobs for stored blobs that have none yet; return how many."""
+    cursor.execute(
+        'SELECT b.sha256, MIN(m.original_filename) FROM blobs b '
+        'JOIN materials m ON m.blob_sha256 = b.sha256 '
+        'LEFT JOIN blob_previews p ON p.sha256 = b.sha256 '
+        'WHERE p.sha256 IS NULL GROUP BY b.sha256'
+    )
+    missing = cursor.fetchall()
+    for sha256, filename in missing:
+        enqueue(cursor, 'material_preview', {'sha256': sha256, 'extension': file_extension(filename)})
+    return len(missing)
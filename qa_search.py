@@ -0,0 +1,144 @@
+"""Search over the text of Q&A messages.
+
+Message bodies are stored base64-encoded in ``encrypted_message`` and only
+decoded when a page renders them, so SQL cannot search them. The
+``message_search`` table keeps the decoded text of every question and
+reply under the message id: an FTS5 table on SQLite, a FULLTEXT-indexed
+table on MySQL. ``index_message`` adds a message in the transaction that
+inserts it.
+
+``search_threads_sql`` returns one row per thread containing a match,
+carrying its best-matching message, so a results page is one query. Its
+scopes mirror the pages that list questions: faculty and admins search the
+threads they received (as on /faculty/questions); a material or subject
+scope matches the questions its materials page shows to any logged-in user.
+"""
+import base64
+import binascii
+import re
+
+from markupsafe import Markup, escape
+
+from database_config import backend
+
+MESSAGE_SEARCH_TABLE = 'message_search'
+HIGHLIGHT_CHARS = 160
+INDEX_BATCH_SIZE = 500
+
+
+def _key():
+    return 'rowid' if backend.name == 'sqlite' else 'message_id'
+
+
+def decode_message(encoded):
+    """Plain text of a stored message ('' if it is not valid base64 UTF-8)."""
+    try:
+        return base64.b64decode(encoded or '').decode('utf-8')
+    except (binascii.Error, ValueError):
+        return ''
+
+
+def create_message_search(cursor):
+    if backend.name == 'sqlite':
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {MESSAGE_SEARCH_TABLE} USING fts5(
+                body, tokenize = 'porter unicode61 remove_diacritics 2'
+            )
+        ''')
+    else:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {MESSAGE_SEARCH_TABLE} (
+                message_id INT PRIMARY KEY,
+                body TEXT,
+                FULLTEXT KEY ft_message_search (body),
+                FOREIGN KEY(message_id) REFERENCES messages(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB
+        ''')
+
+
+def index_message(cursor, message_id, encoded):
+    cursor.execute(f'INSERT INTO {MESSAGE_SEARCH_TABLE} ({_key()}, body) VALUES (%s, %s)',
+                   (message_id, decode_message(encoded)))
+
+
+def unindex_material_messages(cursor, material_id):
+    """Drop the messages of a material about to be deleted (FTS5 tables have no cascades)."""
+    cursor.execute(
+        f'DELETE FROM {MESSAGE_SEARCH_TABLE} WHERE {_key()} IN (SELECT id FROM messages WHERE material_id=%s)',
+        (material_id,)
+    )
+
+
+def index_all_messages(cursor):
+    """Rebuild the index from every stored message; return how many were indexed."""
+    cursor.execute(f'DELETE FROM {MESSAGE_SEARCH_TABLE}')
+    cursor.execute('SELECT id, encrypted_message FROM messages')
+    rows = [(message_id, decode_message(encoded)) for message_id, encoded in cursor.fetchall()]
+    for start in range(0, len(rows), INDEX_BATCH_SIZE):
+        cursor.executemany(f'INSERT INTO {MESSAGE_SEARCH_TABLE} ({_key()}, body) VALUES (%s, %s)',
+                           rows[start:start + INDEX_BATCH_SIZE])
+    return len(rows)
+
+
+def search_threads_sql(terms, receiver_id=None, material_id=None, subject_id=None):
+    """(sql with a {keyset} marker, params) for the threads whose messages contain all ``terms``.
+
+    Each row is a thread (``thread_id`` is its question's id) with the
+    question, its best match (``match_id``, ``match_body``) and a ``score``
+    to paginate on. ``receiver_id`` limits it to threads whose question was
+    sent to that user.
+    """
+    filters, filter_params = '', []
+    for column, value in (('q.receiver_id', receiver_id), ('m.material_id', material_id),
+                          ('mat.subject_id', subject_id)):
+        if value is not None:
+            filters += f' AND {column} = %s'
+            filter_params.append(value)
+
+    table = MESSAGE_SEARCH_TABLE
+    if backend.name == 'sqlite':
+        match = ' '.join('"{}"*'.format(term.replace('"', '')) for term in terms)
+        score, where = f'-bm25({table})', f'{table} MATCH %s'
+        params = [match]
+    else:
+        match = ' '.join(f'+{term}*' for term in terms)
+        score = where = f'MATCH({table}.body) AGAINST (%s IN BOOLEAN MODE)'
+        params = [match, match]  # once for the score, once for the filter
+    # score each match first: SQLite cannot use bm25() inside the window function
+    sql = f'''
+        SELECT * FROM (
+            SELECT matches.*, ROW_NUMBER() OVER (PARTITION BY thread_id ORDER BY score DESC, match_id) AS match_rank
+            FROM (
+                SELECT m.root_id AS thread_id, m.id AS match_id, {table}.body AS match_body, {score} AS score,
+                       q.encrypted_message, q.created_at, u.name AS student_name,
+                       mat.id AS material_id, mat.subject_id, mat.original_filename AS file_name
+                FROM {table}
+                JOIN messages m ON m.id = {table}.{_key()}
+                JOIN messages q ON q.id = m.root_id
+                JOIN users u ON u.id = q.sender_id
+                JOIN materials mat ON mat.id = m.material_id
+                WHERE {where}{filters}
+            ) matches
+        ) threads WHERE match_rank = 1 AND {{keyset}}
+    '''
+    return sql, params + filter_params
+
+
+THREAD_SEARCH_KEYS = [('score', 'score'), ('thread_id', 'thread_id')]
+
+
+def highlight(text, terms, width=HIGHLIGHT_CHARS):
+    """An escaped excerpt of ``text`` around the first match with every term prefix in <mark>."""
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(term) for term in terms) + r')\w*', re.I)
+    first = pattern.search(text)
+    start = max(0, first.start() - width // 3) if first else 0
+    window = text[start:start + width]
+    parts, last = [], 0
+    for match in pattern.finditer(window):
+        parts.append(escape(window[last:match.start()]))
+        parts.append(Markup('<mark>%s</mark>') % match.group(0))
+        last = match.end()
+    parts.append(escape(window[last:]))
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if start + width < len(text) else ''
+    return Markup(prefix) + Markup('').join(parts) + Markup(suffix)
@@ -0,0 +1,103 @@
+"""Loading and maintenance of Q&A threads (questions plus nested replies).
+
+Every message stores its thread position as a materialized path: the
+zero-padded ids of its ancestors and itself, e.g. ``0000000012.0000000045.``.
+Together with ``root_id`` and ``depth`` this lets the full reply trees of a
+page of questions load with one indexed scan already ordered for rendering
+(parents before children, siblings oldest first), whatever the depth.
+"""
+
+REPLY_BATCH_SIZE = 500  # ids per IN (...) list
+PATH_SEGMENT_WIDTH = 10
+MAX_THREAD_DEPTH = 60   # thread_path is VARCHAR(700), 11 characters per level
+
+
+def path_segment(message_id):
+    return f'{message_id:0{PATH_SEGMENT_WIDTH}d}.'
+
+
+def assign_thread_path(cursor, message_id, parent=None):
+    """Set root_id/thread_path/depth of a freshly inserted message.
+
+    ``parent`` is the replied-to row (with root_id, thread_path and depth),
+    or None for a top-level question.
+    """
+    if parent is None:
+        root_id, path, depth = message_id, path_segment(message_id), 0
+    else:
+        root_id = parent['root_id']
+        path = parent['thread_path'] + path_segment(message_id)
+        depth = parent['depth'] + 1
+    cursor.execute(
+        'UPDATE messages SET root_id=%s, thread_path=%s, depth=%s WHERE id=%s',
+        (root_id, path, depth, message_id)
+    )
+
+
+def backfill_thread_paths(cursor):
+    """Compute thread paths for messages stored before paths existed."""
+    cursor.execute('SELECT COUNT(*) FROM messages WHERE thread_path IS NULL')
+    if not cursor.fetchone()[0]:
+        return
+    cursor.execute('SELECT id, reply_to FROM messages ORDER BY id')
+    parents = dict(cursor.fetchall())
+
+    paths = {}
+
+    def resolve(msg_id):
+        chain = []
+        while msg_id is not None and msg_id not in paths:
+            chain.append(msg_id)
+            msg_id = parents.get(msg_id)
+        for node in reversed(chain):
+            parent = parents.get(node)
+            if parent is None or parent not in paths:
+                paths[node] = (node, path_segment(node), 0)
+            else:
+                root_id, path, depth = paths[parent]
+                paths[node] = (root_id, path + path_segment(node), depth + 1)
+
+    for msg_id in parents:
+        resolve(msg_id)
+    cursor.executemany(
+        'UPDATE messages SET root_id=%s, thread_path=%s, depth=%s WHERE id=%s',
+        [(root_id, path, depth, msg_id) for msg_id, (root_id, path, depth) in paths.items()]
+    )
+
+
+def fetch_replies(cursor, question_ids):
+    """Return {question_id: [reply, ...]} with every nested reply in render order.
+
+    Each reply carries ``depth`` (1 for a direct reply) and ``reply_to``.
+    """
+    replies = {qid: [] for qid in question_ids}
+    ids = list(replies)
+    for start in range(0, len(ids), REPLY_BATCH_SIZE):
+        batch = ids[start:start + REPLY_BATCH_SIZE]
+        placeholders = ','.join(['%s'] * len(batch))
+        cursor.execute(f"""
+            SELECT r.id, r.root_id, r.reply_to, r.depth, r.encrypted_message, r.created_at,
+                   u.name AS sender_name
+            FROM messages r
+            JOIN users u ON r.sender_id = u.id
+            WHERE r.root_id IN ({placeholders}) AND r.depth > 0
+            ORDER BY r.root_id, r.thread_path
+        """, batch)
+        for row in cursor.fetchall():
+            replies[row['root_id']].append(row)
+    return replies
+
+
+def build_threads(cursor, questions, id_key='msg_id'):
+    """Return {question_id: {"q": question, "replies": [...]}} in question order."""
+    replies = fetch_replies(cursor, [q[id_key] for q in questions])
+    return {q[id_key]: {'q': q, 'replies': replies[q[id_key]]} for q in questions}
+
+
+def threads_by_material(cursor, questions, id_key='msg_id'):
+    """Return {material_id: {question_id: {"q": question, "replies": [...]}}}."""
+    grouped = {}
+    for qid, thread in build_threads(cursor, questions, id_key).items():
+        grouped.setdefault(thread['q']['material_id'], {})[qid] = thread
+    return grouped
+
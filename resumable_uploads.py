@@ -0,0 +1,191 @@
+"""Resumable, chunked uploads (modelled on the tus protocol).
+
+A client creates an upload session declaring the file name, size and
+target subject, then sends the file as numbered chunks of ``chunk_size``
+bytes in any order, retrying any that failed. Each chunk is streamed
+straight to its offset in ``<UPLOAD_SESSION_DIR>/<session id>.part`` and
+may carry an ``Upload-Checksum: sha256 <base64 digest>`` header. The
+session row and ``upload_chunks`` record what arrived, so progress
+survives a dropped connection or a restarted worker. Completing the
+session moves the assembled file into the blob store.
+
+Sessions idle for longer than UPLOAD_SESSION_TTL are removed by
+``expire_sessions`` (``flask gc-uploads``).
+"""
+import base64
+import hashlib
+import os
+import secrets
+import time
+
+from upload_limits import SNIFF_BYTES, file_extension, matches_type
+
+UPLOAD_SESSION_DIR = os.environ.get('UPLOAD_SESSION_DIR', os.path.join('uploads', 'sessions'))
+UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 24 * 3600))  # seconds
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_RESUMABLE_UPLOAD_SIZE', 2 * 1024 ** 3))  # bytes
+DEFAULT_CHUNK_SIZE = 5 * 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """A request the upload protocol rejects; carries the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def part_path(session_id):
+    return os.path.join(UPLOAD_SESSION_DIR, f'{session_id}.part')
+
+
+def chunk_count(session):
+    return max(1, -(-session['total_size'] // session['chunk_size']))
+
+
+def chunk_length(session, number):
+    """Expected byte length of chunk ``number`` (the last one may be short)."""
+    if number == chunk_count(session) - 1:
+        return session['total_size'] - number * session['chunk_size']
+    return session['chunk_size']
+
+
+def create_session(cursor, uploader_id, subject_id, filename, total_size, chunk_size=DEFAULT_CHUNK_SIZE):
+    chunk_size = max(MIN_CHUNK_SIZE, min(int(chunk_size), MAX_CHUNK_SIZE))
+    session_id = secrets.token_hex(16)
+    os.makedirs(UPLOAD_SESSION_DIR, exist_ok=True)
+    with open(part_path(session_id), 'wb') as f:
+        f.truncate(total_size)  # sparse on most filesystems; chunks fill it in place
+    cursor.execute(
+        'INSERT INTO upload_sessions (id, uploader_id, subject_id, original_filename, total_size, chunk_size, '
+        'last_activity) VALUES (%s, %s, %s, %s, %s, %s, %s)',
+        (session_id, uploader_id, subject_id, filename, total_size, chunk_size, int(time.time()))
+    )
+    return session_id
+
+
+SESSION_COLUMNS = ('id', 'uploader_id', 'subject_id', 'original_filename', 'total_size', 'chunk_size',
+                   'last_activity')
+
+
+def get_session(cursor, session_id):
+    cursor.execute(f"SELECT {', '.join(SESSION_COLUMNS)} FROM upload_sessions WHERE id=%s", (session_id,))
+    row = cursor.fetchone()
+    return dict(zip(SESSION_COLUMNS, row)) if row else None
+
+
+def received_chunks(cursor, session_id):
+    """{chunk number: byte length} of the chunks stored so far."""
+    cursor.execute('SELECT chunk_no, size FROM upload_chunks WHERE session_id=%s', (session_id,))
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+def progress(cursor, session):
+    chunks = received_chunks(cursor, session['id'])
+    missing = [n for n in range(chunk_count(session)) if n not in chunks]
+    # tus-style offset: bytes received without a gap from the start
+    first_gap = missing[0] if missing else chunk_count(session)
+    offset = min(session['total_size'], first_gap * session['chunk_size'])
+    return {
+        'id': session['id'],
+        'filename': session['original_filename'],
+        'size': session['total_size'],
+        'chunk_size': session['chunk_size'],
+        'chunks': chunk_count(session),
+        'received_bytes': sum(chunks.values()),
+        'offset': offset,
+        'missing_chunks': missing,
+        'complete': not missing,
+    }
+
+
+def parse_checksum(header):
+    """Decode an ``Upload-Checksum: sha256 <base64>`` header (hex is accepted too)."""
+    if not header:
+        return None
+    algorithm, _, value = header.strip().partition(' ')
+    if algorithm.lower() != 'sha256' or not value:
+        raise UploadError('Only sha256 checksums are supported', 400)
+    value = value.strip()
+    if len(value) == 64:
+        return value.lower()
+    try:
+        return base64.b64decode(value, validate=True).hex()
+    except ValueError:
+        raise UploadError('Malformed Upload-Checksum header', 400)
+
+
+def write_chunk(cursor, session, number, stream, content_length, offset=None, checksum=None, limit=None):
+    """Stream one chunk to its place in the part file and record it.
+
+    ``offset`` (the Upload-Offset header) is optional and must match the
+    chunk number. Re-sending a chunk overwrites it, so retries are safe.
+    ``limit`` is the uploader's size limit for the file type; a chunk that
+    would take the bytes received past it is refused with 413.
+    """
+    if not 0 <= number < chunk_count(session):
+        raise UploadError(f"Chunk {number} is out of range (0-{chunk_count(session) - 1})", 404)
+    start = number * session['chunk_size']
+    if offset is not None and offset != start:
+        raise UploadError(f"Upload-Offset {offset} does not match chunk {number} (expected {start})", 409)
+    expected = chunk_length(session, number)
+    if content_length is None:
+        raise UploadError('Content-Length is required', 411)
+    if content_length != expected:
+        raise UploadError(f"Chunk {number} must be {expected} bytes, got {content_length}", 400)
+    if limit is not None:
+        cursor.execute('SELECT COALESCE(SUM(size), 0) FROM upload_chunks WHERE session_id=%s AND chunk_no<>%s',
+                       (session['id'], number))
+        if cursor.fetchone()[0] + expected > limit:
+            raise UploadError(f"Uploads of this type are limited to {limit} bytes", 413)
+
+    # forget the chunk until it is fully rewritten (the caller commits on errors too)
+    cursor.execute('DELETE FROM upload_chunks WHERE session_id=%s AND chunk_no=%s', (session['id'], number))
+    digest = hashlib.sha256()
+    written = 0
+    with open(part_path(session['id']), 'r+b') as f:
+        f.seek(start)
+        while written < expected:
+            data = stream.read(min(COPY_BUFFER_SIZE, expected - written))
+            if not data:
+                break
+            if written == 0 and number == 0:
+                extension = file_extension(session['original_filename'])
+                if not matches_type(extension, data[:SNIFF_BYTES]):
+                    raise UploadError(f"This does not look like a .{extension} file", 415)
+            digest.update(data)
+            f.write(data)
+            written += len(data)
+    if written != expected:
+        raise UploadError(f"Chunk {number} ended after {written} of {expected} bytes; resend it", 400)
+    if checksum is not None and digest.hexdigest() != checksum:
+        raise UploadError(f"Checksum mismatch for chunk {number}; resend it", 460)
+
+    cursor.execute(
+        'INSERT INTO upload_chunks (session_id, chunk_no, size, sha256) VALUES (%s, %s, %s, %s)',
+        (session['id'], number, written, digest.hexdigest())
+    )
+    cursor.execute('UPDATE upload_sessions SET last_activity=%s WHERE id=%s', (int(time.time()), session['id']))
+    return written
+
+
+def delete_session(cursor, session_id, keep_file=False):
+    cursor.execute('DELETE FROM upload_chunks WHERE session_id=%s', (session_id,))
+    cursor.execute('DELETE FROM upload_sessions WHERE id=%s', (session_id,))
+    if not keep_file:
+        try:
+            os.remove(part_path(session_id))
+        except FileNotFoundError:
+            pass
+
+
+def expire_sessions(cursor, ttl=UPLOAD_SESSION_TTL):
+    """Remove sessions idle for more than ``ttl`` seconds; return how many. The caller commits."""
+    cursor.execute('SELECT id FROM upload_sessions WHERE last_activity < %s', (int(time.time()) - ttl,))
+    expired = [row[0] for row in cursor.fetchall()]
+    for session_id in expired:
+        delete_session(cursor, session_id)
+    return len(expired)
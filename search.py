@@ -0,0 +1,231 @@
+"""Full-text search over materials.
+
+``material_search`` holds one document per material: its file name, the
+subject name and course code, and the text extracted from the file. On
+SQLite it is an FTS5 table whose rowid is the material id; on MySQL an
+InnoDB table with FULLTEXT indexes. Names and titles weigh more than body
+text in the ranking.
+
+The index is kept current as materials change: ``index_material`` writes
+the name fields in the upload's transaction and queues the
+``index_material_text`` job for the document text, ``unindex_material``
+runs with the delete. ``flask reindex-search`` rebuilds it for files that
+are already stored, extracting their text in a process pool.
+"""
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from blob_store import material_file
+from curriculum import course_code
+from database_config import backend
+from document_text import extract_text
+from jobs import enqueue, enqueue_many, handler
+from upload_limits import file_extension
+
+SEARCH_TABLE = 'material_search'
+MAX_QUERY_TERMS = 8
+SEARCH_WORKERS = int(os.environ.get('SEARCH_WORKERS', os.cpu_count() or 2))
+COMMIT_EVERY = 50
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+# SQLite column weights for bm25(): title, subject, course_code, body
+BM25_WEIGHTS = '10.0, 4.0, 8.0, 1.0'
+
+
+def _key():
+    return 'rowid' if backend.name == 'sqlite' else 'material_id'
+
+
+def create_search_index(cursor):
+    if backend.name == 'sqlite':
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+                title, subject, course_code, body,
+                tokenize = 'porter unicode61 remove_diacritics 2'
+            )
+        ''')
+    else:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+                material_id INT PRIMARY KEY,
+                title VARCHAR(255),
+                subject VARCHAR(255),
+                course_code VARCHAR(16),
+                body MEDIUMTEXT,
+                FULLTEXT KEY ft_material_search (title, subject, course_code, body),
+                FULLTEXT KEY ft_material_search_title (title, course_code),
+                FOREIGN KEY(material_id) REFERENCES materials(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB
+        ''')
+
+
+def _material_names(cursor, where, params):
+    cursor.execute(
+        'SELECT m.id, m.original_filename, s.name FROM materials m JOIN subjects s ON s.id = m.subject_id '
+        f'WHERE {where}', params
+    )
+    return cursor.fetchall()
+
+
+def _write_documents(cursor, rows, bodies):
+    """Replace the documents of (id, original_filename, subject name) rows; ``bodies`` maps id to text."""
+    key = _key()
+    cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE {key}=%s', [(row[0],) for row in rows])
+    cursor.executemany(
+        f'INSERT INTO {SEARCH_TABLE} ({key}, title, subject, course_code, body) VALUES (%s, %s, %s, %s, %s)',
+        [(material_id, title, subject, course_code(subject or ''), bodies.get(material_id, ''))
+         for material_id, title, subject in rows]
+    )
+
+
+def _bodies(cursor, material_ids):
+    if not material_ids:
+        return {}
+    placeholders = ','.join(['%s'] * len(material_ids))
+    cursor.execute(f'SELECT {_key()}, body FROM {SEARCH_TABLE} WHERE {_key()} IN ({placeholders})',
+                   list(material_ids))
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+def index_material(cursor, material_id):
+    """Index a new material by name now and queue the extraction of its text."""
+    _write_documents(cursor, _material_names(cursor, 'm.id=%s', (material_id,)), {})
+    enqueue(cursor, 'index_material_text', {'material_id': material_id})
+
+
+def index_materials(cursor, material_ids):
+    """``index_material`` for the materials of a bulk upload, with batched statements."""
+    if not material_ids:
+        return
+    placeholders = ','.join(['%s'] * len(material_ids))
+    _write_documents(cursor, _material_names(cursor, f'm.id IN ({placeholders})', list(material_ids)), {})
+    enqueue_many(cursor, 'index_material_text', [{'material_id': material_id} for material_id in material_ids])
+
+
+def unindex_material(cursor, material_id):
+    cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {_key()}=%s', (material_id,))
+
+
+def reindex_subject(cursor, subject_id):
+    """Refresh the subject name and course code of a subject's materials (after a rename)."""
+    rows = _material_names(cursor, 'm.subject_id=%s', (subject_id,))
+    _write_documents(cursor, rows, _bodies(cursor, [row[0] for row in rows]))
+
+
+def index_names(cursor):
+    """Rebuild every document from the materials' names, without body text; return how many."""
+    cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    rows = _material_names(cursor, '1=1', ())
+    _write_documents(cursor, rows, {})
+    return len(rows)
+
+
+def set_body(cursor, material_id, text):
+    cursor.execute(f'UPDATE {SEARCH_TABLE} SET body=%s WHERE {_key()}=%s', (text, material_id))
+
+
+def _material_file(cursor, material_id, upload_folder='uploads'):
+    cursor.execute('SELECT filename, original_filename, blob_sha256 FROM materials WHERE id=%s', (material_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None, None
+    material = {'filename': row[0], 'blob_sha256': row[2]}
+    return material_file(material, upload_folder), file_extension(row[1])
+
+
+@handler('index_material_text')
+def index_material_text(conn, payload):
+    cursor = conn.cursor()
+    path, extension = _material_file(cursor, payload['material_id'])
+    if path is not None and os.path.isfile(path):  # gone if the material was deleted meanwhile
+        set_body(cursor, payload['material_id'], extract_text(path, extension))
+    cursor.close()
+
+
+def rebuild_index(conn, workers=SEARCH_WORKERS, names_only=False, upload_folder='uploads', echo=print):
+    """Rebuild every document: names in one pass, then file text extracted in ``workers`` processes.
+
+    Materials sharing a file are extracted once. Returns (documents, files extracted).
+    """
+    cursor = conn.cursor()
+    documents = index_names(cursor)
+    conn.commit()
+    if names_only:
+        cursor.close()
+        return documents, 0
+
+    cursor.execute('SELECT id, filename, original_filename, blob_sha256 FROM materials')
+    by_file = {}
+    for material_id, filename, original_filename, sha256 in cursor.fetchall():
+        path = material_file({'filename': filename, 'blob_sha256': sha256}, upload_folder)
+        if os.path.isfile(path):
+            by_file.setdefault((path, file_extension(original_filename)), []).append(material_id)
+
+    extracted = 0
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(extract_text, path, extension): (path, extension)
+                   for path, extension in by_file}
+        for future in as_completed(futures):
+            text = future.result()
+            for material_id in by_file[futures[future]]:
+                set_body(cursor, material_id, text)
+            extracted += 1
+            if extracted % COMMIT_EVERY == 0:
+                conn.commit()
+                echo(f"  {extracted}/{len(futures)} files indexed")
+    conn.commit()
+    cursor.close()
+    return documents, extracted
+
+
+def query_terms(text):
+    return TERM_RE.findall((text or '').lower())[:MAX_QUERY_TERMS]
+
+
+def search_sql(terms, department_id=None, semester_id=None):
+    """(sql with a {keyset} marker, params) ranking materials that contain all ``terms`` (as prefixes).
+
+    Rows carry a ``score`` (higher is better) to paginate on with the material ``id``.
+    """
+    filters, filter_params = '', []
+    if department_id is not None:
+        filters += ' AND d.id = %s'
+        filter_params.append(department_id)
+    if semester_id is not None:
+        filters += ' AND sem.id = %s'
+        filter_params.append(semester_id)
+    joins = '''
+        JOIN subjects sub ON sub.id = m.subject_id
+        JOIN semesters sem ON sem.id = sub.semester_id
+        JOIN departments d ON d.id = sem.department_id
+    '''
+    columns = ('m.id, m.filename, m.original_filename, m.subject_id, sub.name AS subject, '
+               f'{SEARCH_TABLE}.course_code, sem.id AS semester_id, sem.name AS semester, d.id AS department_id, '
+               'd.name AS department')
+
+    if backend.name == 'sqlite':
+        match = ' '.join('"{}"*'.format(term.replace('"', '')) for term in terms)
+        inner = f'''
+            SELECT {columns}, -bm25({SEARCH_TABLE}, {BM25_WEIGHTS}) AS score
+            FROM {SEARCH_TABLE} JOIN materials m ON m.id = {SEARCH_TABLE}.rowid {joins}
+            WHERE {SEARCH_TABLE} MATCH %s{filters}
+        '''
+        params = [match] + filter_params
+    else:
+        match = ' '.join(f'+{term}*' for term in terms)
+        inner = f'''
+            SELECT {columns},
+                   2 * MATCH(title, {SEARCH_TABLE}.course_code) AGAINST (%s IN BOOLEAN MODE)
+                   + MATCH(title, {SEARCH_TABLE}.subject, {SEARCH_TABLE}.course_code, body)
+                     AGAINST (%s IN BOOLEAN MODE) AS score
+            FROM {SEARCH_TABLE} JOIN materials m ON m.id = {SEARCH_TABLE}.material_id {joins}
+            WHERE MATCH(title, {SEARCH_TABLE}.subject, {SEARCH_TABLE}.course_code, body)
+                  AGAINST (%s IN BOOLEAN MODE){filters}
+        '''
+        params = [match, match, match] + filter_params
+    return f'SELECT * FROM ({inner}) hits WHERE {{keyset}}', params
+
+
+SEARCH_KEYS = [('score', 'score'), ('id', 'id')]
@@ -0,0 +1,125 @@
+"""Fingerprinted static assets: the build, asset_url and encoding negotiation in send_asset.
+
+Run with ``python -m pytest test_assets.py``; no database is needed.
+"""
+import gzip
+import os
+
+import pytest
+from flask import Flask
+
+from assets import ASSET_MAX_AGE, BUILD_DIR, MANIFEST, asset_url, build_assets, send_asset
+
+CSS = b'body { margin: 0; padding: 0; }\n' * 200
+
+
+@pytest.fixture
+def static(tmp_path):
+    folder = tmp_path / 'static'
+    (folder / 'img').mkdir(parents=True)
+    (folder / 'custom.css').write_bytes(CSS)
+    (folder / 'img' / 'logo.png').write_bytes(b'\x89PNG\r\n\x1a\n' + b'\x00' * 64)
+    return folder
+
+
+@pytest.fixture
+def static_app(static):
+    app = Flask(__name__, static_folder=str(static))
+
+    @app.route('/assets/<path:filename>')
+    def asset(filename):
+        return send_asset(app.static_folder, filename)
+
+    return app
+
+
+@pytest.fixture
+def built(static_app, static):
+    """(manifest, client) after a build, with a brotli variant of the CSS (real or not, the bytes are opaque)."""
+    manifest = build_assets(str(static))
+    target = os.path.join(static, BUILD_DIR, manifest['custom.css'])
+    with open(target + '.br', 'wb') as f:
+        f.write(b'brotli bytes')
+    return manifest, static_app.test_client()
+
+
+def test_build_fingerprints_names_and_compresses_text_files(static):
+    manifest = build_assets(str(static))
+    css, png = manifest['custom.css'], manifest['img/logo.png']
+    assert css.startswith('custom.') and css.endswith('.css') and css != 'custom.css'
+    assert png.startswith('img/logo.') and png.endswith('.png')
+    dist = static / BUILD_DIR
+    assert gzip.decompress((dist / (css + '.gz')).read_bytes()) == CSS
+    assert not (dist / (png + '.gz')).exists()  # not a compressible type
+    assert (dist / MANIFEST).exists()
+
+
+def test_changed_file_gets_a_new_name_and_old_builds_stay(static):
+    first = build_assets(str(static))['custom.css']
+    (static / 'custom.css').write_bytes(CSS + b'a { color: red; }\n')
+    second = build_assets(str(static))['custom.css']
+    assert second != first
+    assert (static / BUILD_DIR / first).exists()
+
+
+def test_asset_url_points_at_the_build_or_falls_back_to_static(static_app, static):
+    with static_app.test_request_context():
+        assert asset_url('custom.css') == '/static/custom.css'
+    manifest = build_assets(str(static))
+    with static_app.test_request_context():
+        assert asset_url('custom.css') == f"/assets/{manifest['custom.css']}"
+
+
+def get(client, name, accept_encoding=None):
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding is not None else {}
+    return client.get(f'/assets/{name}', headers=headers)
+
+
+def test_gzip_is_sent_to_clients_that_accept_it(built):
+    manifest, client = built
+    response = get(client, manifest['custom.css'], 'gzip, deflate')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert gzip.decompress(response.data) == CSS
+
+
+def test_brotli_is_preferred_at_equal_quality(built):
+    manifest, client = built
+    response = get(client, manifest['custom.css'], 'gzip, br')
+    assert response.headers['Content-Encoding'] == 'br'
+    assert response.data == b'brotli bytes'
+
+
+def test_higher_quality_wins(built):
+    manifest, client = built
+    response = get(client, manifest['custom.css'], 'br;q=0.5, gzip;q=1.0')
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+
+@pytest.mark.parametrize('accept_encoding', [None, 'identity', 'gzip;q=0, br;q=0'])
+def test_plain_file_when_no_variant_is_accepted(built, accept_encoding):
+    manifest, client = built
+    response = get(client, manifest['custom.css'], accept_encoding)
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == CSS
+
+
+def test_uncompressed_types_are_sent_as_is(built):
+    manifest, client = built
+    response = get(client, manifest['img/logo.png'], 'gzip, br')
+    assert 'Content-Encoding' not in response.headers
+    assert response.mimetype == 'image/png'
+
+
+def test_assets_are_immutable_and_vary_on_accept_encoding(built):
+    manifest, client = built
+    response = get(client, manifest['custom.css'], 'gzip')
+    assert response.cache_control.max_age == ASSET_MAX_AGE
+    assert response.cache_control.immutable
+    assert 'Accept-Encoding' in response.vary
+
+
+@pytest.mark.parametrize('name', [MANIFEST, 'custom.css', '../custom.css', 'missing.1234.css'])
+def test_manifest_sources_and_unknown_files_are_404(built, name):
+    _, client = built
+    assert get(client, name).status_code == 404
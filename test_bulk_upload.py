@@ -0,0 +1,64 @@
+"""Planning bulk uploads: per-file limits and the archive caps.
+
+Run with ``python -m pytest test_bulk_upload.py``; no database is needed.
+"""
+import io
+import zipfile
+
+import pytest
+
+import bulk_upload
+import upload_limits
+from bulk_upload import plan_archive
+from upload_limits import MB
+
+
+def make_zip(entries):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in entries:
+            archive.writestr(name, content)
+    data.seek(0)
+    return zipfile.ZipFile(data)
+
+
+def plan(archive, role=None):
+    # department, semester and subject given: the files sit at the top of the archive
+    return plan_archive(archive, None, role, department_id=1, semester_id=1, subject_id=7)
+
+
+def pdf(size):
+    return b'%PDF-1.4\n' + b'0' * (size - 9)
+
+
+@pytest.fixture(autouse=True)
+def small_limits(monkeypatch):
+    monkeypatch.setattr(upload_limits, 'MAX_FILE_SIZE', 1 * MB)  # no logged-in user: 1 MB per file
+    monkeypatch.setattr(bulk_upload, 'BULK_MAX_UNPACKED', 3 * MB)
+
+
+def test_archive_files_within_their_limit_are_accepted_whatever_the_total():
+    items = plan(make_zip([(f'notes{i}.pdf', pdf(900 * 1024)) for i in range(3)]))
+    assert [item.status for item in items] == ['pending'] * 3
+    assert {item.subject_id for item in items} == {7}
+
+
+def test_archive_entry_over_its_limit_is_rejected_alone():
+    items = plan(make_zip([('small.pdf', pdf(1024)), ('big.pdf', pdf(int(1.5 * MB)))]))
+    assert [item.status for item in items] == ['pending', 'rejected']
+    assert items[1].error == 'exceeds the 1 MB limit for .pdf files'
+
+
+def test_archive_expanding_past_the_bulk_cap_is_refused():
+    with pytest.raises(ValueError, match='expands to more than 3 MB'):
+        plan(make_zip([(f'notes{i}.pdf', pdf(900 * 1024)) for i in range(4)]))
+
+
+def test_archive_entry_of_a_disallowed_type_is_rejected():
+    items = plan(make_zip([('setup.exe', b'MZ')]))
+    assert items[0].error == 'files of type .exe are not accepted'
+
+
+def test_role_that_cannot_upload_gets_every_file_rejected():
+    items = plan(make_zip([('notes.pdf', pdf(1024))]), role='student')
+    assert items[0].status == 'rejected'
@@ -0,0 +1,116 @@
+"""send_stored_file in direct mode and behind a fake offloading proxy.
+
+Run with ``python -m pytest test_downloads.py``; no database is needed.
+"""
+import hashlib
+import os
+
+import pytest
+from flask import Flask
+
+from downloads import send_stored_file
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def upload_root(tmp_path):
+    blob = tmp_path / 'blobs' / SHA256[:2] / SHA256[2:4] / SHA256
+    blob.parent.mkdir(parents=True)
+    blob.write_bytes(CONTENT)
+    return tmp_path
+
+
+@pytest.fixture
+def make_client(upload_root):
+    def make_client(offload):
+        app = Flask(__name__)
+        path = os.path.join(upload_root, 'blobs', SHA256[:2], SHA256[2:4], SHA256)
+
+        @app.route('/download')
+        def download():
+            return send_stored_file(path, 'notes.pdf', etag=SHA256, upload_root=str(upload_root),
+                                    offload=offload)
+
+        @app.route('/missing')
+        def missing():
+            return send_stored_file(os.path.join(upload_root, 'nope'), 'nope.pdf', offload=offload)
+
+        return app.test_client()
+    return make_client
+
+
+def test_direct_download_sends_the_file_with_validators(make_client):
+    response = make_client('').get('/download')
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.headers['ETag'] == f'"{SHA256}"'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert 'attachment; filename=notes.pdf' in response.headers['Content-Disposition']
+    assert 'X-Accel-Redirect' not in response.headers
+    assert 'X-Sendfile' not in response.headers
+
+
+def test_direct_download_answers_range_with_206(make_client):
+    response = make_client('').get('/download', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(CONTENT)}'
+    assert response.data == CONTENT[100:200]
+
+
+def test_direct_download_answers_open_range_to_the_end(make_client):
+    response = make_client('').get('/download', headers={'Range': 'bytes=10000-'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 10000-{len(CONTENT) - 1}/{len(CONTENT)}'
+    assert response.data == CONTENT[10000:]
+
+
+def test_direct_download_answers_if_none_match_with_304(make_client):
+    response = make_client('').get('/download', headers={'If-None-Match': f'"{SHA256}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_x_accel_redirect_points_nginx_at_the_file(make_client, monkeypatch):
+    monkeypatch.setattr('downloads.X_ACCEL_PREFIX', '/protected-uploads/')
+    response = make_client('x-accel-redirect').get('/download')
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == f'/protected-uploads/blobs/{SHA256[:2]}/{SHA256[2:4]}/{SHA256}'
+    assert response.data == b''  # the proxy sends the bytes
+    assert response.headers.get('Content-Length') in (None, '0')  # not the file's; nginx sets it
+    assert response.headers['ETag'] == f'"{SHA256}"'
+    assert 'attachment; filename=notes.pdf' in response.headers['Content-Disposition']
+
+
+def test_x_sendfile_gives_the_absolute_path(make_client, upload_root):
+    response = make_client('x-sendfile').get('/download')
+    assert response.status_code == 200
+    assert response.headers['X-Sendfile'] == os.path.join(
+        os.path.abspath(upload_root), 'blobs', SHA256[:2], SHA256[2:4], SHA256)
+    assert response.data == b''
+    assert 'X-Accel-Redirect' not in response.headers
+
+
+@pytest.mark.parametrize('offload, header', [('x-accel-redirect', 'X-Accel-Redirect'),
+                                             ('x-sendfile', 'X-Sendfile')])
+def test_offload_answers_if_none_match_with_304_and_no_offload_header(make_client, offload, header):
+    response = make_client(offload).get('/download', headers={'If-None-Match': f'"{SHA256}"'})
+    assert response.status_code == 304
+    assert header not in response.headers
+    assert response.data == b''
+
+
+@pytest.mark.parametrize('offload, header', [('x-accel-redirect', 'X-Accel-Redirect'),
+                                             ('x-sendfile', 'X-Sendfile')])
+def test_offload_leaves_ranges_to_the_proxy(make_client, offload, header):
+    response = make_client(offload).get('/download', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 200
+    assert header in response.headers
+    assert 'Content-Range' not in response.headers
+    assert response.data == b''
+
+
+@pytest.mark.parametrize('offload', ['', 'x-accel-redirect', 'x-sendfile'])
+def test_missing_file_is_404_in_every_mode(make_client, offload):
+    assert make_client(offload).get('/missing').status_code == 404
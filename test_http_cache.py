@@ -0,0 +1,81 @@
+"""ETags and Cache-Control on the JSON API, validated by data versions.
+
+Run with ``python -m pytest test_http_cache.py``; uses the SQLite test database.
+"""
+import base64
+import io
+import itertools
+
+from database_config import record_queries
+from http_cache import API_CATALOG_MAX_AGE
+
+BASIC_AUTH = {'Authorization': 'Basic ' + base64.b64encode(b'sakthi:sakthi').decode('ascii')}
+SUBJECT_ID = 1
+_numbers = itertools.count()
+
+
+def materials_url():
+    return f'/api/materials/{SUBJECT_ID}'
+
+
+def material_queries(statements):
+    return [sql for sql, _ in statements if 'FROM materials' in sql]
+
+
+def upload_material(app):
+    n = next(_numbers)
+    response = app.test_client().post('/api/upload', headers=BASIC_AUTH, content_type='multipart/form-data', data={
+        'file': (io.BytesIO(b'%PDF-1.4\n' + f'notes {n}'.encode()), f'notes{n}.pdf'), 'subject': str(SUBJECT_ID)})
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+
+def test_response_carries_an_etag_and_public_revalidation(app):
+    response = app.test_client().get(materials_url())
+    assert response.status_code == 200
+    assert response.headers['ETag']
+    assert response.cache_control.public
+    assert response.cache_control.max_age == 0
+    assert response.cache_control.must_revalidate
+    assert [header.lower() for header in response.vary] == ['accept-encoding']  # no Cookie: shareable
+
+
+def test_if_none_match_gets_304_without_querying(app):
+    client = app.test_client()
+    etag = client.get(materials_url()).headers['ETag']
+    with record_queries() as statements:
+        response = client.get(materials_url(), headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    assert material_queries(statements) == []
+
+
+def test_weak_validator_matches_too(app):
+    client = app.test_client()
+    etag = client.get(materials_url()).headers['ETag']
+    assert client.get(materials_url(), headers={'If-None-Match': f'W/{etag}'}).status_code == 304
+
+
+def test_upload_changes_the_etag(app):
+    client = app.test_client()
+    etag = client.get(materials_url()).headers['ETag']
+    upload_material(app)
+    response = client.get(materials_url(), headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.json
+
+
+def test_query_string_is_part_of_the_etag(app):
+    client = app.test_client()
+    first = client.get(materials_url()).headers['ETag']
+    assert client.get(materials_url() + '?limit=1').headers['ETag'] != first
+    assert client.get(materials_url() + '?limit=1', headers={'If-None-Match': first}).status_code == 200
+
+
+def test_catalog_endpoints_may_be_reused_for_the_catalog_ttl(app):
+    response = app.test_client().get('/api/departments')
+    assert response.status_code == 200
+    assert response.cache_control.max_age == API_CATALOG_MAX_AGE
+    again = app.test_client().get('/api/departments', headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
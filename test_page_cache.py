@@ -0,0 +1,103 @@
+"""Rendered-page cache of the public pages, invalidated by data versions.
+
+Run with ``python -m pytest test_page_cache.py``; uses the SQLite test database.
+"""
+import base64
+import itertools
+import time
+
+import pytest
+
+from database_config import pool, record_queries
+from page_cache import PageCache, page_cache
+
+BASIC_AUTH = {'Authorization': 'Basic ' + base64.b64encode(b'sakthi:sakthi').decode('ascii')}
+_numbers = itertools.count()
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    page_cache.clear()
+
+
+def department_id():
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT MIN(id) FROM departments')
+        row = cursor.fetchone()
+        cursor.close()
+    return row[0]
+
+
+def post_event(app):
+    title = f"Symposium {next(_numbers)}"
+    response = app.test_client().post('/admin/events/new', headers=BASIC_AUTH, data={
+        'department_id': department_id(), 'title': title, 'content': 'Talks all day', 'author': 'Dean'})
+    assert response.status_code == 302
+    return title
+
+
+def event_queries(statements):
+    return [sql for sql, _ in statements if 'FROM events' in sql]
+
+
+def test_anonymous_page_is_served_from_the_cache(app):
+    client = app.test_client()
+    first = client.get('/events')
+    with record_queries() as statements:
+        second = client.get('/events')
+    assert second.status_code == 200
+    assert second.data == first.data
+    assert event_queries(statements) == []
+
+
+def test_posting_an_event_invalidates_the_page(app):
+    client = app.test_client()
+    client.get('/events')
+    title = post_event(app)
+    with record_queries() as statements:
+        page = client.get('/events').get_data(as_text=True)
+    assert title in page
+    assert event_queries(statements)
+
+
+def test_department_page_is_invalidated_too(app):
+    client = app.test_client()
+    client.get(f'/events/{department_id()}')
+    title = post_event(app)
+    assert title in client.get(f'/events/{department_id()}').get_data(as_text=True)
+
+
+def test_signed_in_visitors_get_their_own_page(app, login):
+    app.test_client().get('/events')  # cached for anonymous visitors
+    client = login('student@college.local', 'studentpass', 'student')
+    with record_queries() as statements:
+        page = client.get('/events').get_data(as_text=True)
+    assert event_queries(statements)  # the view ran
+    assert 'href="/logout"' in page  # their menu, not the anonymous copy
+
+
+def test_cache_entry_is_stale_when_its_data_version_moved():
+    cache = PageCache(size=2)
+    cache.put('page', (1,), 'old')
+    assert cache.get('page', (1,)) == 'old'
+    assert cache.get('page', (2,)) is None
+    assert cache.get('page', (1,)) is None  # the stale entry was dropped
+
+
+def test_cache_entry_expires_after_its_ttl(monkeypatch):
+    cache = PageCache()
+    cache.put('page', (), 'html', ttl=10)
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 11)
+    assert cache.get('page', ()) is None
+
+
+def test_cache_evicts_the_least_recently_used():
+    cache = PageCache(size=2)
+    cache.put('a', (), 'a')
+    cache.put('b', (), 'b')
+    cache.get('a', ())
+    cache.put('c', (), 'c')
+    assert cache.get('b', ()) is None
+    assert cache.get('a', ()) == 'a' and cache.get('c', ()) == 'c'
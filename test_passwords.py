@@ -0,0 +1,117 @@
+"""Password checks on the bounded pool: hash upgrades on login and 503s when it is full.
+
+Run with ``python -m pytest test_passwords.py``; uses the SQLite test database.
+"""
+import base64
+import threading
+
+import pytest
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import passwords
+from database_config import pool
+from passwords import HashingBusy, HashingPool, check_password, current_method
+
+OLD_METHOD = 'pbkdf2:sha256:500'
+BASIC_AUTH = {'Authorization': 'Basic ' + base64.b64encode(b'sakthi:sakthi').decode('ascii')}
+
+
+def stored_hash(email):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT password_hash FROM users WHERE email=%s', (email,))
+        row = cursor.fetchone()
+        cursor.close()
+    return row[0]
+
+
+def add_user(email, password_hash, role='student'):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO users (email, password_hash, role, name) VALUES (%s, %s, %s, %s)',
+                       (email, password_hash, role, 'Old Hash'))
+        conn.commit()
+        cursor.close()
+
+
+def test_check_password_returns_an_upgrade_only_for_old_parameters():
+    old = generate_password_hash('secret', OLD_METHOD)
+    valid, upgraded = check_password(old, 'secret')
+    assert valid and upgraded.startswith(current_method() + '$')
+    assert check_password(upgraded, 'secret') == (True, None)
+    assert check_password(old, 'wrong') == (False, None)
+
+
+def test_login_upgrades_a_hash_made_with_old_parameters(app, login):
+    add_user('upgrade@x.edu', generate_password_hash('secret', OLD_METHOD))
+    login('upgrade@x.edu', 'secret', 'student')
+    upgraded = stored_hash('upgrade@x.edu')
+    assert upgraded.startswith(current_method() + '$')
+    assert check_password_hash(upgraded, 'secret')
+    login('upgrade@x.edu', 'secret', 'student')
+    assert stored_hash('upgrade@x.edu') == upgraded  # current hashes are kept
+
+
+def test_wrong_password_does_not_upgrade(app):
+    add_user('keep@x.edu', generate_password_hash('secret', OLD_METHOD))
+    before = stored_hash('keep@x.edu')
+    response = app.test_client().post('/login', data={'email': 'keep@x.edu', 'password': 'nope', 'role': 'student'})
+    assert response.status_code == 200
+    assert stored_hash('keep@x.edu') == before
+
+
+def test_full_pool_raises_hashing_busy():
+    busy_pool = HashingPool(size=1, queue=0, timeout=5)
+    release = threading.Event()
+    worker = threading.Thread(target=busy_pool.run, args=(release.wait,))
+    worker.start()
+    try:
+        while busy_pool._slots.acquire(blocking=False):  # wait until the worker holds the only slot
+            busy_pool._slots.release()
+        with pytest.raises(HashingBusy):
+            busy_pool.run(len, 'x')
+        release.set()
+        worker.join()
+        assert busy_pool.run(len, 'x') == 1  # the slot is free again
+    finally:
+        release.set()
+        busy_pool.shutdown()
+
+
+@pytest.fixture
+def busy(monkeypatch):
+    def saturated(*args):
+        raise HashingBusy('Too many password checks waiting')
+    monkeypatch.setattr(passwords.password_pool, 'run', saturated)
+
+
+def test_busy_login_answers_503_with_the_form(app, busy):
+    response = app.test_client().post('/login', data={'email': 'student@college.local',
+                                                      'password': 'studentpass', 'role': 'student'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    assert 'Too many sign-ins right now' in response.get_data(as_text=True)
+
+
+def test_busy_registration_answers_an_html_page(app, busy):
+    response = app.test_client().post('/register', data={'name': 'N', 'email': 'busy@x.edu',
+                                                         'password': 'secret1', 'role': 'student'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    assert response.mimetype == 'text/html'
+    assert 'Server busy' in response.get_data(as_text=True)
+
+
+def test_busy_api_answers_json(app, busy):
+    response = app.test_client().post('/api/upload', headers=BASIC_AUTH)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    assert response.json == {'error': 'Server busy, retry shortly'}
+
+
+def test_register_hashes_with_the_current_method(app):
+    response = app.test_client().post('/register', data={'name': 'New', 'email': 'new@x.edu',
+                                                         'password': 'secret1', 'role': 'student'})
+    assert response.status_code == 302
+    assert stored_hash('new@x.edu').startswith(current_method() + '$')
+    assert check_password(stored_hash('new@x.edu'), 'secret1') == (True, None)
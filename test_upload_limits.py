@@ -0,0 +1,82 @@
+"""GuardedRequest limits on single and bulk multipart uploads.
+
+Run with ``python -m pytest test_upload_limits.py``; no database is needed.
+"""
+import io
+
+import pytest
+from flask import Flask, jsonify, request
+from flask_login import LoginManager
+
+import upload_limits
+from upload_limits import MB, GuardedRequest, accepts_bulk
+
+
+def pdf(size):
+    return io.BytesIO(b'%PDF-1.4\n' + b'x' * (size - 9))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(upload_limits, 'MAX_FILE_SIZE', 1 * MB)  # basic-auth requests: 1 MB per file
+    monkeypatch.setattr(upload_limits, 'BULK_MAX_UNPACKED', 4 * MB)
+    app = Flask(__name__)
+    app.request_class = GuardedRequest
+    LoginManager(app).user_loader(lambda user_id: None)
+
+    def sizes():
+        return jsonify([len(f.read()) for f in request.files.getlist('file')])
+
+    @app.route('/single', methods=['POST'])
+    def single():
+        return sizes()
+
+    @app.route('/bulk', methods=['POST'])
+    @accepts_bulk
+    def bulk():
+        return sizes()
+
+    @app.errorhandler(413)
+    @app.errorhandler(415)
+    def rejected(e):
+        return jsonify({'error': e.description}), e.code
+
+    return app.test_client()
+
+
+def post(client, path, *files):
+    return client.post(path, data={'file': [(f, f'notes{i}.pdf') for i, f in enumerate(files)]},
+                       content_type='multipart/form-data')
+
+
+def test_bulk_upload_may_exceed_the_per_file_limit_in_total(client):
+    response = post(client, '/bulk', pdf(700 * 1024), pdf(700 * 1024), pdf(700 * 1024))
+    assert response.status_code == 200
+    assert response.json == [700 * 1024] * 3
+
+
+def test_single_upload_endpoint_keeps_the_per_file_body_cap(client):
+    response = post(client, '/single', pdf(700 * 1024), pdf(700 * 1024))
+    assert response.status_code == 413
+
+
+def test_bulk_upload_still_rejects_a_file_over_its_limit(client):
+    response = post(client, '/bulk', pdf(100 * 1024), pdf(int(1.5 * MB)))
+    assert response.status_code == 413
+    assert 'notes1.pdf exceeds the 1 MB limit for .pdf files' in response.json['error']
+
+
+def test_bulk_upload_is_capped_in_total(client):
+    response = post(client, '/bulk', *[pdf(900 * 1024) for _ in range(5)])
+    assert response.status_code == 413
+
+
+def test_file_that_does_not_match_its_extension_is_rejected(client):
+    response = post(client, '/bulk', io.BytesIO(b'GIF89a not a pdf'))
+    assert response.status_code == 415
+
+
+def test_disallowed_type_is_rejected(client):
+    response = client.post('/bulk', data={'file': (io.BytesIO(b'MZ'), 'setup.exe')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 415
@@ -0,0 +1,99 @@
+"""The per-process session user cache and how user changes invalidate it.
+
+Run with ``python -m pytest test_user_cache.py``; uses the SQLite test database.
+"""
+import itertools
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from database_config import pool, record_queries
+from user_cache import user_cache
+
+_numbers = itertools.count()
+
+
+def run(sql, params=()):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        row = cursor.fetchone() if cursor.description else None
+        conn.commit()
+        cursor.close()
+    return row
+
+
+@pytest.fixture
+def student(app, login):
+    """(user id, signed-in client) for a new student."""
+    email = f"cached{next(_numbers)}@x.edu"
+    run('INSERT INTO users (email, password_hash, role, name) VALUES (%s, %s, %s, %s)',
+        (email, generate_password_hash('secret', 'pbkdf2:sha256:1000'), 'student', 'Cached Student'))
+    client = login(email, 'secret', 'student')
+    return run('SELECT id FROM users WHERE email=%s', (email,))[0], client
+
+
+@pytest.fixture
+def check_every_request(monkeypatch):
+    monkeypatch.setattr(user_cache, 'check_interval', 0)
+
+
+def user_lookups(statements):
+    return [sql for sql, _ in statements if sql.startswith('SELECT id, email, role, name, session_version')]
+
+
+def signed_in(client):
+    return client.get('/student/dashboard').status_code == 200
+
+
+def test_cached_user_is_authenticated_without_a_query(student, monkeypatch):
+    monkeypatch.setattr(user_cache, 'check_interval', 3600)
+    _, client = student
+    assert signed_in(client)
+    with record_queries() as statements:
+        assert signed_in(client)
+    assert not [sql for sql, _ in statements if 'FROM users' in sql]
+
+
+def test_admin_edit_logs_the_user_out(student, login):
+    user_id, client = student
+    assert signed_in(client)
+    admin = login('admin@college.local', 'adminpass', 'admin')
+    admin.post(f'/admin/users/edit/{user_id}', data={'name': 'Renamed', 'email': f'renamed{user_id}@x.edu'})
+    response = client.get('/student/dashboard')
+    assert response.status_code == 302 and '/login' in response.headers['Location']
+    assert run('SELECT name, session_version FROM users WHERE id=%s', (user_id,)) == ('Renamed', 1)
+
+
+def test_change_made_by_another_process_is_noticed_by_the_check(student, check_every_request):
+    user_id, client = student
+    assert signed_in(client)
+    run('UPDATE users SET session_version = session_version + 1 WHERE id=%s', (user_id,))  # no local forget
+    assert not signed_in(client)
+
+
+def test_deletion_by_another_process_is_noticed_by_the_check(student, check_every_request):
+    user_id, client = student
+    assert signed_in(client)
+    run('DELETE FROM users WHERE id=%s', (user_id,))
+    assert not signed_in(client)
+
+
+def test_only_the_changed_user_is_dropped(student, login, check_every_request):
+    user_id, client = student
+    other = login('student@college.local', 'studentpass', 'student')
+    assert signed_in(client) and signed_in(other)
+    run('UPDATE users SET session_version = session_version + 1 WHERE id=%s', (user_id,))
+    assert not signed_in(client)
+    with record_queries() as statements:
+        assert signed_in(other)
+    assert user_lookups(statements) == []  # still served from the cache
+
+
+def test_session_from_before_versions_still_loads(app):
+    user_id = run("SELECT id FROM users WHERE email='student@college.local'")[0]
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)  # no ":<version>"
+        session['_fresh'] = True
+    assert signed_in(client)
@@ -0,0 +1,96 @@
+"""Importing users from CSV: valid rows are created, bad and duplicate rows reported.
+
+Run with ``python -m pytest test_user_import.py``; uses the SQLite test database.
+"""
+import io
+
+import pytest
+from werkzeug.security import check_password_hash
+
+from database_config import pool
+from user_import import create_import, import_status, run_import
+
+DEPARTMENTS = {'cse': 'CSE'}
+
+
+@pytest.fixture
+def import_csv(app):
+    """``import_csv(text)`` -> the finished import's status, with ``workers=1``."""
+    def import_csv(text, filename='intake.csv'):
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            import_id = create_import(cursor, io.BytesIO(text.encode('utf-8')), filename, 'csv', queue=False)
+            conn.commit()
+            run_import(conn, import_id, DEPARTMENTS, workers=1)
+            status = import_status(cursor, import_id)
+            cursor.close()
+        return status
+    return import_csv
+
+
+def user(email):
+    with pool.connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute('SELECT email, name, role, department, password_hash FROM users WHERE email=%s', (email,))
+        row = cursor.fetchone()
+        cursor.close()
+    return row
+
+
+def test_valid_rows_are_created_with_hashed_passwords(import_csv):
+    status = import_csv('Email,Name,Password,Role,Department\n'
+                        'ada@x.edu,Ada,pw-ada,student,cse\n'
+                        'Bob@X.edu,Bob,pw-bob,faculty,\n')
+    assert (status['status'], status['total_rows'], status['created'], status['skipped']) == ('done', 2, 2, 0)
+    ada = user('ada@x.edu')
+    assert (ada['name'], ada['role'], ada['department']) == ('Ada', 'student', 'CSE')
+    assert check_password_hash(ada['password_hash'], 'pw-ada')
+    assert user('bob@x.edu')['role'] == 'faculty'  # emails are stored lower-case
+
+
+def test_invalid_rows_are_skipped_with_their_reason(import_csv):
+    status = import_csv('email,name,password,role,department\n'
+                        'not-an-email,X,pw,student,\n'
+                        'noname@x.edu,,pw,student,\n'
+                        'nopw@x.edu,No Password,,student,\n'
+                        'root@x.edu,Root,pw,admin,\n'
+                        'lost@x.edu,Lost,pw,student,Nowhere\n'
+                        'fine@x.edu,Fine,pw,,\n')
+    assert (status['created'], status['skipped']) == (1, 5)
+    assert [(e['row'], e['error']) for e in status['errors']] == [
+        (2, 'invalid email'),
+        (3, 'missing name'),
+        (4, 'missing password'),
+        (5, 'role must be one of student, faculty'),
+        (6, 'unknown department'),
+    ]
+    assert user('fine@x.edu')['role'] == 'student'  # the default role
+    assert user('root@x.edu') is None
+
+
+def test_duplicates_in_the_file_and_existing_users_are_skipped(import_csv):
+    status = import_csv('email,name,password\n'
+                        'twice@x.edu,First,pw1\n'
+                        'TWICE@x.edu,Second,pw2\n'
+                        'student@college.local,Existing,pw\n')
+    assert (status['created'], status['skipped']) == (1, 2)
+    assert [(e['row'], e['email'], e['error']) for e in status['errors']] == [
+        (3, 'twice@x.edu', 'duplicate email in the file'),
+        (4, 'student@college.local', 'already exists'),
+    ]
+    assert user('twice@x.edu')['name'] == 'First'
+    assert user('student@college.local')['name'] == 'John Student'
+
+
+def test_importing_the_same_file_again_creates_nothing(import_csv):
+    text = 'email,name,password\nagain@x.edu,Again,pw\n'
+    assert import_csv(text)['created'] == 1
+    status = import_csv(text)
+    assert (status['created'], status['skipped']) == (0, 1)
+    assert status['errors'][0]['error'] == 'already exists'
+
+
+def test_missing_columns_fail_the_whole_import(import_csv):
+    status = import_csv('email,fullname\nx@x.edu,X\n')
+    assert status['status'] == 'failed'
+    assert status['errors'] == [{'row': None, 'email': '', 'error': 'Missing column(s): name, password'}]
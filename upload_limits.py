@@ -0,0 +1,189 @@
+"""Upload size limits and file type checks applied while the body streams in.
+
+Werkzeug normally spools a whole multipart body to disk before a view can
+look at it. ``GuardedRequest`` enforces the limits during parsing instead:
+
+- the request's Content-Length is checked against the largest file the
+  user's role may upload before any of the body is read (413); views
+  marked ``@accepts_bulk`` take many files per request, so their bodies
+  may reach BULK_MAX_UNPACKED instead, each file still under its limit;
+- each file part is checked by extension as soon as its headers arrive
+  (415), its first bytes are sniffed against the extension's magic
+  numbers (415), and its running size against the per-extension and
+  per-role limit (413), so a bad upload stops at the first offending chunk.
+
+Limits are in MB and can be overridden with UPLOAD_LIMITS_MB
+(e.g. ``pdf=50,zip=200``) and ROLE_UPLOAD_LIMITS_MB (e.g. ``faculty=100``).
+Requests without a logged-in user (the HTTP basic-auth API) get MAX_FILE_SIZE.
+Views marked ``@accepts_spreadsheets`` (the user import) take CSV and XLSX
+files under SPREADSHEET_LIMITS instead of material types.
+"""
+import io
+import os
+import tempfile
+
+from flask import Request
+from flask_login import current_user
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+MB = 1024 * 1024
+MAX_FILE_SIZE = int(os.environ.get('MAX_FILE_SIZE_MB', 16)) * MB
+MULTIPART_OVERHEAD = 64 * 1024  # boundaries and the other form fields
+BULK_MAX_UNPACKED = int(os.environ.get('BULK_UPLOAD_MAX_UNPACKED_MB', 2048)) * MB  # all files of one bulk upload
+SNIFF_BYTES = 8
+SPOOL_IN_MEMORY = 512 * 1024
+
+
+def _limits_from_env(name, defaults):
+    limits = dict(defaults)
+    for item in filter(None, os.environ.get(name, '').split(',')):
+        key, _, value = item.partition('=')
+        limits[key.strip().lower()] = int(value) * MB
+    return limits
+
+
+EXTENSION_LIMITS = _limits_from_env('UPLOAD_LIMITS_MB', {
+    'pdf': 50 * MB, 'docx': 25 * MB, 'pptx': 100 * MB, 'zip': 200 * MB,
+    'txt': 2 * MB, 'jpg': 10 * MB, 'png': 10 * MB,
+})
+ROLE_LIMITS = _limits_from_env('ROLE_UPLOAD_LIMITS_MB', {
+    'admin': 200 * MB, 'faculty': 200 * MB, 'student': 0,
+})
+ALLOWED_EXTENSIONS = set(EXTENSION_LIMITS)
+
+# Spreadsheets are not materials: only views marked with accepts_spreadsheets take them
+SPREADSHEET_LIMITS = {'csv': 20 * MB, 'xlsx': 20 * MB}
+SPREADSHEET_ENDPOINTS = set()
+BULK_ENDPOINTS = set()
+
+# Leading bytes each type must start with (docx/pptx are zip containers)
+MAGIC_NUMBERS = {
+    'pdf': (b'%PDF-',),
+    'docx': (b'PK\x03\x04',),
+    'pptx': (b'PK\x03\x04',),
+    'zip': (b'PK\x03\x04', b'PK\x05\x06'),
+    'jpg': (b'\xff\xd8\xff',),
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'xlsx': (b'PK\x03\x04',),
+}
+
+
+def file_extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if filename and '.' in filename else ''
+
+
+def accepts_spreadsheets(view):
+    """Mark a view whose uploads are CSV/XLSX files instead of materials."""
+    SPREADSHEET_ENDPOINTS.add(view.__name__)
+    return view
+
+
+def accepts_bulk(view):
+    """Mark a view that takes several files (or a ZIP) per request, each under the per-file limits."""
+    BULK_ENDPOINTS.add(view.__name__)
+    return view
+
+
+def current_role():
+    if current_user and current_user.is_authenticated:
+        return current_user.role
+    return None
+
+
+def role_limit(role):
+    return ROLE_LIMITS.get(role, MAX_FILE_SIZE)
+
+
+def upload_limit(role, extension, limits=EXTENSION_LIMITS):
+    """Largest accepted file of ``extension`` for ``role`` (0 if not accepted)."""
+    return min(role_limit(role), limits.get(extension, 0))
+
+
+def matches_type(extension, head):
+    """True if the first bytes ``head`` are plausible for ``extension``."""
+    if extension in ('txt', 'csv'):
+        return b'\x00' not in head
+    signatures = MAGIC_NUMBERS.get(extension)
+    if signatures is None:
+        return False
+    return any(head.startswith(sig) for sig in signatures)
+
+
+class GuardedFile:
+    """File-like spool for one uploaded part that enforces its limit on every write."""
+
+    def __init__(self, target, filename, extension, limit):
+        self._target = target
+        self.filename = filename
+        self.extension = extension
+        self.limit = limit
+        self.size = 0
+        self._head = b''
+        self._sniffed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise RequestEntityTooLarge(
+                f"{self.filename} exceeds the {self.limit // MB} MB limit for .{self.extension} files"
+            )
+        if not self._sniffed:
+            self._head += data[:SNIFF_BYTES]
+            if len(self._head) >= SNIFF_BYTES:
+                self._sniff()
+        return self._target.write(data)
+
+    def _sniff(self):
+        self._sniffed = True
+        if not matches_type(self.extension, self._head[:SNIFF_BYTES]):
+            raise UnsupportedMediaType(f"{self.filename} does not look like a .{self.extension} file")
+
+    def seek(self, *args):
+        # Werkzeug rewinds the spool once the part is complete: sniff short files here
+        if not self._sniffed and self.size:
+            self._sniff()
+        return self._target.seek(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    def __iter__(self):
+        return iter(self._target)
+
+
+class GuardedRequest(Request):
+    """Flask request that applies the upload limits while parsing multipart bodies."""
+
+    @property
+    def max_content_length(self):
+        configured = super().max_content_length
+        if self.mimetype != 'multipart/form-data':
+            return configured
+        limit = role_limit(current_role())
+        if limit > 0 and self.endpoint in BULK_ENDPOINTS:
+            limit = max(limit, BULK_MAX_UNPACKED)
+        limit += MULTIPART_OVERHEAD
+        return limit if configured is None else min(limit, configured)
+
+    @max_content_length.setter
+    def max_content_length(self, value):
+        Request.max_content_length.fset(self, value)
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not filename:
+            return io.BytesIO()  # file input left empty; the view reports it
+        extension = file_extension(filename)
+        role = current_role()
+        limits = SPREADSHEET_LIMITS if self.endpoint in SPREADSHEET_ENDPOINTS else EXTENSION_LIMITS
+        if extension not in limits:
+            raise UnsupportedMediaType(f"Files of type .{extension or '?'} are not accepted")
+        limit = upload_limit(role, extension, limits)
+        if limit <= 0:
+            raise RequestEntityTooLarge('Your account cannot upload files')
+        if content_length is not None and content_length > limit:
+            raise RequestEntityTooLarge(f"{filename} exceeds the {limit // MB} MB limit for .{extension} files")
+        if total_content_length is not None and total_content_length <= SPOOL_IN_MEMORY:
+            target = io.BytesIO()
+        else:
+            target = tempfile.TemporaryFile('wb+')
+        return GuardedFile(target, filename, extension, limit)
@@ -0,0 +1,139 @@
+"""Per-process cache of the users Flask-Login loads on every request.
+
+A logged-in session stores ``<user id>:<session version>`` (``User.get_id``).
+``load_user`` looks that key up here and only queries ``users`` on a miss,
+so an ordinary page view authenticates without touching the database.
+Entries are small (id, email, role, name; never the password hash), live
+for USER_CACHE_TTL seconds and the least recently used are dropped beyond
+USER_CACHE_SIZE.
+
+Every change to a user (edit, revocation) increments its
+``session_version``, or deletes the row: sessions holding the old version
+no longer match and are logged out. The process that made the change
+forgets the user at once; every process also re-reads, at most every
+USER_CHECK_INTERVAL seconds, the session versions of the users it has
+cached (one primary-key lookup) and drops just the entries that no longer
+match. Other users' entries stay cached.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 60))  # seconds
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))  # users per process
+USER_CHECK_INTERVAL = float(os.environ.get('USER_CHECK_INTERVAL', 1))  # seconds between checks of cached users
+USER_CHECK_BATCH = 500  # ids per lookup
+
+
+class UserCache:
+    def __init__(self, ttl=USER_CACHE_TTL, size=USER_CACHE_SIZE, check_interval=USER_CHECK_INTERVAL):
+        self.ttl = ttl
+        self.size = size
+        self.check_interval = check_interval
+        self._entries = OrderedDict()  # (user id, session version) -> (loaded at, record)
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, record):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), record)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def forget(self, user_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def check(self, connect):
+        """Drop the entries of users deleted or given a new session version, by any process.
+
+        Runs at most every ``check_interval`` seconds; ``connect`` returns the
+        connection to read ``users`` with.
+        """
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return
+            self._checked_at = time.monotonic()
+            user_ids = sorted({key[0] for key in self._entries})
+        if not user_ids:
+            return
+        conn = connect()
+        if not conn:
+            return
+        cursor = conn.cursor()
+        current = session_versions(cursor, user_ids)
+        cursor.close()
+        with self._lock:
+            for key in [key for key in self._entries if current.get(key[0]) != key[1]]:
+                del self._entries[key]
+
+
+user_cache = UserCache()
+
+
+def session_token(user_id, session_version):
+    return f"{user_id}:{session_version or 0}"
+
+
+def parse_session_token(token):
+    """(user id, session version) from a session's user id; sessions from before versions count as 0."""
+    user_id, _, version = str(token).partition(':')
+    try:
+        return int(user_id), int(version or 0)
+    except ValueError:
+        return None
+
+
+def fetch_user_record(cursor, user_id):
+    cursor.execute('SELECT id, email, role, name, session_version FROM users WHERE id=%s', (user_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    if not isinstance(row, dict):
+        row = dict(zip(('id', 'email', 'role', 'name', 'session_version'), row))
+    return row
+
+
+def session_versions(cursor, user_ids):
+    """{user id: session version} for those of ``user_ids`` that still exist."""
+    versions = {}
+    for start in range(0, len(user_ids), USER_CHECK_BATCH):
+        batch = user_ids[start:start + USER_CHECK_BATCH]
+        placeholders = ','.join(['%s'] * len(batch))
+        cursor.execute(f'SELECT id, session_version FROM users WHERE id IN ({placeholders})', batch)
+        versions.update((user_id, version or 0) for user_id, version in cursor.fetchall())
+    return versions
+
+
+def forget_user(user_id):
+    """Drop a user's entries from this process's cache; call it after committing the change."""
+    user_cache.forget(int(user_id))
+
+
+def revoke_sessions(conn, user_id):
+    """Log a user out everywhere by bumping their session version; commits."""
+    cursor = conn.cursor()
+    cursor.execute('UPDATE users SET session_version = session_version + 1 WHERE id=%s', (user_id,))
+    conn.commit()
+    cursor.close()
+    forget_user(user_id)  # after the commit, so a concurrent miss cannot cache the old version
@@ -0,0 +1,300 @@
+"""Bulk user import from a CSV or XLSX file, run as a background job.
+
+The admin page saves the uploaded sheet under USER_IMPORT_DIR, records a
+``user_imports`` row and queues the ``import_users`` job; the page then
+polls ``/api/user-imports/<id>`` for progress. ``flask import-users`` runs
+the same import in the foreground.
+
+The sheet is read row by row (XLSX with the standard library, without
+loading the workbook) and handled in batches of IMPORT_BATCH_SIZE rows:
+rows are validated, emails already taken are found with one
+``SELECT ... WHERE email IN (...)`` per batch, passwords are hashed in a
+process pool (the hash is deliberately slow, so this is where the time
+goes; its processes are spawned, never forked from the threaded web
+process) and the new users are inserted with one ``executemany``. Each batch
+is committed with the import's counters, so a poll shows real progress and
+a failure keeps the users imported so far; importing the file again skips
+them as duplicates.
+"""
+import csv
+import json
+import multiprocessing
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from xml.etree.ElementTree import iterparse
+
+from werkzeug.security import generate_password_hash
+
+from jobs import enqueue, handler
+from passwords import PASSWORD_HASH_METHOD
+
+USER_IMPORT_DIR = os.environ.get('USER_IMPORT_DIR', os.path.join('uploads', 'imports'))
+USER_IMPORT_WORKERS = int(os.environ.get('USER_IMPORT_WORKERS', os.cpu_count() or 2))
+IMPORT_BATCH_SIZE = 200
+MAX_REPORTED_ERRORS = 200
+IMPORT_ROLES = ('student', 'faculty')
+REQUIRED_COLUMNS = ('email', 'name', 'password')
+
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+CELL_REF_RE = re.compile(r'^([A-Z]+)')
+SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+class UserImportError(ValueError):
+    """The file as a whole cannot be imported (unreadable, or a required column is missing)."""
+
+
+def _column_index(ref):
+    index = 0
+    for letter in CELL_REF_RE.match(ref).group(1):
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def _shared_strings(archive):
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings = []
+    with archive.open('xl/sharedStrings.xml') as f:
+        for _, element in iterparse(f):
+            if element.tag == SHEET_NS + 'si':
+                strings.append(''.join(t.text or '' for t in element.iter(SHEET_NS + 't')))
+                element.clear()
+    return strings
+
+
+def _xlsx_rows(path):
+    """Yield the rows of the first worksheet as lists of strings."""
+    with zipfile.ZipFile(path) as archive:
+        sheets = sorted(name for name in archive.namelist()
+                        if re.match(r'^xl/worksheets/sheet\d+\.xml$', name))
+        if not sheets:
+            raise UserImportError('The workbook has no worksheet')
+        strings = _shared_strings(archive)
+        first = min(sheets, key=lambda name: int(re.search(r'(\d+)\.xml$', name).group(1)))
+        with archive.open(first) as f:
+            for _, element in iterparse(f):
+                if element.tag != SHEET_NS + 'row':
+                    continue
+                values = {}
+                for cell in element.iter(SHEET_NS + 'c'):
+                    kind, value = cell.get('t'), cell.find(SHEET_NS + 'v')
+                    if kind == 's' and value is not None:
+                        text = strings[int(value.text)]
+                    elif kind == 'inlineStr':
+                        text = ''.join(t.text or '' for t in cell.iter(SHEET_NS + 't'))
+                    else:
+                        text = value.text if value is not None and value.text else ''
+                    values[_column_index(cell.get('r')) if cell.get('r') else len(values)] = text
+                element.clear()
+                yield [values.get(i, '') for i in range(max(values) + 1)] if values else []
+
+
+def _csv_rows(path):
+    with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+        yield from csv.reader(f)
+
+
+def read_rows(path, extension):
+    """Yield (row number, {column: value}) for the data rows; the first row names the columns."""
+    rows = _xlsx_rows(path) if extension == 'xlsx' else _csv_rows(path)
+    try:
+        header = [column.strip().lower() for column in next(rows)]
+    except StopIteration:
+        raise UserImportError('The file is empty')
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise UserImportError(f"Missing column(s): {', '.join(missing)}")
+    for number, row in enumerate(rows, start=2):
+        if any(value.strip() for value in row):
+            yield number, dict(zip(header, (value.strip() for value in row)))
+
+
+def validate_row(row, departments):
+    """Return (email, name, password, role, department) or raise ValueError with the reason."""
+    email = row.get('email', '').lower()
+    if not EMAIL_RE.match(email):
+        raise ValueError('invalid email')
+    if not row.get('name'):
+        raise ValueError('missing name')
+    if not row.get('password'):
+        raise ValueError('missing password')
+    role = (row.get('role') or 'student').lower()
+    if role not in IMPORT_ROLES:
+        raise ValueError(f"role must be one of {', '.join(IMPORT_ROLES)}")
+    department = row.get('department', '')
+    if department:
+        department = departments.get(department.lower())
+        if department is None:
+            raise ValueError('unknown department')
+    return email, row['name'][:255], row['password'], role, department or None
+
+
+def create_import(cursor, stream, filename, extension, created_by=None, queue=True):
+    """Save an uploaded sheet, record the import and queue its job; the caller commits. Returns its id."""
+    os.makedirs(USER_IMPORT_DIR, exist_ok=True)
+    path = os.path.join(USER_IMPORT_DIR, f"{int(time.time() * 1000)}-{os.getpid()}.{extension}")
+    with open(path, 'wb') as out:
+        while True:
+            chunk = stream.read(64 * 1024)
+            if not chunk:
+                break
+            out.write(chunk)
+    cursor.execute(
+        "INSERT INTO user_imports (filename, path, status, created_by) VALUES (%s, %s, 'queued', %s)",
+        (filename[:255], path, created_by)
+    )
+    import_id = cursor.lastrowid
+    if queue:
+        enqueue(cursor, 'import_users', {'import_id': import_id})
+    return import_id
+
+
+def _existing_emails(cursor, emails):
+    if not emails:
+        return set()
+    placeholders = ','.join(['%s'] * len(emails))
+    cursor.execute(f'SELECT email FROM users WHERE email IN ({placeholders})', list(emails))
+    return {row[0].lower() for row in cursor.fetchall()}
+
+
+def _save_progress(cursor, import_id, progress, status='running'):
+    progress['status'] = status
+    cursor.execute(
+        'UPDATE user_imports SET status=%s, total_rows=%s, processed_rows=%s, created_count=%s, '
+        'skipped_count=%s, errors=%s WHERE id=%s',
+        (status, progress['total'], progress['processed'], progress['created'], progress['skipped'],
+         json.dumps(progress['errors']), import_id)
+    )
+
+
+def _skip(progress, number, email, error):
+    progress['skipped'] += 1
+    if len(progress['errors']) < MAX_REPORTED_ERRORS:
+        progress['errors'].append({'row': number, 'email': email, 'error': error})
+
+
+def _import_batch(cursor, batch, departments, seen, progress, executor):
+    records = []
+    for number, row in batch:
+        try:
+            record = validate_row(row, departments)
+        except ValueError as e:
+            _skip(progress, number, row.get('email', ''), str(e))
+            continue
+        if record[0] in seen:
+            _skip(progress, number, record[0], 'duplicate email in the file')
+            continue
+        seen.add(record[0])
+        records.append((number, record))
+
+    taken = _existing_emails(cursor, [record[0] for _, record in records])
+    new = []
+    for number, record in records:
+        if record[0] in taken:
+            _skip(progress, number, record[0], 'already exists')
+        else:
+            new.append(record)
+
+    if new:
+        hashes = executor.map(partial(generate_password_hash, method=PASSWORD_HASH_METHOD),
+                              [record[2] for record in new],
+                              chunksize=max(1, len(new) // (4 * USER_IMPORT_WORKERS)))
+        # IGNORE: a user added by hand since the SELECT above is skipped, not an error for the batch
+        cursor.executemany(
+            'INSERT IGNORE INTO users (email, password_hash, role, name, department) VALUES (%s, %s, %s, %s, %s)',
+            [(email, pw_hash, role, name, department)
+             for (email, name, _, role, department), pw_hash in zip(new, hashes)]
+        )
+        progress['created'] += cursor.rowcount
+        progress['skipped'] += len(new) - cursor.rowcount
+    progress['processed'] += len(batch)
+
+
+def run_import(conn, import_id, departments, workers=USER_IMPORT_WORKERS, echo=None):
+    """Import the sheet of a ``user_imports`` row, committing after each batch; return the progress dict."""
+    cursor = conn.cursor()
+    cursor.execute('SELECT path FROM user_imports WHERE id=%s', (import_id,))
+    row = cursor.fetchone()
+    if row is None:
+        cursor.close()
+        return None
+    path = row[0]
+    extension = path.rsplit('.', 1)[-1]
+    progress = {'total': 0, 'processed': 0, 'created': 0, 'skipped': 0, 'errors': []}
+    try:
+        progress['total'] = sum(1 for _ in read_rows(path, extension))  # cheap next to hashing; drives the bar
+        _save_progress(cursor, import_id, progress)
+        conn.commit()
+        seen, batch = set(), []
+        # spawn, not fork: this runs on a job thread of a multi-threaded web process, and a forked
+        # child could inherit a lock (database pool, logging) another thread held at that moment
+        with ProcessPoolExecutor(max_workers=max(1, workers),
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            for item in read_rows(path, extension):
+                batch.append(item)
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    _import_batch(cursor, batch, departments, seen, progress, executor)
+                    _save_progress(cursor, import_id, progress)
+                    conn.commit()
+                    batch = []
+                    if echo:
+                        echo(f"  {progress['processed']}/{progress['total']} rows")
+            if batch:
+                _import_batch(cursor, batch, departments, seen, progress, executor)
+        _save_progress(cursor, import_id, progress, 'done')
+    except (UserImportError, zipfile.BadZipFile, csv.Error, SyntaxError, OSError) as e:
+        # SyntaxError covers malformed XML (ElementTree.ParseError)
+        conn.rollback()
+        progress['errors'].insert(0, {'row': None, 'email': '', 'error': str(e) or type(e).__name__})
+        _save_progress(cursor, import_id, progress, 'failed')
+    cursor.execute('UPDATE user_imports SET finished_at=%s WHERE id=%s', (int(time.time()), import_id))
+    conn.commit()
+    cursor.close()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    return progress
+
+
+def department_names(conn):
+    """Catalog department names by lower-case name, for ``validate_row``."""
+    cursor = conn.cursor()
+    cursor.execute('SELECT name FROM departments')
+    names = {row[0].lower(): row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return names
+
+
+@handler('import_users')
+def import_users(conn, payload):
+    run_import(conn, payload['import_id'], department_names(conn))
+
+
+def import_status(cursor, import_id):
+    """The progress of an import as a dict for the API, or None."""
+    cursor.execute(
+        'SELECT id, filename, status, total_rows, processed_rows, created_count, skipped_count, errors, '
+        'created_by, finished_at FROM user_imports WHERE id=%s', (import_id,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    (import_id, filename, status, total, processed, created, skipped, errors, created_by, finished_at) = row
+    return {
+        'id': import_id,
+        'filename': filename,
+        'status': status,
+        'total_rows': total,
+        'processed_rows': processed,
+        'created': created,
+        'skipped': skipped,
+        'errors': json.loads(errors) if errors else [],
+        'created_by': created_by,
+        'finished_at': finished_at,
+    }